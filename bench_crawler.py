@@ -0,0 +1,170 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import resource
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+from replay_server import ReplayServer
+
+
+def _serve(options, url_queue, stop_event):
+    """Run the replay server in its own process so it stays out of the crawler's numbers"""
+    with ReplayServer(**options) as server:
+        url_queue.put((server.url, len(server.pages)))
+        stop_event.wait()
+        url_queue.put(dict(server.stats))
+
+
+def _run_crawl(config, base_url, result_queue):
+    """Crawl the replay server end to end in a fresh process and report its cost"""
+    from main import WikiCrawler
+
+    work_dir = tempfile.mkdtemp(prefix='bench_crawler_')
+    log = io.StringIO()
+    try:
+        quiet = contextlib.nullcontext() if config['verbose'] else contextlib.redirect_stdout(log)
+        with quiet:
+            crawler = WikiCrawler(
+                output_dir=f"{work_dir}/out",
+                dataset_dir=f"{work_dir}/dataset",
+                base_url=base_url,
+                threads=config['threads'],
+                delay=config['delay'],
+                engine=config['engine'],
+                concurrency=config['concurrency'],
+                storage=config['storage'],
+                max_requests=config['max_requests'],
+                metrics_interval=3600
+            )
+            self_before = resource.getrusage(resource.RUSAGE_SELF)
+            children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+            start = time.perf_counter()
+            crawler.crawl()
+            elapsed = time.perf_counter() - start
+            self_after = resource.getrusage(resource.RUSAGE_SELF)
+            children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        cpu = sum(getattr(after, field) - getattr(before, field)
+                  for before, after in ((self_before, self_after), (children_before, children_after))
+                  for field in ('ru_utime', 'ru_stime'))
+        fetch = crawler.metrics.histograms.get('fetch')
+        stored = crawler.metrics.counter('pages_stored')
+        result_queue.put({
+            'pages': stored,
+            'failed': crawler.metrics.counter('pages_failed'),
+            'retries': crawler.metrics.counter('retries'),
+            'seconds': round(elapsed, 3),
+            'pages_per_second': round(stored / max(elapsed, 1e-9), 2),
+            'fetch_p50_ms': round(fetch.quantile(0.5) * 1000, 2) if fetch else None,
+            'fetch_p99_ms': round(fetch.quantile(0.99) * 1000, 2) if fetch else None,
+            'cpu_seconds': round(cpu, 3),
+            # ru_maxrss is in KB on Linux; parse worker processes report through RUSAGE_CHILDREN
+            'peak_rss_mb': round(self_after.ru_maxrss / 1024, 1),
+            'peak_child_rss_mb': round(children_after.ru_maxrss / 1024, 1),
+        })
+    except Exception as e:
+        result_queue.put({'error': str(e), 'log': log.getvalue()[-2000:]})
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_benchmark(config, server_options):
+    """Start a replay server and one crawl, each in its own process, and return the measurements"""
+    ctx = multiprocessing.get_context('spawn')
+    url_queue = ctx.Queue()
+    result_queue = ctx.Queue()
+    stop_event = ctx.Event()
+
+    server = ctx.Process(target=_serve, args=(server_options, url_queue, stop_event), daemon=True)
+    server.start()
+    base_url, corpus_size = url_queue.get(timeout=60)
+    try:
+        crawl = ctx.Process(target=_run_crawl, args=(config, base_url, result_queue))
+        crawl.start()
+        result = result_queue.get()
+        crawl.join()
+    finally:
+        stop_event.set()
+        server_stats = url_queue.get(timeout=60)
+        server.join()
+
+    result.update({'corpus_pages': corpus_size, 'server_responses': server_stats})
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark WikiCrawler end to end against a local replay server')
+    parser.add_argument('--engine', action='append', choices=['threads', 'async', 'pipeline'],
+                        help='Engine to benchmark; repeat to compare several (default: all three)')
+    parser.add_argument('--storage', choices=['files', 'shards'], default='files',
+                        help='Storage backend for the crawl (default: files)')
+    parser.add_argument('--threads', type=int, default=16, help='Crawler threads (default: 16)')
+    parser.add_argument('--concurrency', type=int, default=32, help='Async engine in-flight requests (default: 32)')
+    parser.add_argument('--delay', type=float, default=0.05,
+                        help='Crawler base delay, also the backoff floor, in seconds (default: 0.05)')
+    parser.add_argument('--max-requests', type=int, default=600000,
+                        help='Crawler rate limit in requests per minute; lower it to benchmark the limiter (default: 600000)')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per engine (default: 1)')
+    parser.add_argument('--pages', default='fixtures/pages', help='Fixture page directory (default: fixtures/pages)')
+    parser.add_argument('--copies', type=int, default=200,
+                        help='Serve each fixture under this many titles (default: 200)')
+    parser.add_argument('--latency', type=float, default=0.02, help='Server delay per page in seconds (default: 0.02)')
+    parser.add_argument('--jitter', type=float, default=0.01, help='Extra random server delay in seconds (default: 0.01)')
+    parser.add_argument('--error-429-rate', type=float, default=0.0, help='Fraction of pages answered 429 (default: 0)')
+    parser.add_argument('--error-5xx-rate', type=float, default=0.0, help='Fraction of pages answered 503 (default: 0)')
+    parser.add_argument('--slow-body-rate', type=float, default=0.0, help='Fraction of pages sent slowly (default: 0)')
+    parser.add_argument('--slow-body-seconds', type=float, default=1.0, help='Time taken to send a slow body (default: 1)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for injected faults (default: 0)')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--verbose', action='store_true', help='Show the crawler\'s own output')
+    args = parser.parse_args()
+
+    server_options = {
+        'pages_dir': args.pages,
+        'copies': args.copies,
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'error_429_rate': args.error_429_rate,
+        'error_5xx_rate': args.error_5xx_rate,
+        'slow_body_rate': args.slow_body_rate,
+        'slow_body_seconds': args.slow_body_seconds,
+        'seed': args.seed,
+    }
+
+    results = []
+    for engine in args.engine or ['threads', 'async', 'pipeline']:
+        for run in range(args.repeat):
+            config = {
+                'engine': engine,
+                'storage': args.storage,
+                'threads': args.threads,
+                'concurrency': args.concurrency,
+                'delay': args.delay,
+                'max_requests': args.max_requests,
+                'verbose': args.verbose,
+            }
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Running {engine} ({run + 1}/{args.repeat})...")
+            result = run_benchmark(config, server_options)
+            results.append({**config, 'run': run + 1, **result})
+            if 'error' in result:
+                print(f"  Error: {result['error']}")
+                continue
+            print(f"  {result['pages']}/{result['corpus_pages']} pages in {result['seconds']:.1f}s "
+                  f"= {result['pages_per_second']:.1f} pages/s | "
+                  f"fetch p50 {result['fetch_p50_ms']}ms p99 {result['fetch_p99_ms']}ms | "
+                  f"CPU {result['cpu_seconds']:.1f}s | peak RSS {result['peak_rss_mb']}MB "
+                  f"(children {result['peak_child_rss_mb']}MB) | "
+                  f"retries {result['retries']}, failed {result['failed']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'server': server_options, 'results': results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
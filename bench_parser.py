@@ -0,0 +1,189 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime
+
+import bs4
+from bs4 import BeautifulSoup
+
+import wiki_parser
+from wiki_parser import OSRSWikiParser, parse_wiki_page
+
+# One page per archetype: item with bonuses, monster with drop tables, quest,
+# skill-training guide, disambiguation, and a huge list page
+FIXTURE_DIRS = ('fixtures/pages', 'fixtures/large')
+
+BASELINE_FILE = 'fixtures/parser_baseline.json'
+
+
+def _soup_parser():
+    return OSRSWikiParser('html.parser')
+
+
+# Stage name -> fn(context) -> output; context holds the page's html, soup and parsed dict.
+# The OSRSWikiParser stages run on a prebuilt soup so each one is measured on its own.
+STAGES = {
+    'parse_wiki_page': lambda ctx: parse_wiki_page(ctx['html']),
+    'parse_wiki_page[html.parser]': lambda ctx: parse_wiki_page(ctx['html'], 'html.parser'),
+    'soup': lambda ctx: BeautifulSoup(ctx['html'], 'html.parser'),
+    'title': lambda ctx: _soup_parser()._get_title(ctx['soup']),
+    'infobox': lambda ctx: _soup_parser()._parse_infobox(ctx['soup']),
+    'description': lambda ctx: _soup_parser()._get_description(ctx['soup']),
+    'sections': lambda ctx: _soup_parser()._parse_sections(ctx['soup']),
+    'combat_stats': lambda ctx: _soup_parser()._parse_combat_stats(ctx['soup']),
+    'links': lambda ctx: _soup_parser()._get_links(ctx['soup']),
+    'to_markdown': lambda ctx: _soup_parser().to_markdown(ctx['parsed']),
+}
+if wiki_parser.etree is not None:
+    STAGES['parse_html[lxml]'] = lambda ctx: OSRSWikiParser('lxml').parse_html(ctx['html'])
+
+
+def output_size(output):
+    """Bytes of a stage's output once serialised"""
+    if isinstance(output, (dict, list)):
+        output = json.dumps(output, ensure_ascii=False)
+    return len(str(output).encode('utf-8'))
+
+
+def measure(fn, ctx, repeat=3):
+    """Best per-call time, peak traced allocation and output size of fn(ctx)"""
+    timer = timeit.Timer(lambda: fn(ctx))
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat, number)) / number
+
+    # A separate untimed call, since tracing slows allocation-heavy code several times over
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        output = fn(ctx)
+        peak = tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return {'seconds': seconds, 'peak_bytes': peak, 'output_bytes': output_size(output)}
+
+
+def load_fixtures(dirs=FIXTURE_DIRS):
+    """{name: html} for every fixture page"""
+    fixtures = {}
+    for directory in dirs:
+        for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+            with open(path, 'r', encoding='utf-8') as f:
+                fixtures[os.path.basename(path)[:-len('.html')]] = f.read()
+    return fixtures
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'beautifulsoup4': bs4.__version__,
+        'lxml': '.'.join(map(str, wiki_parser.etree.LXML_VERSION)) if wiki_parser.etree is not None else None,
+        'machine': platform.machine(),
+    }
+
+
+def run_benchmarks(fixtures, stages, repeat=3):
+    """{fixture/stage: measurement}"""
+    results = {}
+    for name, html in fixtures.items():
+        soup = BeautifulSoup(html, 'html.parser')
+        ctx = {'html': html, 'soup': soup, 'parsed': _soup_parser().parse_html(html)}
+        for stage in stages:
+            results[f"{name}/{stage}"] = measure(STAGES[stage], ctx, repeat)
+    return results
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    """[(key, problem)] for every measurement that regressed against the baseline"""
+    problems = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result['seconds'] > base['seconds'] * (1 + time_tolerance):
+            problems.append((key, f"time {base['seconds'] * 1000:.3f}ms -> {result['seconds'] * 1000:.3f}ms"))
+        if result['peak_bytes'] > base['peak_bytes'] * (1 + memory_tolerance):
+            problems.append((key, f"peak {base['peak_bytes'] / 1024:.1f}KB -> {result['peak_bytes'] / 1024:.1f}KB"))
+        if result['output_bytes'] != base['output_bytes']:
+            problems.append((key, f"output {base['output_bytes']} -> {result['output_bytes']} bytes"))
+    return problems
+
+
+def print_results(results, baseline):
+    current = None
+    for key, result in results.items():
+        name, stage = key.split('/', 1)
+        if name != current:
+            current = name
+            print(f"\n{name}")
+            print(f"  {'stage':<30} {'time':>11} {'vs base':>8} {'peak':>12} {'output':>12}")
+        base = baseline.get(key)
+        change = f"{result['seconds'] / base['seconds'] - 1:+.0%}" if base and base['seconds'] else ''
+        print(f"  {stage:<30} {result['seconds'] * 1000:>9.3f}ms {change:>8} "
+              f"{result['peak_bytes']:>12,} {result['output_bytes']:>12,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parse_wiki_page and each OSRSWikiParser stage over the fixture pages')
+    parser.add_argument('--fixtures', action='append',
+                        help=f"Fixture directory; repeatable (default: {', '.join(FIXTURE_DIRS)})")
+    parser.add_argument('--stage', action='append', choices=list(STAGES),
+                        help='Stage to benchmark; repeatable (default: all)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing runs per measurement; the best is kept (default: 3)')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help=f'Baseline file (default: {BASELINE_FILE})')
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline')
+    parser.add_argument('--time-tolerance', type=float, default=0.25,
+                        help='Flag stages slower than the baseline by more than this fraction (default: 0.25)')
+    parser.add_argument('--memory-tolerance', type=float, default=0.10,
+                        help='Flag stages allocating more than the baseline by more than this fraction (default: 0.10)')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r') as f:
+            stored = json.load(f)
+        baseline = stored['results']
+        if stored.get('environment') != environment():
+            print(f"Warning: baseline was recorded on {stored.get('environment')}, "
+                  f"timings are only comparable on the same setup")
+
+    fixtures = load_fixtures(args.fixtures or FIXTURE_DIRS)
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Benchmarking {len(fixtures)} fixtures...")
+    results = run_benchmarks(fixtures, args.stage or list(STAGES), args.repeat)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        # Measurements of fixtures or stages left out of this run keep their stored values
+        stored = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r') as f:
+                stored = json.load(f)['results']
+        tmp_file = args.baseline + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'environment': environment(), 'recorded_at': datetime.now().isoformat(timespec='seconds'),
+                       'results': {**stored, **results}}, f, indent=2, sort_keys=True)
+        os.replace(tmp_file, args.baseline)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+
+    problems = compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+    if problems:
+        print(f"\n{len(problems)} regressions against {args.baseline}:")
+        for key, problem in problems:
+            print(f"  {key}: {problem}")
+        sys.exit(1)
+    if baseline:
+        print(f"\nNo regressions against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from collections import Counter
+from datetime import datetime
+
+from storage import open_storage
+
+# Sections to_markdown builds from the page's own infobox and bonuses; never boilerplate
+PROTECTED_SECTIONS = ('item information', 'combat statistics')
+
+_HEADING_RE = re.compile(r'^(#{1,6}) ')
+
+
+def fingerprint(text):
+    """64-bit hash of a block's exact text, which is stored once per fingerprint"""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+
+def _hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def estimate_tokens(text):
+    """Rough LLM token count (about four characters per token for English prose)"""
+    return (len(text) + 3) // 4
+
+
+def _line_kind(line):
+    stripped = line.strip()
+    if not stripped:
+        return 'blank'
+    if _HEADING_RE.match(stripped):
+        return 'heading'
+    if stripped.startswith('|'):
+        return 'table'
+    if stripped.startswith(('* ', '- ')):
+        return 'list'
+    return 'paragraph'
+
+
+class Section:
+    """One section of a markdown page: its heading line and the content blocks under it
+
+    Blocks are (start, end) line ranges: a markdown table, a run of list items,
+    or a single paragraph line. The section itself spans heading to the line
+    before the next heading of the same or a higher level.
+    """
+
+    def __init__(self, level, title, start, end, blocks):
+        self.level = level
+        self.title = title
+        self.start = start
+        self.end = end
+        self.blocks = blocks
+
+
+def split_sections(lines):
+    """Split markdown lines into Sections, the first a level 1 lede holding what precedes the first h2"""
+    headings = [(0, 1, '')]
+    for i, line in enumerate(lines):
+        match = _HEADING_RE.match(line)
+        if match and len(match.group(1)) >= 2 and i > 0:
+            headings.append((i, len(match.group(1)), line[match.end():].strip()))
+
+    sections = []
+    for n, (start, level, title) in enumerate(headings):
+        end = len(lines)
+        for next_start, next_level, _ in headings[n + 1:]:
+            if next_level <= level:
+                end = next_start
+                break
+        # Trailing blank lines stay with the page, so a section reads the same wherever it sits
+        while end > start + 1 and not lines[end - 1].strip():
+            end -= 1
+        # Blocks stop at the first nested heading; the subsection holds its own
+        body_end = headings[n + 1][0] if n + 1 < len(headings) else len(lines)
+        blocks = []
+        i = start + 1
+        while i < body_end:
+            kind = _line_kind(lines[i])
+            j = i + 1
+            if kind in ('table', 'list'):
+                while j < body_end and _line_kind(lines[j]) == kind:
+                    j += 1
+            if kind != 'blank':
+                blocks.append((i, j))
+            i = j
+        sections.append(Section(level, title, start, end, blocks))
+    return sections
+
+
+def candidate_blocks(markdown, min_bytes=200):
+    """Yield (kind, start, end, text) for every section and block of a page that could be boilerplate"""
+    lines = markdown.split('\n')
+    protected_until = -1
+    for section in split_sections(lines):
+        # Subsections of a protected section (Attack bonuses under Combat statistics) are protected too
+        if section.start < protected_until:
+            continue
+        if section.title.lower() in PROTECTED_SECTIONS:
+            protected_until = section.end
+            continue
+        text = '\n'.join(lines[section.start:section.end])
+        # The lede holds the page title, so only its blocks can repeat
+        if section.level > 1 and len(text.encode('utf-8')) >= min_bytes:
+            yield 'section', section.start, section.end, text
+        for start, end in section.blocks:
+            text = '\n'.join(lines[start:end])
+            if len(text.encode('utf-8')) >= min_bytes:
+                yield 'block', start, end, text
+
+
+def strip_page(markdown, boilerplate, min_bytes=200):
+    """Remove boilerplate from a page
+
+    Returns (stripped markdown, [(line, fingerprint, text)]) with one entry per
+    removed range, in original line numbers, so restore_page can put them back.
+    A recurring section goes as a whole; otherwise recurring blocks go one by one.
+    """
+    lines = markdown.split('\n')
+    removed = []
+    covered_until = -1
+    for kind, start, end, text in candidate_blocks(markdown, min_bytes):
+        if start < covered_until:
+            continue  # Inside a section already removed
+        key = fingerprint(text)
+        if key in boilerplate:
+            removed.append((start, end, key, text))
+            covered_until = end
+
+    if not removed:
+        return markdown, []
+    drop = set()
+    for start, end, _, _ in removed:
+        drop.update(range(start, end))
+    kept = [line for i, line in enumerate(lines) if i not in drop]
+    return '\n'.join(kept), [(start, key, text) for start, _, key, text in removed]
+
+
+def restore_page(stripped, removed):
+    """Invert strip_page given its [(line, fingerprint, text)]"""
+    lines = stripped.split('\n')
+    for start, _, text in sorted(removed, key=lambda entry: entry[0]):
+        lines[start:start] = text.split('\n')
+    return '\n'.join(lines)
+
+
+class BoilerplateStore:
+    """Every stripped block stored once, and which pages it was stripped from and where"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS blocks (
+                fingerprint INTEGER PRIMARY KEY,
+                text TEXT NOT NULL,
+                pages INTEGER NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                page TEXT PRIMARY KEY,
+                stripped_hash TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS refs (
+                page TEXT NOT NULL,
+                line INTEGER NOT NULL,
+                fingerprint INTEGER NOT NULL,
+                PRIMARY KEY (page, line)
+            )
+        """)
+        self.conn.commit()
+
+    def add_blocks(self, blocks):
+        """Record {fingerprint: (text, pages)}"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO blocks (fingerprint, text, pages) VALUES (?, ?, ?) "
+                "ON CONFLICT(fingerprint) DO UPDATE SET pages = excluded.pages",
+                ((key, text, pages) for key, (text, pages) in blocks.items())
+            )
+
+    def add_refs(self, pages, refs):
+        """Record {page: stripped markdown hash} and [(page, line, fingerprint)] in one transaction"""
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO pages (page, stripped_hash) VALUES (?, ?)", pages.items())
+            self.conn.executemany("INSERT OR REPLACE INTO refs (page, line, fingerprint) VALUES (?, ?, ?)", refs)
+
+    def stripped_hash(self, page):
+        row = self.conn.execute("SELECT stripped_hash FROM pages WHERE page = ?", (page,)).fetchone()
+        return row[0] if row else None
+
+    def removed(self, page):
+        """[(line, fingerprint, text)] stripped from a page"""
+        return self.conn.execute(
+            "SELECT r.line, r.fingerprint, b.text FROM refs r JOIN blocks b USING (fingerprint) "
+            "WHERE r.page = ? ORDER BY r.line", (page,)
+        ).fetchall()
+
+    def stripped_pages(self):
+        return [page for page, in self.conn.execute("SELECT page FROM pages ORDER BY page")]
+
+    def forget(self, page):
+        with self.conn:
+            self.conn.execute("DELETE FROM pages WHERE page = ?", (page,))
+            self.conn.execute("DELETE FROM refs WHERE page = ?", (page,))
+
+    def top_blocks(self, limit=20):
+        """The stored blocks that saved the most bytes, as (pages, text)"""
+        return self.conn.execute(
+            "SELECT pages, text FROM blocks ORDER BY pages * length(text) DESC LIMIT ?", (limit,)
+        ).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+class BoilerplateDetector:
+    """Find sections and blocks repeated across many pages and strip them from the stored markdown
+
+    scan() makes one pass over the markdown counting how many pages each
+    fingerprint appears on; strip() makes a second pass rewriting each page
+    without the blocks seen on at least min_pages pages. Stripped text is kept
+    once in boilerplate.sqlite so restore() can rebuild the original pages.
+    """
+
+    def __init__(self, output_dir="wiki_pages", storage=None, min_pages=50, min_bytes=200):
+        self.output_dir = output_dir
+        self.storage = open_storage(output_dir, storage)
+        self.min_pages = min_pages
+        self.min_bytes = min_bytes
+        self.store = BoilerplateStore(os.path.join(output_dir, 'boilerplate.sqlite'))
+        self.counts = Counter()
+
+    def _pages(self):
+        """Yield (title, original markdown, previously removed) for every page, undoing an earlier strip in memory"""
+        for title, markdown in self.storage.iter_pages('markdown'):
+            removed = []
+            stripped_hash = self.store.stripped_hash(title)
+            if stripped_hash is not None:
+                # A page re-rendered since it was stripped has its full markdown again
+                if stripped_hash == _hash(markdown):
+                    removed = self.store.removed(title)
+                    markdown = restore_page(markdown, removed)
+            yield title, markdown, removed
+
+    def scan(self):
+        """Count pages per fingerprint and return the set seen on at least min_pages pages"""
+        start = time.time()
+        pages = 0
+        self.counts = Counter()
+        for _, markdown, _ in self._pages():
+            # A block repeated within one page still counts once
+            self.counts.update({fingerprint(text) for _, _, _, text in candidate_blocks(markdown, self.min_bytes)})
+            pages += 1
+        boilerplate = {key for key, count in self.counts.items() if count >= self.min_pages}
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Scanned {pages} pages in {time.time() - start:.1f}s: "
+              f"{len(self.counts)} distinct blocks, {len(boilerplate)} on {self.min_pages}+ pages")
+        return boilerplate
+
+    def strip(self, boilerplate=None, dry_run=False):
+        """Strip boilerplate from every page; returns (bytes_before, bytes_after, tokens_before, tokens_after)
+
+        Sizes are measured against the original markdown, so a repeated run
+        reports the total saving rather than the last increment.
+        """
+        if boilerplate is None:
+            boilerplate = self.scan()
+        start = time.time()
+        bytes_before = bytes_after = tokens_before = tokens_after = 0
+        pages = changed = 0
+        blocks, hashes, refs = {}, {}, []
+        for title, markdown, previous in self._pages():
+            stripped, removed = strip_page(markdown, boilerplate, self.min_bytes)
+            pages += 1
+            bytes_before += len(markdown.encode('utf-8'))
+            bytes_after += len(stripped.encode('utf-8'))
+            tokens_before += estimate_tokens(markdown)
+            tokens_after += estimate_tokens(stripped)
+            if dry_run or removed == [tuple(entry) for entry in previous]:
+                continue
+            changed += 1
+            self.store.forget(title)
+            for line, key, text in removed:
+                blocks[key] = (text, self.counts.get(key, 0))
+                refs.append((title, line, key))
+            if removed:
+                hashes[title] = _hash(stripped)
+            self.storage.write_page(title, {'markdown': stripped})
+            if len(hashes) >= 256:
+                self._commit(blocks, hashes, refs)
+                blocks, hashes, refs = {}, {}, []
+        if not dry_run:
+            self._commit(blocks, hashes, refs)
+
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {'Checked' if dry_run else f'Rewrote {changed} of'} "
+              f"{pages} pages in {time.time() - start:.1f}s: {bytes_before:,} -> {bytes_after:,} bytes "
+              f"(-{(bytes_before - bytes_after) / max(bytes_before, 1):.1%}), "
+              f"~{tokens_before / max(pages, 1):.0f} -> ~{tokens_after / max(pages, 1):.0f} prompt tokens per page")
+        return bytes_before, bytes_after, tokens_before, tokens_after
+
+    def _commit(self, blocks, hashes, refs):
+        # Markdown reaches the disk before its refs, like Reparser does with the parse cache
+        self.storage.flush()
+        self.store.add_blocks(blocks)
+        self.store.add_refs(hashes, refs)
+
+    def restore(self):
+        """Put the stripped blocks back into every page; returns the number of pages restored"""
+        restored = 0
+        for title in self.store.stripped_pages():
+            stripped = self.storage.read(title, 'markdown')
+            if stripped is not None and self.store.stripped_hash(title) == _hash(stripped):
+                self.storage.write_page(title, {'markdown': restore_page(stripped, self.store.removed(title))})
+                self.storage.flush()
+                restored += 1
+            self.store.forget(title)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Restored {restored} pages")
+        return restored
+
+    def close(self):
+        self.storage.close()
+        self.store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Strip sections and tables repeated across many pages from the stored markdown')
+    parser.add_argument('--output-dir', default='wiki_pages', help='Crawl output directory (default: wiki_pages)')
+    parser.add_argument('--storage', choices=['files', 'shards'],
+                        help='Storage backend of the crawl (default: detected)')
+    parser.add_argument('--min-pages', type=int, default=50,
+                        help='Strip blocks found on at least this many pages (default: 50)')
+    parser.add_argument('--min-bytes', type=int, default=200,
+                        help='Ignore blocks shorter than this, so short facts shared by chance stay (default: 200)')
+    parser.add_argument('--dry-run', action='store_true', help='Report the savings without rewriting any page')
+    parser.add_argument('--report', type=int, default=0, metavar='N',
+                        help='Print the N stored blocks that save the most bytes')
+    parser.add_argument('--restore', action='store_true', help='Put previously stripped blocks back')
+    args = parser.parse_args()
+
+    detector = BoilerplateDetector(
+        output_dir=args.output_dir,
+        storage=args.storage,
+        min_pages=args.min_pages,
+        min_bytes=args.min_bytes
+    )
+    try:
+        if args.restore:
+            detector.restore()
+        elif args.report:
+            for pages, text in detector.store.top_blocks(args.report):
+                print(f"--- {pages} pages, {len(text)} chars\n{text[:500]}")
+        else:
+            detector.strip(dry_run=args.dry_run)
+    finally:
+        detector.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import argparse
+
+from boilerplate import estimate_tokens, split_sections
+
+# Sections summarising the page itself, carried into every chunk instead of being chunked
+CONTEXT_SECTIONS = ('item information',)
+
+
+def _tokens(lines):
+    return sum(estimate_tokens(line) + 1 for line in lines)
+
+
+def _truncate(lines, max_tokens):
+    """(leading lines within max_tokens, whether any were cut); the first line is always kept"""
+    kept = []
+    tokens = 0
+    for line in lines:
+        tokens += estimate_tokens(line) + 1
+        if kept and tokens > max_tokens:
+            return kept, True
+        kept.append(line)
+    return kept, False
+
+
+def _paragraphs(lines):
+    """Split section lines before blank lines and ### headings, the places a section can be cut"""
+    paragraphs = []
+    current = []
+    for line in lines:
+        if current and (not line.strip() or line.startswith('### ')):
+            paragraphs.append(current)
+            current = []
+        if line.strip():
+            current.append(line)
+    if current:
+        paragraphs.append(current)
+    return paragraphs
+
+
+def _is_separator(line):
+    """Whether a line is the |---| row under a markdown table's header"""
+    return line.startswith('|') and set(line) <= set('|-: ')
+
+
+def _split_section(title, lines, budget):
+    """Cut an oversized section into pieces of about budget tokens, each after the first headed as continued
+
+    A paragraph too large for one piece is cut between its lines; a table cut
+    this way repeats its header and separator rows at the top of each piece.
+    """
+    heading, body = (lines[0], lines[1:]) if title else (None, lines)
+    pieces = []
+    current = [heading] if heading else []
+    filled = False  # Whether current holds more than its heading
+
+    def add(new_lines, gap):
+        nonlocal current, filled
+        current = current + ([''] if gap and current else []) + new_lines
+        filled = True
+
+    def next_piece():
+        nonlocal current, filled
+        pieces.append(current)
+        current = [f"## {title} (continued)"] if title else []
+        filled = False
+
+    for paragraph in _paragraphs(body):
+        if _tokens(paragraph) <= budget:
+            if filled and _tokens(current) + _tokens(paragraph) > budget:
+                next_piece()
+            add(paragraph, gap=True)
+            continue
+
+        # A paragraph over budget on its own goes out line by line, its lines kept together
+        gap = True
+        table_header = None
+        for i, line in enumerate(paragraph):
+            if filled and _tokens(current) + _tokens([line]) > budget and not _is_separator(line):
+                next_piece()
+                gap = True
+                if table_header and line.startswith('|'):
+                    add(table_header, gap=True)
+                    gap = False
+            add([line], gap)
+            gap = False
+            if line.startswith('|') and i + 1 < len(paragraph) and _is_separator(paragraph[i + 1]):
+                table_header = [line, paragraph[i + 1]]
+            elif not line.startswith('|'):
+                table_header = None
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_markdown(markdown, max_tokens=1536, context_tokens=256):
+    """Split a page from OSRSWikiParser.to_markdown into chunks of about max_tokens along its ## sections
+
+    Each chunk starts with the page title, the start of the description and
+    the infobox summary (together about context_tokens) so it reads on its own;
+    whole sections are packed into chunks in page order, and a section too
+    large for one chunk is cut at its ### subsections or paragraphs. A page
+    within max_tokens comes back as the only chunk.
+    """
+    if estimate_tokens(markdown) <= max_tokens:
+        return [markdown]
+
+    lines = markdown.split('\n')
+    sections = [section for section in split_sections(lines) if section.level <= 2]
+    # The lede section nests the whole page; only what precedes the first ## is its own
+    lede = lines[:sections[1].start] if len(sections) > 1 else lines
+    while len(lede) > 1 and not lede[-1].strip():
+        lede = lede[:-1]
+
+    preamble, cut = _truncate(lede, context_tokens // 2)
+    blocks = [('', lede[len(preamble):])] if cut else []
+    for section in sections[1:]:
+        section_lines = lines[section.start:section.end]
+        if section.title.lower() in CONTEXT_SECTIONS:
+            kept, cut = _truncate(section_lines, context_tokens // 2)
+            preamble += [''] + kept
+            if cut:
+                blocks.append((section.title, section_lines))
+            continue
+        blocks.append((section.title, section_lines))
+
+    budget = max(max_tokens - _tokens(preamble), max_tokens // 2)
+    chunks = []
+    current = []
+    for title, block in blocks:
+        if _tokens(block) > budget:
+            if current:
+                chunks.append(current)
+                current = []
+            chunks.extend(_split_section(title, block, budget))
+            continue
+        if current and _tokens(current) + _tokens(block) > budget:
+            chunks.append(current)
+            current = []
+        current = current + ([''] if current else []) + block
+    if current:
+        chunks.append(current)
+
+    return ['\n'.join(preamble + [''] + chunk) for chunk in chunks] or [markdown]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show how a markdown page is chunked for Q&A generation')
+    parser.add_argument('path', help='Markdown file')
+    parser.add_argument('--max-tokens', type=int, default=1536, help='Tokens per chunk (default: 1536)')
+    parser.add_argument('--context-tokens', type=int, default=256,
+                        help='Tokens of title, description and infobox repeated in every chunk (default: 256)')
+    parser.add_argument('--show', action='store_true', help='Print each chunk')
+    args = parser.parse_args()
+
+    with open(args.path, 'r', encoding='utf-8') as f:
+        markdown = f.read()
+    chunks = chunk_markdown(markdown, args.max_tokens, args.context_tokens)
+    print(f"{args.path}: {estimate_tokens(markdown)} tokens in {len(chunks)} chunks")
+    for number, chunk in enumerate(chunks, 1):
+        headings = [line[3:] for line in chunk.split('\n') if line.startswith('## ')]
+        print(f"  {number}: {estimate_tokens(chunk)} tokens, {', '.join(headings)}")
+        if args.show:
+            print(chunk)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+from concurrent.futures import FIRST_COMPLETED, wait
+
+# Pages larger than this (in characters) are rendered by the streaming converter,
+# which never builds a tree: a parse worker holds the page, its div#content HTML
+# and its markdown, about three times the page size, instead of a tree many times larger
+STREAMING_THRESHOLD = 2 * 1024 * 1024
+
+
+def bounded_map(executor, fn, batches, window):
+    """executor.map over a generator, with at most window batches in flight, yielding results as they finish"""
+    pending = set()
+    for batch in batches:
+        pending.add(executor.submit(fn, batch))
+        if len(pending) >= window:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield future.result()
+    for future in pending:
+        yield future.result()
@@ -0,0 +1,193 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# Manifest fields kept per URL next to its status: sitemap lastmod, HTTP validators and content hash
+VALIDATOR_FIELDS = ('lastmod', 'etag', 'last_modified', 'content_hash')
+
+_HAS_VALIDATORS = ' OR '.join(f"{field} IS NOT NULL" for field in VALIDATOR_FIELDS)
+
+
+class CrawlStateStore:
+    """Per-URL crawl status and validators in a SQLite WAL table, written by a background thread"""
+
+    def __init__(self, path, flush_interval=1.0, batch_size=500):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                error_count INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        # Stores created before the validators moved here lack their columns
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(pages)")}
+        for field in VALIDATOR_FIELDS:
+            if field not in columns:
+                conn.execute(f"ALTER TABLE pages ADD COLUMN {field} TEXT")
+        conn.commit()
+        conn.close()
+
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        """Open a connection in WAL mode so readers never block the writer"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def load_done(self):
+        """Return the set of URLs that finished successfully"""
+        conn = self._connect()
+        try:
+            return {url for (url,) in conn.execute("SELECT url FROM pages WHERE status = 'done'")}
+        finally:
+            conn.close()
+
+    def load_error_counts(self):
+        """Return error counts for URLs that have failed at least once"""
+        conn = self._connect()
+        try:
+            return dict(conn.execute("SELECT url, error_count FROM pages WHERE error_count > 0"))
+        finally:
+            conn.close()
+
+    def load_validators(self):
+        """Return {url: {field: value}} for every URL with a stored validator"""
+        conn = self._connect()
+        try:
+            fields = ', '.join(VALIDATOR_FIELDS)
+            rows = conn.execute(f"SELECT url, {fields} FROM pages WHERE {_HAS_VALIDATORS}")
+            return {row[0]: {field: value for field, value in zip(VALIDATOR_FIELDS, row[1:]) if value is not None}
+                    for row in rows}
+        finally:
+            conn.close()
+
+    def import_visited_json(self, visited_file):
+        """One-off migration of a legacy visited_pages.json into the store"""
+        if not os.path.exists(visited_file):
+            return 0
+        conn = self._connect()
+        try:
+            if conn.execute("SELECT 1 FROM pages LIMIT 1").fetchone():
+                return 0
+            with open(visited_file, 'r') as f:
+                urls = json.load(f)
+            now = time.time()
+            conn.executemany(
+                "INSERT OR IGNORE INTO pages (url, status, updated_at) VALUES (?, 'done', ?)",
+                ((url, now) for url in urls)
+            )
+            conn.commit()
+            return len(urls)
+        finally:
+            conn.close()
+
+    def import_manifest_json(self, manifest_file):
+        """One-off migration of a legacy manifest.json into the validator columns"""
+        if not os.path.exists(manifest_file):
+            return 0
+        conn = self._connect()
+        try:
+            if conn.execute(f"SELECT 1 FROM pages WHERE {_HAS_VALIDATORS} LIMIT 1").fetchone():
+                return 0
+            with open(manifest_file, 'r') as f:
+                entries = json.load(f)
+            now = time.time()
+            with conn:
+                conn.executemany(self._validators_sql(), (
+                    (url, now, *(entry.get(field) for field in VALIDATOR_FIELDS)) for url, entry in entries.items()
+                ))
+            return len(entries)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _validators_sql():
+        """Upsert of a URL's validators; values left NULL keep what is stored"""
+        return f"""
+            INSERT INTO pages (url, status, updated_at, {', '.join(VALIDATOR_FIELDS)})
+            VALUES (?, 'pending', ?, {', '.join('?' for _ in VALIDATOR_FIELDS)})
+            ON CONFLICT(url) DO UPDATE SET
+                {', '.join(f"{field} = COALESCE(excluded.{field}, {field})" for field in VALIDATOR_FIELDS)}
+        """
+
+    def mark_done(self, url):
+        """Queue a URL as successfully crawled"""
+        self._queue.put(('done', url, None, time.time()))
+
+    def mark_failed(self, url, error):
+        """Queue a failed attempt for a URL"""
+        self._queue.put(('failed', url, str(error), time.time()))
+
+    def update_validators(self, url, fields):
+        """Queue new manifest fields (see VALIDATOR_FIELDS) for a URL"""
+        self._queue.put(('validators', url, fields, time.time()))
+
+    def _write_loop(self):
+        """Drain queued status updates into SQLite in small transactions"""
+        conn = self._connect()
+        running = True
+        while running:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch.append(item)
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # None is the shutdown sentinel from close()
+            running = not any(item is None for item in batch)
+            updates = [item for item in batch if item is not None]
+            done = [(url, ts) for status, url, _, ts in updates if status == 'done']
+            failed = [(url, err, ts) for status, url, err, ts in updates if status == 'failed']
+            validators = [(url, ts, *(fields.get(field) for field in VALIDATOR_FIELDS))
+                          for status, url, fields, ts in updates if status == 'validators']
+            try:
+                with conn:
+                    conn.executemany("""
+                        INSERT INTO pages (url, status, updated_at) VALUES (?, 'done', ?)
+                        ON CONFLICT(url) DO UPDATE SET status = 'done', updated_at = excluded.updated_at
+                    """, done)
+                    conn.executemany("""
+                        INSERT INTO pages (url, status, error_count, last_error, updated_at)
+                        VALUES (?, 'failed', 1, ?, ?)
+                        ON CONFLICT(url) DO UPDATE SET
+                            status = CASE WHEN status = 'done' THEN 'done' ELSE 'failed' END,
+                            error_count = error_count + 1,
+                            last_error = excluded.last_error,
+                            updated_at = excluded.updated_at
+                    """, failed)
+                    conn.executemany(self._validators_sql(), validators)
+            except Exception as e:
+                print(f"Error writing crawl state: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        conn.close()
+
+    def flush(self):
+        """Block until every queued update is committed"""
+        self._queue.join()
+
+    def close(self):
+        """Flush pending updates and stop the writer thread"""
+        self._queue.put(None)
+        self._writer.join()
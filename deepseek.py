@@ -4,7 +4,9 @@ import os
 
 
 class DeepSeek:
-    def __init__(self):
+    def __init__(self, cache=None, variant=''):
+        self.cache = cache  # Optional LLMCache answering prompts seen before
+        self.variant = variant
         self.client = OpenAI(
             api_key=os.environ.get("DEEPSEEK_API"),
             base_url="https://api.deepseek.com",
@@ -34,17 +36,21 @@ class DeepSeek:
         
 
     def generate_qa_pairs(self, content, num_questions):
-        messages = [{"role": "system", "content": self.system_prompt.format(n_qs=num_questions, content=content)}]
-
-        response = self.client.chat.completions.create(
-            model="deepseek-chat",
-            messages=messages,
-            response_format={
-                'type': 'json_object'
-            }
-        )
-
-        return json.loads(response.choices[0].message.content)
+        prompt = self.system_prompt.format(n_qs=num_questions, content=content)
+
+        def request():
+            response = self.client.chat.completions.create(
+                model="deepseek-chat",
+                messages=[{"role": "system", "content": prompt}],
+                response_format={
+                    'type': 'json_object'
+                }
+            )
+            return response.choices[0].message.content
+
+        if self.cache:
+            return json.loads(self.cache.cached('deepseek', 'deepseek-chat', prompt, request, variant=self.variant))
+        return json.loads(request())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,301 @@
+import argparse
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import pyarrow  # pandas' Parquet engine
+    import pyarrow.dataset
+except ImportError:
+    pyarrow = None
+
+from corpus_util import bounded_map
+from storage import open_storage
+from wiki_parser import OSRSWikiParser
+from wikitext_parser import WikitextParser
+
+# Combat bonus columns, named <section>_<stat> except for the "other" bonuses
+BONUS_COLUMNS = {
+    ('attack_bonuses', 'stab'): 'attack_stab',
+    ('attack_bonuses', 'slash'): 'attack_slash',
+    ('attack_bonuses', 'crush'): 'attack_crush',
+    ('attack_bonuses', 'magic'): 'attack_magic',
+    ('attack_bonuses', 'ranged'): 'attack_ranged',
+    ('defence_bonuses', 'stab'): 'defence_stab',
+    ('defence_bonuses', 'slash'): 'defence_slash',
+    ('defence_bonuses', 'crush'): 'defence_crush',
+    ('defence_bonuses', 'magic'): 'defence_magic',
+    ('defence_bonuses', 'ranged'): 'defence_ranged',
+    ('other_bonuses', 'strength'): 'strength',
+    ('other_bonuses', 'ranged_strength'): 'ranged_strength',
+    ('other_bonuses', 'magic_damage'): 'magic_damage',
+    ('other_bonuses', 'prayer'): 'prayer',
+}
+
+# Magic damage is a percentage and may be fractional; every other bonus is a whole number
+FLOAT_BONUSES = {'magic_damage'}
+
+PAGE_COLUMNS = ['title', 'kind', 'page_type']
+
+# One "column op value" term of a --query, the only form pushed down to the Parquet reader
+_COMPARISON_RE = re.compile(r'^\s*([A-Za-z_]\w*)\s*(==|!=|<=|>=|<|>)\s*'
+                            r'(?:([+-]?\d+(?:\.\d+)?)|"([^"]*)"|\'([^\']*)\')\s*$')
+
+# Numbers as the wiki prints them: "+82", "-3", "5%", "120,001 coins", "0.453 kg"
+_NUMBER_RE = re.compile(r'^([+-]?\d[\d,]*(?:\.\d+)?)\s*(?:%|coins|kg)?$')
+
+
+def parse_number(value):
+    """Parse a wiki-formatted number, or return None"""
+    if not isinstance(value, str):
+        return None
+    match = _NUMBER_RE.match(value.replace('\xa0', ' ').strip())
+    if not match:
+        return None
+    return float(match.group(1).replace(',', ''))
+
+
+def normalise_key(key):
+    """Infobox label -> column name, e.g. "High alch" -> high_alch"""
+    return re.sub(r'[^0-9a-z]+', '_', key.lower()).strip('_')
+
+
+def classify_page(infobox, combat_stats):
+    """Rough page type from which infobox fields are present; used as the partition column"""
+    if combat_stats:
+        return 'equipment'
+    if 'combat_level' in infobox or 'hitpoints' in infobox:
+        return 'monster'
+    if {'number', 'series', 'quest_number', 'quest_series'} & infobox.keys():
+        return 'quest'
+    if {'tradeable', 'examine', 'value'} & infobox.keys():
+        return 'item'
+    return 'other'
+
+
+def page_record(title, kind, parsed):
+    """Flatten one parsed page into a row of strings and raw bonus values"""
+    infobox = {}
+    for key, value in parsed['infobox'].items():
+        column = normalise_key(key)
+        if not column or column in infobox:
+            continue
+        # Image cells come back as lists of srcs
+        infobox[column] = ' '.join(value) if isinstance(value, list) else value
+
+    record = {'title': title, 'kind': kind, 'page_type': classify_page(infobox, parsed['combat_stats'])}
+    for (section, stat), column in BONUS_COLUMNS.items():
+        record[column] = parsed['combat_stats'].get(section, {}).get(stat)
+    for column, value in infobox.items():
+        # Keep infobox fields from shadowing the page and bonus columns
+        if column in record:
+            column = f"infobox_{column}"
+        record[column] = value
+    return record
+
+
+def extract_batch(batch):
+    """Parse a batch of (title, kind, source) into records in a worker process"""
+    html_parser = OSRSWikiParser()
+    wikitext_parser = WikitextParser()
+    records = []
+    errors = []
+    for title, kind, source in batch:
+        try:
+            if kind == 'wikitext':
+                parsed = wikitext_parser.parse(title.replace('_', ' '), source)
+            else:
+                parsed = html_parser.parse_html(source)
+            records.append(page_record(title, kind, parsed))
+        except Exception as e:
+            errors.append((title, str(e)))
+    return records, errors
+
+
+def build_frame(records):
+    """Typed DataFrame from page records: numeric bonuses, and numeric infobox columns where every value is a number"""
+    frame = pd.DataFrame.from_records(records, columns=None if records else PAGE_COLUMNS)
+    for column in BONUS_COLUMNS.values():
+        numbers = frame.get(column, pd.Series(None, index=frame.index, dtype=object)).map(parse_number)
+        numbers = numbers.astype('Float64')
+        frame[column] = numbers if column in FLOAT_BONUSES else numbers.round().astype('Int64')
+
+    bonus_columns = set(BONUS_COLUMNS.values())
+    for column in frame.columns:
+        if column in bonus_columns:
+            continue
+        values = frame[column]
+        present = values.dropna()
+        numbers = present.map(parse_number)
+        if column not in PAGE_COLUMNS and len(present) and numbers.notna().all():
+            numbers = values.map(parse_number).astype('Float64')
+            integral = (numbers.dropna() % 1 == 0).all()
+            frame[column] = numbers.astype('Int64') if integral else numbers
+        else:
+            frame[column] = values.astype('string')
+
+    ordered = PAGE_COLUMNS + list(BONUS_COLUMNS.values())
+    return frame[ordered + sorted(c for c in frame.columns if c not in ordered)]
+
+
+def require_pyarrow():
+    if pyarrow is None:
+        raise ImportError("Parquet export needs pyarrow; install it with pip install 'osrs-wiki-crawl[parquet]'")
+
+
+def swap_symlink(path, target):
+    """Point the symlink at path to target in one atomic rename and delete the version it replaced"""
+    previous = os.path.realpath(path) if os.path.islink(path) else None
+    if os.path.isdir(path) and not os.path.islink(path):
+        # An export written before versioned directories: move it aside once
+        previous = path + '.legacy'
+        os.replace(path, previous)
+    link = path + '.link.tmp'
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(target), link)  # Relative, so the dataset directory can be moved
+    os.replace(link, path)
+    if previous and previous != os.path.realpath(target):
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+def write_dataset(frame, path, partition_cols=('page_type',)):
+    """Write frame as a partitioned Parquet dataset and switch path over to it atomically
+
+    Each export goes to its own version directory beside path, and path is a
+    symlink swapped to the new version with one rename, so readers always
+    find either the previous export or the new one, complete.
+    """
+    require_pyarrow()
+    path = path.rstrip('/')
+    version = f"{path}.{time.time_ns()}"
+    frame.to_parquet(version, engine='pyarrow', partition_cols=list(partition_cols), index=False)
+    swap_symlink(path, version)
+
+
+def read_dataset(path, columns=None, filters=None):
+    """Load an export, e.g. read_dataset(path, filters=[('attack_slash', '>', 80)])"""
+    return pd.read_parquet(path, engine='pyarrow', columns=columns, filters=filters)
+
+
+def dataset_info(path):
+    """(column names, row count) of an export, from the Parquet footers alone"""
+    require_pyarrow()
+    dataset = pyarrow.dataset.dataset(path, format='parquet', partitioning='hive')
+    return dataset.schema.names, dataset.count_rows()
+
+
+def query_filters(query):
+    """Reader filters for a query of comparisons joined by "and", e.g. "attack_slash > 80 and page_type == 'equipment'"
+
+    Returns None when any part is not a plain comparison; the caller then
+    filters after reading.
+    """
+    filters = []
+    for term in re.split(r'\s+and\s+|\s*&\s*', query.strip()):
+        match = _COMPARISON_RE.match(term)
+        if not match:
+            return None
+        column, op, number, double_quoted, single_quoted = match.groups()
+        if number is not None:
+            value = float(number) if '.' in number else int(number)
+        else:
+            value = double_quoted if double_quoted is not None else single_quoted
+        filters.append((column, '=' if op == '==' else op, value))
+    return filters
+
+
+def query_dataset(path, query):
+    """Rows of an export matching a DataFrame.query expression, with the columns it names
+
+    Only the title, page type and referenced columns are read, and a query of
+    plain comparisons is pushed down to the reader, which skips partitions and
+    row groups that cannot match.
+    """
+    names, rows = dataset_info(path)
+    referenced = [c for c in names if c not in ('title', 'page_type') and re.search(rf'\b{re.escape(c)}\b', query)]
+    frame = read_dataset(path, columns=['title', 'page_type'] + referenced, filters=query_filters(query))
+    # The reader's filters are exact for plain comparisons; query() also covers everything else
+    return frame.query(query), rows
+
+
+class ParquetExporter:
+    """Parse every stored page across a process pool and write one typed row per page"""
+
+    def __init__(self, output_dir="wiki_pages", storage=None, workers=None, batch_size=64,
+                 kinds=('html', 'wikitext')):
+        self.output_dir = output_dir
+        self.storage = open_storage(output_dir, storage)
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.kinds = kinds
+
+    def _batches(self):
+        batch = []
+        for kind in self.kinds:
+            for title, source in self.storage.iter_pages(kind):
+                batch.append((title, kind, source))
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def collect(self):
+        """Parse the corpus and return its typed DataFrame"""
+        records = []
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            for batch_records, errors in bounded_map(executor, extract_batch, self._batches(), self.workers * 2):
+                records.extend(batch_records)
+                for title, error in errors:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Error parsing {title}: {error}")
+        self.storage.close()
+        return build_frame(records)
+
+    def export(self, path):
+        """Write the corpus to a Parquet dataset at path and return the DataFrame"""
+        require_pyarrow()  # Before parsing the whole corpus, not after
+        start = time.time()
+        frame = self.collect()
+        write_dataset(frame, path)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Exported {len(frame)} pages with {len(frame.columns)} "
+              f"columns to {path} in {time.time() - start:.1f}s")
+        return frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export infobox and combat bonus data to partitioned Parquet')
+    parser.add_argument('--output-dir', default='wiki_pages', help='Crawl output directory (default: wiki_pages)')
+    parser.add_argument('--storage', choices=['files', 'shards'],
+                        help='Storage backend of the crawl (default: detected)')
+    parser.add_argument('--dataset', default='dataset/pages.parquet',
+                        help='Parquet dataset directory to write or query (default: dataset/pages.parquet)')
+    parser.add_argument('--workers', type=int, help='Parse processes (default: one per CPU)')
+    parser.add_argument('--batch-size', type=int, default=64, help='Pages per worker task (default: 64)')
+    parser.add_argument('--query',
+                        help='Query an existing export instead of writing one, e.g. "attack_slash > 80"')
+    args = parser.parse_args()
+
+    if args.query:
+        start = time.perf_counter()
+        matches, rows = query_dataset(args.dataset, args.query)
+        elapsed = time.perf_counter() - start
+        print(matches.to_string(index=False))
+        print(f"{len(matches)} of {rows} pages in {elapsed * 1000:.1f}ms")
+        return
+
+    exporter = ParquetExporter(
+        output_dir=args.output_dir,
+        storage=args.storage,
+        workers=args.workers,
+        batch_size=args.batch_size
+    )
+    exporter.export(args.dataset)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import argparse
+import csv
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+STATES = ('pending', 'in_flight', 'done', 'failed', 'skipped')
+
+
+def default_owner():
+    """Lease owner id of this process"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobLedger:
+    """Per-document generation state in a SQLite WAL table, committed together with the output CSV
+
+    Each document is pending, in_flight (leased to one worker until the lease
+    expires), done, failed or skipped. The ledger also records how many bytes
+    of the CSV belong to committed documents. A commit appends a document's
+    rows and marks it done inside one write transaction, and any tail past the
+    committed offset (rows of a crash between the two) is truncated before
+    the next append, so every document reaches the CSV exactly once however
+    often a run is interrupted or how many runs share the output.
+    """
+
+    def __init__(self, path, output_file, lease_seconds=600, max_attempts=3):
+        self.path = path
+        self.output_file = str(output_file)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                name TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                lease_expires REAL,
+                pairs INTEGER,
+                error TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._recover(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _conn(self):
+        """This thread's connection, reopened after a fork; transactions are explicit"""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            local.conn.execute("PRAGMA journal_mode=WAL")
+            local.conn.execute("PRAGMA synchronous=NORMAL")
+            local.pid = os.getpid()
+        return local.conn
+
+    def _offset(self, conn):
+        row = conn.execute("SELECT value FROM meta WHERE key = 'csv_offset'").fetchone()
+        return row[0] if row else None
+
+    def _set_offset(self, conn, offset):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('csv_offset', ?)", (offset,))
+
+    def _recover(self, conn):
+        """Bring the CSV back to its committed length; call holding the write lock"""
+        size = os.path.getsize(self.output_file) if os.path.exists(self.output_file) else 0
+        offset = self._offset(conn)
+        if offset is None:
+            # First run over this output: rows already in the CSV are taken as committed
+            self._set_offset(conn, size)
+        elif size > offset:
+            print(f"Truncating {size - offset} uncommitted bytes from {self.output_file}")
+            os.truncate(self.output_file, offset)
+        elif size < offset:
+            print(f"{self.output_file} is shorter than the ledger records, queueing every document again")
+            conn.execute("UPDATE jobs SET state = 'pending', attempts = 0, owner = NULL, lease_expires = NULL, "
+                         "pairs = NULL, error = NULL WHERE state IN ('done', 'in_flight')")
+            self._set_offset(conn, size)
+
+    def add(self, names):
+        """Register documents as pending; ones already known keep their state"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN")
+        conn.executemany("INSERT OR IGNORE INTO jobs (name, state, updated_at) VALUES (?, 'pending', ?)",
+                         ((name, now) for name in names))
+        conn.execute("COMMIT")
+
+    def finished(self):
+        """Names no run needs to take again: done, skipped, or failed max_attempts times"""
+        conn = self._conn()
+        rows = conn.execute("SELECT name FROM jobs WHERE state IN ('done', 'skipped') "
+                            "OR (state = 'failed' AND attempts >= ?)", (self.max_attempts,))
+        return {name for (name,) in rows}
+
+    def claim(self, name, owner):
+        """Lease a document to owner; False if it is finished or leased to someone else"""
+        now = time.time()
+        conn = self._conn()
+        cursor = conn.execute(
+            "UPDATE jobs SET state = 'in_flight', attempts = attempts + 1, owner = ?, lease_expires = ?, "
+            "updated_at = ? WHERE name = ? AND (state = 'pending' OR (state = 'failed' AND attempts < ?) "
+            "OR (state = 'in_flight' AND lease_expires < ?))",
+            (owner, now + self.lease_seconds, now, name, self.max_attempts, now)
+        )
+        return cursor.rowcount == 1
+
+    def commit(self, name, rows):
+        """Append a document's CSV rows and mark it done atomically; False if another run already did"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            state = conn.execute("SELECT state FROM jobs WHERE name = ?", (name,)).fetchone()
+            if state is not None and state[0] == 'done':
+                conn.execute("COMMIT")
+                return False
+            self._recover(conn)
+            with open(self.output_file, 'a', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerows(rows)
+                f.flush()
+                os.fsync(f.fileno())
+                offset = f.tell()
+            conn.execute("UPDATE jobs SET state = 'done', owner = NULL, lease_expires = NULL, pairs = ?, "
+                         "error = NULL, updated_at = ? WHERE name = ?", (len(rows), time.time(), name))
+            self._set_offset(conn, offset)
+            conn.execute("COMMIT")
+            return True
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _finish(self, name, state, error):
+        self._conn().execute(
+            "UPDATE jobs SET state = ?, owner = NULL, lease_expires = NULL, error = ?, updated_at = ? "
+            "WHERE name = ? AND state != 'done'", (state, error, time.time(), name)
+        )
+
+    def skip(self, name, reason=None):
+        self._finish(name, 'skipped', reason)
+
+    def fail(self, name, error=None):
+        """Mark a document failed; it is retried until it has been attempted max_attempts times"""
+        self._finish(name, 'failed', error)
+
+    def release(self, owner=None):
+        """Return in-flight documents (of one owner, or all) to pending; returns how many"""
+        conn = self._conn()
+        query = "UPDATE jobs SET state = 'pending', attempts = MAX(attempts - 1, 0), owner = NULL, " \
+                "lease_expires = NULL WHERE state = 'in_flight'"
+        if owner:
+            return conn.execute(query + " AND owner = ?", (owner,)).rowcount
+        return conn.execute(query).rowcount
+
+    def retry_failed(self):
+        """Give every failed document a fresh set of attempts; returns how many"""
+        return self._conn().execute(
+            "UPDATE jobs SET state = 'pending', attempts = 0 WHERE state = 'failed'"
+        ).rowcount
+
+    def counts(self):
+        """{state: documents}"""
+        counts = dict.fromkeys(STATES, 0)
+        counts.update(self._conn().execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+        return counts
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local = threading.local()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or reset the job ledger of a QA generation run')
+    parser.add_argument('--output-dir', default='qa_dataset', help='Output directory of the run (default: qa_dataset)')
+    parser.add_argument('--release', action='store_true',
+                        help='Return in-flight documents to pending, e.g. after a crashed run')
+    parser.add_argument('--retry-failed', action='store_true', help='Queue failed documents again')
+    parser.add_argument('--failed', action='store_true', help='List failed documents and their errors')
+    args = parser.parse_args()
+
+    ledger = JobLedger(os.path.join(args.output_dir, 'jobs.sqlite'), os.path.join(args.output_dir, 'qa_dataset.csv'))
+    if args.release:
+        print(f"Released {ledger.release()} in-flight documents")
+    if args.retry_failed:
+        print(f"Queued {ledger.retry_failed()} failed documents again")
+    if args.failed:
+        for name, attempts, error in ledger._conn().execute(
+                "SELECT name, attempts, error FROM jobs WHERE state = 'failed' ORDER BY name"):
+            print(f"{name} ({attempts} attempts): {error}")
+    print(', '.join(f"{count} {state}" for state, count in ledger.counts().items()))
+    ledger.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from corpus_util import bounded_map
+from storage import open_storage, safe_filename
+from wiki_parser import OSRSWikiParser, page_name
+from wikitext_parser import WikitextParser
+
+# Arrays of a built graph, each saved as <name>.npy so it can be memory-mapped
+GRAPH_ARRAYS = ('out_offsets', 'out_targets', 'in_offsets', 'in_targets', 'title_offsets', 'title_bytes', 'ranks')
+
+
+def node_name(title):
+    """Graph key of a stored page title or a link target: the page name as FileStorage names its file
+
+    Stored titles may already be file name stems (with / and : replaced) while
+    link targets keep them, so both sides go through this before they are
+    numbered, and lookups do too.
+    """
+    return safe_filename(page_name(title) or title.replace(' ', '_'))
+
+
+def extract_batch(batch):
+    """Parse a batch of (title, kind, source) into (title, links) in a worker process"""
+    html_parser = OSRSWikiParser()
+    wikitext_parser = WikitextParser()
+    results = []
+    errors = []
+    for title, kind, source in batch:
+        try:
+            if kind == 'wikitext':
+                links = wikitext_parser.parse(title.replace('_', ' '), source)['links']
+            else:
+                links = html_parser.parse_html(source)['links']
+            results.append((title, links))
+        except Exception as e:
+            errors.append((title, str(e)))
+    return results, errors
+
+
+def build_csr(sources, targets, size):
+    """CSR (offsets, targets) of the edges sources[i] -> targets[i], neighbours sorted"""
+    order = np.lexsort((targets, sources))
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=size), out=offsets[1:])
+    return offsets.astype(np.int32), targets[order].astype(np.int32)
+
+
+def pagerank(out_offsets, out_targets, damping=0.85, tolerance=1e-9, max_iterations=100):
+    """PageRank by power iteration over a CSR graph; rank held by dangling pages is spread evenly"""
+    size = len(out_offsets) - 1
+    if size == 0:
+        return np.zeros(0, dtype=np.float64)
+    out_degree = np.diff(out_offsets)
+    sources = np.repeat(np.arange(size, dtype=np.int32), out_degree)
+    dangling = out_degree == 0
+    inverse_degree = np.where(dangling, 0.0, 1.0 / np.maximum(out_degree, 1))
+    rank = np.full(size, 1.0 / size)
+    for _ in range(max_iterations):
+        contribution = (rank * inverse_degree)[sources]
+        new_rank = np.bincount(out_targets, weights=contribution, minlength=size)
+        new_rank = damping * (new_rank + rank[dangling].sum() / size) + (1 - damping) / size
+        delta = np.abs(new_rank - rank).sum()
+        rank = new_rank
+        if delta < tolerance:
+            break
+    return rank
+
+
+def write_graph(path, titles, sources, targets, damping=0.85):
+    """Write a graph over sorted titles with edges sources[i] -> targets[i], replacing any previous one in one rename"""
+    size = len(titles)
+    if len(sources) >= 2 ** 31:
+        raise ValueError(f"{len(sources)} links do not fit int32 offsets")
+    out_offsets, out_targets = build_csr(sources, targets, size)
+    in_offsets, in_targets = build_csr(targets, sources, size)
+
+    encoded = [title.encode('utf-8') for title in titles]
+    title_offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum([len(title) for title in encoded], out=title_offsets[1:])
+    arrays = {
+        'out_offsets': out_offsets,
+        'out_targets': out_targets,
+        'in_offsets': in_offsets,
+        'in_targets': in_targets,
+        'title_offsets': title_offsets,
+        'title_bytes': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        'ranks': pagerank(out_offsets, out_targets, damping).astype(np.float32),
+    }
+
+    tmp_path = path.rstrip('/') + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, values in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), values)
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump({'pages': size, 'links': int(len(out_targets)), 'damping': damping, 'built_at': time.time()}, f)
+    old_path = path.rstrip('/') + '.old'
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+class LinkGraph:
+    """Read-only view of a built link graph; every array is memory-mapped, so opening it costs almost nothing
+
+    Pages are numbered in sorted title order, which lets title lookups binary
+    search the title table in place instead of loading a dict of every title.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        for name in GRAPH_ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.out_offsets) - 1
+
+    def title(self, page_id):
+        """Title of a page id"""
+        start, end = self.title_offsets[page_id], self.title_offsets[page_id + 1]
+        return bytes(self.title_bytes[start:end]).decode('utf-8')
+
+    def id(self, title):
+        """Page id of a title, or None if the graph does not know it"""
+        key = node_name(title).encode('utf-8')
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            start, end = self.title_offsets[middle], self.title_offsets[middle + 1]
+            if bytes(self.title_bytes[start:end]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < len(self) and self.title(low).encode('utf-8') == key else None
+
+    def _require(self, title):
+        page_id = self.id(title)
+        if page_id is None:
+            raise KeyError(title)
+        return page_id
+
+    def out_ids(self, page_id):
+        return self.out_targets[self.out_offsets[page_id]:self.out_offsets[page_id + 1]]
+
+    def in_ids(self, page_id):
+        return self.in_targets[self.in_offsets[page_id]:self.in_offsets[page_id + 1]]
+
+    def out_neighbours(self, title):
+        """Titles a page links to"""
+        return [self.title(i) for i in self.out_ids(self._require(title))]
+
+    def in_neighbours(self, title):
+        """Titles of the pages linking to a page"""
+        return [self.title(i) for i in self.in_ids(self._require(title))]
+
+    def out_degree(self, title):
+        page_id = self._require(title)
+        return int(self.out_offsets[page_id + 1] - self.out_offsets[page_id])
+
+    def in_degree(self, title):
+        page_id = self._require(title)
+        return int(self.in_offsets[page_id + 1] - self.in_offsets[page_id])
+
+    def in_degrees(self):
+        """In-degree of every page, indexed by page id"""
+        return np.diff(self.in_offsets)
+
+    def pagerank(self, title):
+        """PageRank computed when the graph was built"""
+        return float(self.ranks[self._require(title)])
+
+    def top_pagerank(self, n=20):
+        """[(title, rank)] of the n highest ranked pages"""
+        ranks = np.asarray(self.ranks)
+        n = min(n, len(ranks))
+        if n == 0:
+            return []
+        top = np.argpartition(-ranks, n - 1)[:n]
+        return [(self.title(i), float(ranks[i])) for i in top[np.argsort(-ranks[top])]]
+
+
+class LinkGraphBuilder:
+    """Extract the links of every stored page across a process pool and write the corpus link graph
+
+    Edges are collected as int32 arrays against provisional ids handed out in
+    the order titles are met, then renumbered into sorted title order once, so
+    the main process never holds a Python object per link.
+    """
+
+    def __init__(self, output_dir="wiki_pages", storage=None, workers=None, batch_size=64,
+                 kinds=('html', 'wikitext')):
+        self.output_dir = output_dir
+        self.storage = open_storage(output_dir, storage)
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.kinds = kinds
+        self.ids = {}
+        self.sources = array('i')
+        self.targets = array('i')
+
+    def _id(self, title):
+        name = node_name(title)
+        page_id = self.ids.get(name)
+        if page_id is None:
+            page_id = self.ids[name] = len(self.ids)
+        return page_id
+
+    def _batches(self):
+        batch = []
+        for kind in self.kinds:
+            for title, source in self.storage.iter_pages(kind):
+                batch.append((title, kind, source))
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def build(self, path):
+        """Write the link graph to path and return it opened"""
+        start = time.time()
+        seen = set()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            for results, errors in bounded_map(executor, extract_batch, self._batches(), self.workers * 2):
+                for title, links in results:
+                    source = self._id(title)
+                    # A page stored both as html and wikitext keeps the links of the first kind read
+                    if source in seen:
+                        continue
+                    seen.add(source)
+                    for link in links:
+                        target = self._id(link)
+                        if target != source:
+                            self.sources.append(source)
+                            self.targets.append(target)
+                for title, error in errors:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Error parsing {title}: {error}")
+        self.storage.close()
+
+        titles = sorted(self.ids)
+        # provisional id -> position in sorted title order
+        renumber = np.empty(len(titles), dtype=np.int32)
+        renumber[[self.ids[title] for title in titles]] = np.arange(len(titles), dtype=np.int32)
+        sources = renumber[np.frombuffer(self.sources, dtype=np.int32)]
+        targets = renumber[np.frombuffer(self.targets, dtype=np.int32)]
+        write_graph(path, titles, sources, targets)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Built link graph of {len(seen)} stored pages, "
+              f"{len(titles)} titles and {len(sources)} links in {time.time() - start:.1f}s")
+        return LinkGraph(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the internal link graph of the crawled pages')
+    parser.add_argument('--output-dir', default='wiki_pages', help='Crawl output directory (default: wiki_pages)')
+    parser.add_argument('--storage', choices=['files', 'shards'],
+                        help='Storage backend of the crawl (default: detected)')
+    parser.add_argument('--graph', help='Graph directory (default: <output-dir>/link_graph)')
+    parser.add_argument('--workers', type=int, help='Parse processes (default: one per CPU)')
+    parser.add_argument('--batch-size', type=int, default=64, help='Pages per worker task (default: 64)')
+    parser.add_argument('--page', help='Print the links from and to this page instead of building')
+    parser.add_argument('--top', type=int, metavar='N', help='Print the N pages with the highest PageRank instead of building')
+    args = parser.parse_args()
+
+    path = args.graph or os.path.join(args.output_dir, 'link_graph')
+    if args.page or args.top:
+        graph = LinkGraph(path)
+        if args.page:
+            print(f"{args.page}: PageRank {graph.pagerank(args.page):.3g}")
+            print(f"Links to ({graph.out_degree(args.page)}): {', '.join(graph.out_neighbours(args.page))}")
+            print(f"Linked from ({graph.in_degree(args.page)}): {', '.join(graph.in_neighbours(args.page))}")
+        if args.top:
+            for title, rank in graph.top_pagerank(args.top):
+                print(f"{rank:.3g}  {title}")
+        return
+
+    builder = LinkGraphBuilder(
+        output_dir=args.output_dir,
+        storage=args.storage,
+        workers=args.workers,
+        batch_size=args.batch_size
+    )
+    builder.build(path)
+
+if __name__ == "__main__":
+    main()
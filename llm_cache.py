@@ -0,0 +1,192 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Default size bound of the stored responses
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+# Eviction trims the cache to this fraction of max_bytes, so it does not run again on the next put
+EVICT_TO = 0.9
+
+# A hit only rewrites last_used once it is this stale, keeping reads free of write locks
+TOUCH_INTERVAL = 60
+
+# Puts between checks of the total size
+CHECK_EVERY = 100
+
+
+def cache_key(backend, model, prompt, temperature=None, variant=''):
+    """Content address of one completion request"""
+    prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+    parts = json.dumps([backend, model, prompt_hash, temperature, variant])
+    return hashlib.sha256(parts.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """Disk-backed LLM responses keyed by (backend, model, prompt hash, temperature, variant)
+
+    A SQLite WAL table shared by every thread and process of a run: each
+    thread opens its own connection, readers never block the writer, and the
+    least recently used responses are evicted once the stored text passes
+    max_bytes. The cache survives pickling into worker processes.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                backend TEXT NOT NULL,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        conn.commit()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_local'], state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _conn(self):
+        """This thread's connection, reopened after a fork"""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.conn = sqlite3.connect(self.path, timeout=30)
+            local.conn.execute("PRAGMA journal_mode=WAL")
+            local.conn.execute("PRAGMA synchronous=NORMAL")
+            local.pid = os.getpid()
+        return local.conn
+
+    def get(self, key):
+        """Stored response for key, or None"""
+        conn = self._conn()
+        row = conn.execute("SELECT response, last_used FROM responses WHERE key = ?", (key,)).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] > TOUCH_INTERVAL:
+            with conn:
+                conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def put(self, key, backend, model, response):
+        """Store a response, evicting the least recently used ones when over max_bytes"""
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, backend, model, response, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, backend, model, response, len(response.encode('utf-8')), now, now)
+            )
+        with self._lock:
+            self._puts += 1
+            check = self._puts % CHECK_EVERY == 1
+        if check:
+            self.evict()
+
+    def cached(self, backend, model, prompt, generate, temperature=None, variant=''):
+        """Response to prompt from the cache, else from generate() (stored unless empty)"""
+        key = cache_key(backend, model, prompt, temperature, variant)
+        response = self.get(key)
+        if response is None:
+            response = generate()
+            if response:
+                self.put(key, backend, model, response)
+        return response
+
+    def evict(self):
+        """Delete least recently used responses until the cache fits in max_bytes; returns the number deleted"""
+        conn = self._conn()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        excess = total - int(self.max_bytes * EVICT_TO)
+        # Walk the last_used index until enough bytes are covered, then delete up to that point
+        freed = 0
+        cutoff = None
+        for last_used, size in conn.execute("SELECT last_used, size FROM responses ORDER BY last_used"):
+            freed += size
+            cutoff = last_used
+            if freed >= excess:
+                break
+        with conn:
+            deleted = conn.execute("DELETE FROM responses WHERE last_used <= ?", (cutoff,)).rowcount
+        return deleted
+
+    def stats(self):
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT backend, model, COUNT(*), COALESCE(SUM(size), 0) FROM responses GROUP BY backend, model"
+        ).fetchall()
+        return [{'backend': backend, 'model': model, 'responses': count, 'bytes': size}
+                for backend, model, count, size in rows]
+
+    def clear(self, backend=None):
+        conn = self._conn()
+        with conn:
+            if backend:
+                conn.execute("DELETE FROM responses WHERE backend = ?", (backend,))
+            else:
+                conn.execute("DELETE FROM responses")
+        conn.execute("VACUUM")
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local = threading.local()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or clear the LLM response cache')
+    parser.add_argument('cache', help='Cache file (e.g. qa_dataset/llm_cache.sqlite)')
+    parser.add_argument('--clear', action='store_true', help='Delete every stored response')
+    parser.add_argument('--backend', help='With --clear, only delete responses of this backend (ollama, deepseek)')
+    parser.add_argument('--max-size', type=int, metavar='MB',
+                        help='Evict least recently used responses down to this size')
+    args = parser.parse_args()
+
+    cache = LLMCache(args.cache)
+    if args.clear:
+        cache.clear(args.backend)
+        print(f"Cleared {args.backend or 'all'} responses from {args.cache}")
+    if args.max_size is not None:
+        cache.max_bytes = args.max_size * 1024 * 1024
+        print(f"Evicted {cache.evict()} responses")
+    for row in cache.stats():
+        print(f"{row['backend']:<10} {row['model']:<20} {row['responses']:>8} responses {row['bytes'] / 1024 / 1024:>9.1f}MB")
+    cache.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,135 @@
 import urllib.request
+import asyncio
 import os
-from concurrent.futures import ThreadPoolExecutor
-from urllib.parse import unquote, urljoin
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.parse import unquote, urljoin, urlencode
 import time
 from bs4 import BeautifulSoup
 import json
 import argparse
 from wiki_parser import parse_wiki_page
-import xml.etree.ElementTree as ET
+from stream_parser import StreamingWikiConverter
+from wikitext_parser import parse_wikitext
+from rate_limiter import TokenBucket, AdaptiveConcurrency
+from manifest import PageManifest
+from crawl_state import CrawlStateStore
+from storage import open_storage, ShardStorage
+from sitemap import download_sitemaps, iter_sitemap_file
+from metrics import CrawlMetrics
+from frontier import CrawlFrontier, UrlScorer
+from corpus_util import STREAMING_THRESHOLD
+from link_graph import LinkGraph
 import hashlib
-import requests
-import gzip
+import io
+import httpx
+import glob
 import re
 import multiprocessing
 from multiprocessing import Pool
-from itertools import islice
+from itertools import islice, chain
 from datetime import datetime, timedelta
 import random
-from collections import deque
 import threading
+import queue
 from threading import Lock
+from collections import namedtuple, deque
+
+# content is None when the server answered 304 Not Modified
+FetchResult = namedtuple('FetchResult', ['content', 'etag', 'last_modified'])
+
+# Stage timings travel with the result because parse workers may run in another process
+RenderedPage = namedtuple('RenderedPage', ['html', 'markdown', 'soup_seconds', 'markdown_seconds'])
+
+def render_page(content):
+    """Extract div#content from a downloaded page and render it to markdown"""
+    # Module-level so the pipeline engine can run it in parse worker processes
+    if len(content) > STREAMING_THRESHOLD:
+        return render_large_page(content)
+    start = time.perf_counter()
+    soup = BeautifulSoup(content, 'html.parser')
+    main_content = soup.find('div', id='content')
+    if not main_content:
+        return None
+    html = str(main_content)
+    parsed = time.perf_counter()
+    markdown = parse_wiki_page(html)
+    return RenderedPage(html, markdown, parsed - start, time.perf_counter() - parsed)
+
+def render_large_page(content):
+    """render_page() for huge pages: two streaming passes instead of a BeautifulSoup tree
+
+    The converter itself keeps only the current row or list item, but the
+    page arrives as one string and the stored HTML and markdown are returned
+    as strings, so peak memory is still about three times the page size.
+    """
+    start = time.perf_counter()
+    converter = StreamingWikiConverter(scope_id='content')
+    html = io.StringIO()
+    scan = converter.scan(content, html_writer=html)
+    if scan is None:
+        return None
+    parsed = time.perf_counter()
+    markdown = io.StringIO()
+    converter.emit(content, scan, markdown)
+    return RenderedPage(html.getvalue(), markdown.getvalue(), parsed - start, time.perf_counter() - parsed)
 
 class WikiCrawler:
-    def __init__(self, output_dir="wiki_pages", max_pages=None, threads=16, delay=0.5):
+    def __init__(self, output_dir="wiki_pages", max_pages=None, threads=16, delay=0.5,
+                 engine="threads", concurrency=32, incremental=False, storage="files",
+                 parse_workers=None, write_workers=1, queue_size=256, source="html", api_url=None,
+                 metrics_port=None, metrics_interval=10, base_url=None, sitemap_index_url=None,
+                 dataset_dir="dataset", max_requests=300, order="priority", time_budget=None):
         self.output_dir = output_dir
-        self.html_dir = os.path.join(output_dir, "html")
-        self.markdown_dir = os.path.join(output_dir, "markdown")
-        self.dataset_dir = "dataset"
+        self.dataset_dir = dataset_dir
         self.sitemap_file = os.path.join(self.dataset_dir, "NS_0-0.xml.gz")
-        self.visited_file = os.path.join(output_dir, "visited_pages.json")
+        self.sitemap_files = []
+        self.visited_file = os.path.join(output_dir, "visited_pages.json")  # Legacy, migrated on first run
+        self.state_file = os.path.join(output_dir, "crawl_state.sqlite")
+        self.manifest_file = os.path.join(output_dir, "manifest.json")  # Legacy, migrated on first run
         
         # Initialize thread-safe primitives
         self.error_lock = threading.Lock()
         self.visited_lock = threading.Lock()
         
         # Initialize shared state
+        os.makedirs(output_dir, exist_ok=True)
+        self.metrics = CrawlMetrics(output_dir, interval=metrics_interval, port=metrics_port)
+        self.state = CrawlStateStore(self.state_file)
+        self.storage = open_storage(output_dir, storage)  # Per-page files or packed shards
+        # 'html' fetches rendered pages; 'api' pulls raw wikitext for many titles per request
+        self.source = source
+        self.page_kinds = ('wikitext', 'markdown') if source == 'api' else ('html', 'markdown')
         self.visited_pages = set()
         self._load_visited_pages()
         print(f"Number of visited pages: {len(self.visited_pages)}")
         
-        self.base_url = "https://oldschool.runescape.wiki"
-        self.sitemap_index_url = "https://oldschool.runescape.wiki/images/sitemaps/index.xml"
+        # Overridable so the crawler can run against a local replay server
+        self.base_url = base_url or "https://oldschool.runescape.wiki"
+        self.sitemap_index_url = sitemap_index_url or f"{self.base_url}/images/sitemaps/index.xml"
+        self.api_url = api_url or f"{self.base_url}/api.php"
+        self.api_batch_size = 50  # MediaWiki's titles-per-query limit for regular clients
         self.max_pages = max_pages
+        # 'priority' crawls the most valuable URLs first; 'sitemap' streams them in sitemap order
+        self.order = order
+        self.time_budget = time_budget  # Seconds after which no new URL is started
         self.threads = threads
         self.delay = delay
+        self.engine = engine
+        self.concurrency = concurrency  # Max in-flight requests for the async engine
+        self.incremental = incremental  # Refetch only pages whose sitemap lastmod moved
+        # Pipeline engine: --threads fetch workers feed parse processes and writer threads
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.write_workers = write_workers
+        self.queue_size = queue_size  # Bound on each inter-stage queue, for backpressure
         self.pages_downloaded = 0
+        self.pages_unchanged = 0
+        self.sitemap_lastmod = {}
         self._counter_lock = Lock()
         
         # Create output directories if they don't exist
-        os.makedirs(self.html_dir, exist_ok=True)
-        os.makedirs(self.markdown_dir, exist_ok=True)
         os.makedirs(self.dataset_dir, exist_ok=True)
-        os.makedirs(os.path.dirname(self.visited_file), exist_ok=True)
+        
+        self.manifest = PageManifest(self.state, self.manifest_file)
         
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
@@ -59,10 +137,18 @@ class WikiCrawler:
         
         # Add rate limiting parameters
         self.request_window = 60  # 1 minute window
-        self.max_requests = 300   # Max requests per window
-        self.request_times = deque(maxlen=self.max_requests)
-        self.last_request_time = time.time()
-        self.min_request_interval = self.request_window / self.max_requests  # Minimum time between requests
+        self.max_requests = max_requests   # Max requests per window
+        # One bucket for every thread and coroutine so the budget is per process, not per worker
+        self.rate_limiter = TokenBucket(
+            rate=self.max_requests / self.request_window,
+            capacity=max(1, self.max_requests // self.request_window)
+        )
+        # AIMD ceiling on in-flight requests, starting low and growing while the wiki stays healthy
+        max_in_flight = concurrency if engine == 'async' else threads
+        self.concurrency_limiter = AdaptiveConcurrency(
+            initial=min(4, max_in_flight),
+            maximum=max_in_flight
+        )
         
         # Add backoff parameters
         self.min_delay = delay
@@ -71,119 +157,124 @@ class WikiCrawler:
         self.error_counts = {}
         
         self.batch_size = 10  # Number of URLs to process per batch
-        
-        self._thread_local = threading.local()
-        self._last_save_time = time.time()
-        self._save_interval = 60  # Save every minute
+        self.storage_batch_size = 64  # Pages the pipeline writer stores per batch
+
 
     def _load_visited_pages(self):
-        """Load the set of visited pages from disk"""
+        """Load the set of visited pages from the crawl state store"""
         try:
-            if os.path.exists(self.visited_file):
-                with self.visited_lock, open(self.visited_file, 'r') as f:
-                    self.visited_pages.update(json.load(f))
+            migrated = self.state.import_visited_json(self.visited_file)
+            if migrated:
+                print(f"Migrated {migrated} pages from {self.visited_file}")
+            done = self.state.load_done()
+            if isinstance(self.storage, ShardStorage):
+                # Shard writes are batched, so drop pages whose records never reached disk
+                done = {url for url in done if self.storage.has_page(self._page_name(url), self.page_kinds)}
+            with self.visited_lock:
+                self.visited_pages.update(done)
         except Exception as e:
             print(f"Error loading visited pages: {str(e)}")
 
+    def _mark_visited(self, url):
+        """Record a finished URL in memory and queue it for the state store"""
+        with self.visited_lock:
+            self.visited_pages.add(url)
+        self.state.mark_done(url)
+
     def save_visited_pages(self):
-        """Save the visited pages to disk periodically"""
-        current_time = time.time()
-        if current_time - self._last_save_time < self._save_interval:
-            return
-        
+        """Block until every queued status and manifest update has been committed"""
         try:
-            with self.visited_lock:
-                temp_file = self.visited_file + '.tmp'
-                with open(temp_file, 'w') as f:
-                    json.dump(list(self.visited_pages), f)
-                os.replace(temp_file, self.visited_file)
-                self._last_save_time = current_time
+            self.state.flush()
         except Exception as e:
             print(f"Error saving visited pages: {str(e)}")
 
     def check_and_download_latest_sitemap(self):
-        """Check if we have the latest sitemap and download if needed"""
+        """Download every shard listed in the sitemap index, reporting whether any changed"""
         try:
-            # Download the sitemap index
-            response = requests.get(self.sitemap_index_url, headers=self.headers)
-            index_content = response.content
-            
-            # Parse the index XML
-            root = ET.fromstring(index_content)
-            # Find the most recent sitemap URL (usually the first one)
-            ns = {'sm': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
-            latest_sitemap = root.find('.//sm:loc', ns).text
-            
-            # Download the latest sitemap (gzipped)
-            response = requests.get(latest_sitemap, headers=self.headers)
-            sitemap_content = response.content
-            
-            # Check if we need to update our local copy
-            if not os.path.exists(self.sitemap_file):
-                with open(self.sitemap_file, 'wb') as f:
-                    f.write(sitemap_content)
-                return True
-            
-            # Compare with existing file
-            with open(self.sitemap_file, 'rb') as f:
-                existing_content = f.read()
-                
-            if hashlib.md5(existing_content).hexdigest() != hashlib.md5(sitemap_content).hexdigest():
-                with open(self.sitemap_file, 'wb') as f:
-                    f.write(sitemap_content)
-                return True
-                
-            return False
+            shards = download_sitemaps(self.sitemap_index_url, self.dataset_dir, headers=self.headers)
+            self.sitemap_files = [path for path, _ in shards]
+            return any(changed for _, changed in shards)
             
         except Exception as e:
             print(f"Error checking/downloading sitemap: {str(e)}")
             return False
     
+    def iter_sitemap_records(self):
+        """Stream wiki page records from every local sitemap shard"""
+        sitemap_files = self.sitemap_files or sorted(glob.glob(os.path.join(self.dataset_dir, "NS_*.xml.gz")))
+        for sitemap_file in sitemap_files:
+            try:
+                for record in iter_sitemap_file(sitemap_file):
+                    page_url = record.loc
+                    # Only include wiki pages, exclude special pages, etc.
+                    if '/w/' in page_url and not any(x in page_url.lower() for x in [
+                        'special:', 'file:', 'template:', 'category:', 'talk:', 'user:'
+                    ]):
+                        yield record
+            except Exception as e:
+                print(f"Error parsing sitemap {sitemap_file}: {str(e)}")
+    
+    def extract_url_records_from_sitemap(self):
+        """Extract all wiki page URLs from the sitemaps, mapped to their lastmod"""
+        return {record.loc: record.lastmod for record in self.iter_sitemap_records()}
+    
     def extract_urls_from_sitemap(self):
-        """Extract all wiki page URLs from the sitemap XML"""
-        try:
-            # Read and decompress the gzipped file
-            with gzip.open(self.sitemap_file, 'rb') as gz_file:
-                xml_content = gz_file.read()
-            
-            # Parse the XML content
-            root = ET.fromstring(xml_content)
-            
-            # Define the namespace
-            ns = {'sm': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
-            
-            # Extract all URLs
-            urls = set()
-            for url in root.findall('.//sm:url/sm:loc', ns):
-                page_url = url.text
-                # Only include wiki pages, exclude special pages, etc.
-                if '/w/' in page_url and not any(x in page_url.lower() for x in [
-                    'special:', 'file:', 'template:', 'category:', 'talk:', 'user:'
-                ]):
-                    urls.add(page_url)
-            
-            return urls
+        """Extract all wiki page URLs from the sitemaps"""
+        return set(self.extract_url_records_from_sitemap())
+    
+    def _pending_records(self):
+        """Yield sitemap records of URLs that still need crawling as the sitemaps are parsed"""
+        for record in self.iter_sitemap_records():
+            url = record.loc
+            if url in self.sitemap_lastmod:
+                continue
+            self.sitemap_lastmod[url] = record.lastmod
             
+            if self.incremental:
+                # Only refetch pages whose sitemap lastmod moved since the last run
+                if self.manifest.is_stale(url, record.lastmod):
+                    yield record
+            elif url not in self.visited_pages:
+                yield record
+    
+    def _pending_urls(self):
+        """Yield URLs that still need crawling as the sitemaps are parsed"""
+        for record in self._pending_records():
+            yield record.loc
+    
+    def _load_pagerank(self):
+        """PageRank lookup from the link graph of an earlier crawl, scaled so the average page is 1"""
+        path = os.path.join(self.output_dir, 'link_graph')
+        if not os.path.isdir(path):
+            return None
+        try:
+            graph = LinkGraph(path)
+            size = len(graph)
+
+            def rank(title):
+                # Binary search of the memory-mapped title table, no dict of every title
+                page_id = graph.id(title)
+                return None if page_id is None else float(graph.ranks[page_id]) * size
+            return rank
         except Exception as e:
-            print(f"Error parsing sitemap: {str(e)}")
-            return set()
+            print(f"Error loading link graph, ranking without PageRank: {str(e)}")
+            return None
+    
+    def build_frontier(self):
+        """Read every pending URL from the sitemaps into a frontier ordered by UrlScorer"""
+        start = time.time()
+        scorer = UrlScorer(error_counts=self.state.load_error_counts(), pagerank=self._load_pagerank())
+        deadline = start + self.time_budget if self.time_budget else None
+        frontier = CrawlFrontier(deadline=deadline)
+        frontier.extend((record.loc, scorer.score(record)) for record in self._pending_records())
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Ranked {len(frontier)} URLs in {time.time() - start:.1f}s"
+              + "".join(f"\n  {score:.2f}  {url}" for url, score in frontier.peek(3)))
+        return frontier
     
     def wait_for_rate_limit(self):
-        """Implement rate limiting per thread"""
+        """Block until the shared token bucket allows another request"""
         try:
-            current_time = time.time()
-            
-            # Initialize thread-local last_request_time if not exists
-            if not hasattr(self._thread_local, 'last_request_time'):
-                self._thread_local.last_request_time = 0
-            
-            time_since_last = current_time - self._thread_local.last_request_time
-            
-            if time_since_last < self.min_request_interval:
-                sleep_time = max(0.1, self.min_request_interval - time_since_last)
-                time.sleep(sleep_time)
-            
-            self._thread_local.last_request_time = time.time()
+            self.rate_limiter.acquire()
             return True
         except Exception as e:
             print(f"Error in rate limiting: {str(e)}")
@@ -197,12 +288,19 @@ class WikiCrawler:
             # Add jitter to prevent thundering herd
             return delay * (0.5 + random.random())
 
+    def _request_headers(self, url):
+        """Request headers for a URL, conditional when an incremental run already has the page"""
+        if not self.incremental:
+            return self.headers
+        if not self.storage.has_page(self._page_name(url), self.page_kinds):
+            return self.headers
+        return {**self.headers, **self.manifest.conditional_headers(url)}
+
     def download_with_retry(self, url, max_retries=5):
         """Download a URL with retry logic and exponential backoff"""
         retries = 0
         while retries < max_retries:
             try:
-                print(f"Attempting download of {url}")
                 # Wait for rate limit
                 if not self.wait_for_rate_limit():
                     print("Rate limiting failed, retrying...")
@@ -210,108 +308,353 @@ class WikiCrawler:
                     continue
                 
                 # Make the request
-                req = urllib.request.Request(url, headers=self.headers)
-                with urllib.request.urlopen(req) as response:
-                    print(f"Download successful for {url}")
-                    content = response.read().decode('utf-8')
+                req = urllib.request.Request(url, headers=self._request_headers(url))
+                self.concurrency_limiter.acquire()
+                try:
+                    # urlopen returns once headers arrive, so connect time is folded into ttfb here
+                    start = time.perf_counter()
+                    with urllib.request.urlopen(req) as response:
+                        first_byte = time.perf_counter()
+                        content = response.read().decode('utf-8')
+                        etag = response.headers.get('ETag')
+                        last_modified = response.headers.get('Last-Modified')
+                    done = time.perf_counter()
+                    self.metrics.observe('ttfb', first_byte - start)
+                    self.metrics.observe('body', done - first_byte)
+                    self.metrics.observe('fetch', done - start)
+                finally:
+                    self.concurrency_limiter.release()
+                self.concurrency_limiter.on_success()
                 
                 # Reset error count on success
                 with self.error_lock:
                     self.error_counts[url] = 0
                 
-                return content
+                return FetchResult(content, etag, last_modified)
 
             except urllib.error.HTTPError as e:
+                if e.code == 304:  # Not Modified
+                    self.concurrency_limiter.on_success()
+                    return FetchResult(None, e.headers.get('ETag'), e.headers.get('Last-Modified'))
                 if e.code == 429:  # Too Many Requests
-                    print(f"Rate limited on {url}, backing off...")
+                    self.metrics.inc('retries', status='429')
+                    self.concurrency_limiter.on_throttle()
                     time.sleep(5 + random.random() * 5)
                 elif e.code >= 500:
-                    print(f"Server error {e.code} on {url}, retrying...")
+                    self.metrics.inc('retries', status=str(e.code))
+                    self.concurrency_limiter.on_throttle()
                 else:
-                    print(f"HTTP error {e.code} on {url}")
+                    self.metrics.inc('http_errors', status=str(e.code))
                     raise
             except Exception as e:
-                print(f"Error downloading {url}: {str(e)}")
+                self.metrics.inc('retries', status=type(e).__name__)
             
             # Increment error count and calculate backoff
             with self.error_lock:
                 self.error_counts[url] = self.error_counts.get(url, 0) + 1
             
             delay = self.get_backoff_delay(url)
-            print(f"Retrying {url} in {delay:.2f} seconds (attempt {retries + 1}/{max_retries})")
             time.sleep(delay)
             retries += 1
         
         raise Exception(f"Failed to download {url} after {max_retries} attempts")
 
+    def _page_name(self, url):
+        """Return the page name the storage backend files a URL under"""
+        return unquote(url.split('/w/')[-1])
+
+    def _needs_download(self, url, page_name):
+        """Check whether a URL still has to be fetched"""
+        # Incremental runs already selected this URL because its sitemap lastmod moved
+        if self.incremental:
+            return True
+        
+        # Quick check without lock first
+        if url in self.visited_pages:
+            return False
+        
+        # Skip if the page is already stored
+        if self.storage.has_page(page_name, self.page_kinds):
+            self._mark_visited(url)
+            return False
+        
+        # Double-check with lock
+        with self.visited_lock:
+            return url not in self.visited_pages
+
+    def _mark_failed(self, url, error):
+        """Record a URL that could not be crawled"""
+        self.state.mark_failed(url, error)
+        self.metrics.inc('pages_failed')
+
+    def _mark_unchanged(self, url, page_name):
+        """Record a page whose stored copy is still current"""
+        with self._counter_lock:
+            self.pages_unchanged += 1
+        self._mark_visited(url)
+        self.metrics.inc('pages_unchanged')
+
+    def _validators(self, url, result):
+        """Manifest fields describing a fetch result"""
+        return {
+            'lastmod': self.sitemap_lastmod.get(url),
+            'etag': result.etag,
+            'last_modified': result.last_modified,
+        }
+
+    def record_not_modified(self, url, result):
+        """Record a 304 Not Modified response: nothing to parse"""
+        self.manifest.update(url, **self._validators(url, result))
+        self._mark_unchanged(url, self._page_name(url))
+
+    def store_rendered(self, url, result, source, markdown, source_kind='html'):
+        """Store a rendered page unless its content hash shows it is unchanged"""
+        page_name = self._page_name(url)
+        validators = self._validators(url, result)
+        content_hash = hashlib.sha256(source.encode('utf-8')).hexdigest()
+        if (self.manifest.get(url).get('content_hash') == content_hash
+                and self.storage.has_page(page_name, self.page_kinds)):
+            self.manifest.update(url, **validators)
+            self._mark_unchanged(url, page_name)
+            return
+        
+        with self.metrics.time('write'):
+            self.storage.write_page(page_name, {source_kind: source, 'markdown': markdown})
+        
+        # Update counters and visited pages at the end
+        with self._counter_lock:
+            self.pages_downloaded += 1
+        
+        self._mark_visited(url)
+        self.manifest.update(url, content_hash=content_hash, **validators)
+        self.metrics.inc('pages_stored')
+
+    def store_render(self, url, result, rendered):
+        """Record a render's stage timings and store its output"""
+        self.metrics.observe('soup_parse', rendered.soup_seconds)
+        self.metrics.observe('markdown_render', rendered.markdown_seconds)
+        self.store_rendered(url, result, rendered.html, rendered.markdown)
+
+    def save_page(self, url, result):
+        """Parse downloaded page content and store the html and markdown"""
+        if result.content is None:
+            self.record_not_modified(url, result)
+            return
+        
+        rendered = render_page(result.content)
+        if rendered:
+            self.store_render(url, result, rendered)
+
+    def _dequeued(self, queued_at, func, *args):
+        """Run func(*args) for work handed to a pool at queued_at, recording how long it waited"""
+        self.metrics.observe('queue_wait', time.monotonic() - queued_at)
+        return func(*args)
+
     def download_page(self, url):
         """Download a single page and save it to the output directory"""
         try:
-            # Quick check without lock first
-            if url in self.visited_pages:
-                return
-            
-            # Create filenames
-            page_name = unquote(url.split('/w/')[-1])
-            safe_name = re.sub(r'[\\/:*?"<>|]', '_', page_name)
-            html_filename = os.path.join(self.html_dir, f"{safe_name}.html")
-            md_filename = os.path.join(self.markdown_dir, f"{safe_name}.md")
-            
-            # Skip if files exist
-            if os.path.exists(html_filename) and os.path.exists(md_filename):
-                with self.visited_lock:
-                    self.visited_pages.add(url)
+            page_name = self._page_name(url)
+            if not self._needs_download(url, page_name):
                 return
             
-            # Double-check with lock
-            with self.visited_lock:
-                if url in self.visited_pages:
-                    return
-            
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Starting download: {page_name}")
-            
             # Download and process content
-            content = self.download_with_retry(url)
-            soup = BeautifulSoup(content, 'html.parser')
-            main_content = soup.find('div', id='content')
-            
-            if main_content:
-                # Write files without holding locks
-                tmp_html = html_filename + '.tmp'
-                tmp_md = md_filename + '.tmp'
+            result = self.download_with_retry(url)
+            self.save_page(url, result)
+                        
+        except Exception as e:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Error downloading {url}: {str(e)}")
+            self._mark_failed(url, e)
+            raise
+
+    def download_wikitext_batch(self, urls):
+        """Fetch raw wikitext for up to api_batch_size pages in one MediaWiki API query"""
+        titles = {self._page_name(url).replace('_', ' '): url for url in urls}
+        query = urlencode({
+            'action': 'query',
+            'prop': 'revisions',
+            'rvprop': 'content|timestamp',
+            'rvslots': 'main',
+            'redirects': 1,
+            'format': 'json',
+            'formatversion': 2,
+            'titles': '|'.join(titles),
+        })
+        result = self.download_with_retry(f"{self.api_url}?{query}")
+        data = json.loads(result.content).get('query', {})
+        
+        # Walk normalisation and redirect hops back to every title we asked for;
+        # several requested titles can redirect to the same page
+        origins = {}
+        for hop in data.get('normalized', []) + data.get('redirects', []):
+            origins.setdefault(hop['to'], []).append(hop['from'])
+
+        def requested_urls(title):
+            urls = []
+            seen = set()
+            stack = [title]
+            while stack:
+                title = stack.pop()
+                if title in seen:
+                    continue
+                seen.add(title)
+                if title in titles:
+                    urls.append(titles[title])
+                stack.extend(origins.get(title, []))
+            return urls
+
+        found = set()
+        for page in data.get('pages', []):
+            urls = requested_urls(page.get('title', ''))
+            if not urls or page.get('missing') or not page.get('revisions'):
+                continue
+            revision = page['revisions'][0]
+            wikitext = revision['slots']['main']['content']
+            with self.metrics.time('markdown_render'):
+                markdown = parse_wikitext(page['title'], wikitext)
+            for url in urls:
+                found.add(url)
+                self.store_rendered(url, FetchResult(wikitext, None, revision.get('timestamp')),
+                                    wikitext, markdown, source_kind='wikitext')
+        
+        for url in titles.values():
+            if url not in found:
+                self._mark_failed(url, "missing from API response")
+
+    def _crawl_api(self, urls):
+        """Crawl through the MediaWiki API, api_batch_size titles per request"""
+        pending = (url for url in urls if self._needs_download(url, self._page_name(url)))
+        
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            window = deque()
+            while True:
+                while len(window) < self.threads * 2:
+                    batch = list(islice(pending, self.api_batch_size))
+                    if not batch:
+                        break
+                    window.append((batch, executor.submit(self.download_wikitext_batch, batch)))
+                if not window:
+                    break
                 
+                batch, future = window.popleft()
                 try:
-                    with open(tmp_html, 'w', encoding='utf-8') as f:
-                        f.write(str(main_content))
-                    os.replace(tmp_html, html_filename)
-                    
-                    markdown = parse_wiki_page(str(main_content))
-                    with open(tmp_md, 'w', encoding='utf-8') as f:
-                        f.write(markdown)
-                    os.replace(tmp_md, md_filename)
+                    future.result()
+                except Exception as e:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Error fetching API batch: {str(e)}")
+                    for url in batch:
+                        self._mark_failed(url, e)
+
+    async def wait_for_rate_limit_async(self):
+        """Wait on the event loop until the shared token bucket allows another request"""
+        await self.rate_limiter.acquire_async()
+
+    async def download_with_retry_async(self, client, url, max_retries=5):
+        """Download a URL over the pooled async client with retry logic and exponential backoff"""
+        headers = await asyncio.to_thread(self._request_headers, url)
+        retries = 0
+        while retries < max_retries:
+            try:
+                await self.wait_for_rate_limit_async()
+                await self.concurrency_limiter.acquire_async()
+                try:
+                    connect_started = None
+                    connect_done = ('connection.start_tls.complete' if url.startswith('https')
+                                    else 'connection.connect_tcp.complete')
                     
-                    # Update counters and visited pages at the end
-                    with self._counter_lock:
-                        self.pages_downloaded += 1
-                        downloaded = self.pages_downloaded
+                    async def trace(event, info):
+                        # httpcore only reports connection setup when the pool has no idle keep-alive connection
+                        nonlocal connect_started
+                        if event == 'connection.connect_tcp.started':
+                            connect_started = time.perf_counter()
+                        elif event == connect_done and connect_started is not None:
+                            self.metrics.observe('connect', time.perf_counter() - connect_started)
                     
-                    with self.visited_lock:
-                        self.visited_pages.add(url)
+                    start = time.perf_counter()
+                    async with client.stream('GET', url, headers=headers,
+                                             extensions={'trace': trace}) as response:
+                        first_byte = time.perf_counter()
+                        await response.aread()
+                    done = time.perf_counter()
+                    self.metrics.observe('ttfb', first_byte - start)
+                    self.metrics.observe('body', done - first_byte)
+                    self.metrics.observe('fetch', done - start)
+                finally:
+                    self.concurrency_limiter.release()
+                
+                if response.status_code == 304:  # Not Modified
+                    self.concurrency_limiter.on_success()
+                    return FetchResult(None, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+                elif response.status_code == 429:  # Too Many Requests
+                    self.metrics.inc('retries', status='429')
+                    self.concurrency_limiter.on_throttle()
+                    await asyncio.sleep(5 + random.random() * 5)
+                elif response.status_code >= 500:
+                    self.metrics.inc('retries', status=str(response.status_code))
+                    self.concurrency_limiter.on_throttle()
+                else:
+                    response.raise_for_status()
+                    self.concurrency_limiter.on_success()
                     
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Successfully downloaded ({downloaded} total): {page_name}")
+                    # Reset error count on success
+                    with self.error_lock:
+                        self.error_counts[url] = 0
                     
-                finally:
-                    for tmp_file in (tmp_html, tmp_md):
-                        try:
-                            if os.path.exists(tmp_file):
-                                os.remove(tmp_file)
-                        except:
-                            pass
-                        
-        except Exception as e:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Error downloading {url}: {str(e)}")
-            raise
-    
+                    return FetchResult(
+                        response.text,
+                        response.headers.get('ETag'),
+                        response.headers.get('Last-Modified')
+                    )
+
+            except httpx.HTTPStatusError as e:
+                self.metrics.inc('http_errors', status=str(e.response.status_code))
+                raise
+            except httpx.HTTPError as e:
+                self.metrics.inc('retries', status=type(e).__name__)
+            
+            # Increment error count and calculate backoff
+            with self.error_lock:
+                self.error_counts[url] = self.error_counts.get(url, 0) + 1
+            
+            delay = self.get_backoff_delay(url)
+            await asyncio.sleep(delay)
+            retries += 1
+        
+        raise Exception(f"Failed to download {url} after {max_retries} attempts")
+
+    async def download_page_async(self, client, url):
+        """Download a single page on the event loop; storage lookups, parsing and writes run off-loop"""
+        # has_page stats files on disk, which would stall every fetch in flight
+        if not await asyncio.to_thread(self._needs_download, url, self._page_name(url)):
+            return
+        
+        result = await self.download_with_retry_async(client, url)
+        # Parsing and disk writes would block the loop, so run them in a worker thread
+        await asyncio.to_thread(self._dequeued, time.monotonic(), self.save_page, url, result)
+
+    async def _crawl_async(self, urls):
+        """Download URLs with a fixed number of coroutines sharing one keep-alive connection pool"""
+        limits = httpx.Limits(
+            max_connections=self.concurrency,
+            max_keepalive_connections=self.concurrency
+        )
+        url_iter = iter(urls)
+        
+        async def worker():
+            for url in url_iter:
+                try:
+                    await self.download_page_async(client, url)
+                except Exception as e:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Error downloading {url}: {str(e)}")
+                    self._mark_failed(url, e)
+        
+        # httpx negotiates gzip/deflate transfer encoding by default
+        async with httpx.AsyncClient(
+            headers=self.headers,
+            limits=limits,
+            timeout=httpx.Timeout(30.0),
+            follow_redirects=True
+        ) as client:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
     def get_page_content(self, url):
         """Get the content of a page"""
         req = urllib.request.Request(url, headers=self.headers)
@@ -365,7 +708,7 @@ class WikiCrawler:
             print(f"Error processing batch: {str(e)}")
 
     def crawl(self):
-        """Start the crawling process using batched multithreading"""
+        """Start the crawling process with the configured fetch engine"""
         start_time = time.time()
         print(f"\n[{datetime.now().strftime('%H:%M:%S')}] Starting crawler...")
         
@@ -375,57 +718,44 @@ class WikiCrawler:
         else:
             print("Using existing sitemap file")
         
-        # Extract URLs from sitemap
-        urls = self.extract_urls_from_sitemap()
-        print(f"Found {len(urls)} URLs in sitemap")
-        
-        if not urls:
-            print("No URLs found in sitemap, aborting")
-            return
-        
-        # Filter out already visited URLs
-        with self.visited_lock:
-            urls = [url for url in urls if url not in self.visited_pages]
-        print(f"{len(urls)} URLs remaining after filtering visited pages")
+        self.sitemap_lastmod = {}
+        if self.order == 'priority':
+            urls = self.build_frontier()
+        else:
+            # Stream URLs from the sitemaps straight to the workers
+            urls = self._pending_urls()
+            if self.time_budget:
+                deadline = start_time + self.time_budget
+                urls = (url for url in urls if time.time() < deadline)
         
         if self.max_pages:
             with self._counter_lock:
-                urls = list(islice(urls, self.max_pages - self.pages_downloaded))
-                print(f"Limited to {len(urls)} URLs due to max_pages setting")
+                urls = islice(urls, self.max_pages - self.pages_downloaded)
+                print(f"Limited to {self.max_pages - self.pages_downloaded} URLs due to max_pages setting")
         
-        # Split URLs into batches
-        url_batches = [urls[i:i + self.batch_size] for i in range(0, len(urls), self.batch_size)]
-        total_batches = len(url_batches)
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] "
-              f"Split {len(urls)} URLs into {total_batches} batches of {self.batch_size}")
-        
-        completed_batches = 0
+        first_url = next(urls, None)
+        if first_url is None:
+            print("No URLs left to crawl in sitemap, aborting")
+            return
+        urls = chain([first_url], urls)
         
+        self.metrics.start()
         try:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] "
-                  f"Starting downloads with {self.threads} threads...")
-            
-            with ThreadPoolExecutor(max_workers=self.threads) as executor:
-                futures = [executor.submit(self.process_batch, batch) for batch in url_batches]
-                
-                for i, future in enumerate(futures):
-                    try:
-                        future.result(timeout=120)  # 2 minute timeout per batch
-                        completed_batches += 1
-                        elapsed = time.time() - start_time
-                        avg_time = elapsed / completed_batches
-                        remaining = (total_batches - completed_batches) * avg_time
-                        
-                        print(f"[{datetime.now().strftime('%H:%M:%S')}] "
-                              f"Completed batch {completed_batches}/{total_batches} "
-                              f"(Avg: {avg_time:.1f}s/batch, "
-                              f"Est. remaining: {remaining/60:.1f}min)")
-                        
-                    except TimeoutError:
-                        print(f"[{datetime.now().strftime('%H:%M:%S')}] Batch {i+1} timed out")
-                    except Exception as e:
-                        print(f"[{datetime.now().strftime('%H:%M:%S')}] "
-                              f"Error processing batch {i+1}: {str(e)}")
+            if self.source == 'api':
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] "
+                      f"Starting API crawl against {self.api_url} with {self.threads} threads...")
+                self._crawl_api(urls)
+            elif self.engine == 'async':
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] "
+                      f"Starting async downloads with {self.concurrency} concurrent requests...")
+                asyncio.run(self._crawl_async(urls))
+            elif self.engine == 'pipeline':
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] "
+                      f"Starting pipeline with {self.threads} fetch threads, "
+                      f"{self.parse_workers} parse processes and {self.write_workers} writers...")
+                self._crawl_pipeline(urls)
+            else:
+                self._crawl_threaded(urls, start_time)
             
         except Exception as e:
             print(f"[{datetime.now().strftime('%H:%M:%S')}] Error during crawling: {str(e)}")
@@ -434,36 +764,162 @@ class WikiCrawler:
             
         finally:
             elapsed = time.time() - start_time
+            self.storage.flush()
             self.save_visited_pages()
-            print(f"\n[{datetime.now().strftime('%H:%M:%S')}] "
+            self.metrics.stop()
+            print(f"\nRead {len(self.sitemap_lastmod)} URLs from sitemap")
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] "
                   f"Crawling completed in {elapsed/60:.1f} minutes. "
-                  f"Downloaded {self.pages_downloaded} pages.")
+                  f"Downloaded {self.pages_downloaded} pages, "
+                  f"{self.pages_unchanged} unchanged.")
 
-    def process_batch(self, urls):
-        """Process a batch of URLs in parallel"""
+    def _crawl_pipeline(self, urls):
+        """Run fetch -> parse -> write as separate stages joined by bounded queues"""
+        url_queue = queue.Queue(maxsize=self.queue_size)
+        parse_queue = queue.Queue(maxsize=self.queue_size)
+        write_queue = queue.Queue(maxsize=self.queue_size)
+        stop = object()
+        start_time = time.time()
+        
+        def feed():
+            for url in urls:
+                url_queue.put(url)
+            for _ in range(self.threads):
+                url_queue.put(stop)
+        
+        def fetch():
+            # I/O stage: blocks on the network, hands raw pages to the parse stage
+            while (url := url_queue.get()) is not stop:
+                try:
+                    if not self._needs_download(url, self._page_name(url)):
+                        continue
+                    result = self.download_with_retry(url)
+                    if result.content is None:
+                        self.record_not_modified(url, result)
+                    else:
+                        parse_queue.put((time.monotonic(), url, result))
+                except Exception as e:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Error downloading {url}: {str(e)}")
+                    self._mark_failed(url, e)
+        
+        def parse(executor):
+            # CPU stage: each dispatcher keeps one page in a worker process at a time
+            while (item := parse_queue.get()) is not stop:
+                queued_at, url, result = item
+                self.metrics.observe('queue_wait', time.monotonic() - queued_at)
+                try:
+                    rendered = executor.submit(render_page, result.content).result()
+                    if rendered:
+                        write_queue.put((time.monotonic(), url, result, rendered))
+                except Exception as e:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Error parsing {url}: {str(e)}")
+                    self._mark_failed(url, e)
+        
+        def write():
+            # Disk stage: drain whatever is queued and store it as one batch
+            running = True
+            while running:
+                batch = []
+                item = write_queue.get()
+                while item is not stop:
+                    batch.append(item)
+                    if len(batch) >= self.storage_batch_size:
+                        break
+                    try:
+                        item = write_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                # Each writer consumes exactly one stop marker
+                running = item is not stop
+                for queued_at, url, result, rendered in batch:
+                    self.metrics.observe('queue_wait', time.monotonic() - queued_at)
+                    try:
+                        self.store_render(url, result, rendered)
+                    except Exception as e:
+                        print(f"[{datetime.now().strftime('%H:%M:%S')}] Error storing {url}: {str(e)}")
+                        self._mark_failed(url, e)
+                self.storage.flush()
+        
+        def start(target, count, *args):
+            threads = [threading.Thread(target=target, args=args, daemon=True) for _ in range(count)]
+            for thread in threads:
+                thread.start()
+            return threads
+        
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as executor:
+            feeder = start(feed, 1)
+            fetchers = start(fetch, self.threads)
+            parsers = start(parse, self.parse_workers, executor)
+            writers = start(write, self.write_workers)
+            
+            # Shut the stages down in order so nothing is dropped in between
+            for thread in feeder + fetchers:
+                thread.join()
+            for _ in parsers:
+                parse_queue.put(stop)
+            for thread in parsers:
+                thread.join()
+            for _ in writers:
+                write_queue.put(stop)
+            for thread in writers:
+                thread.join()
+        
+        elapsed = time.time() - start_time
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] "
+              f"Pipeline finished: {self.pages_downloaded} pages stored "
+              f"({self.pages_downloaded / max(elapsed, 1e-9):.1f} pages/s)")
+
+    def _crawl_threaded(self, urls, start_time):
+        """Download URLs in batches using the thread pools"""
+        def iter_batches():
+            while True:
+                batch = list(islice(urls, self.batch_size))
+                if not batch:
+                    return
+                yield batch
+        
+        completed_batches = 0
+        
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] "
+              f"Starting downloads with {self.threads} threads in batches of {self.batch_size}...")
+        
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            # Keep a bounded window of batches in flight so URLs are pulled from the sitemap lazily
+            pending = deque()
+            batches = iter_batches()
+            
+            while True:
+                while len(pending) < self.threads * 2:
+                    batch = next(batches, None)
+                    if batch is None:
+                        break
+                    pending.append(executor.submit(self.process_batch, batch, time.monotonic()))
+                if not pending:
+                    break
+                
+                future = pending.popleft()
+                try:
+                    future.result(timeout=120)  # 2 minute timeout per batch
+                    completed_batches += 1
+                except TimeoutError:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Batch {completed_batches + 1} timed out")
+                except Exception as e:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] "
+                          f"Error processing batch {completed_batches + 1}: {str(e)}")
+
+    def process_batch(self, urls, queued_at=None):
+        """Process a batch of URLs in parallel; queued_at is when the batch was handed to the pool"""
         total = len(urls)
         completed = 0
-        
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] Starting batch of {total} URLs")
-        start_time = time.time()
+        queued_at = queued_at or time.monotonic()
         
         with ThreadPoolExecutor(max_workers=self.threads) as executor:
-            futures = [executor.submit(self.download_page, url) for url in urls]
+            futures = [executor.submit(self._dequeued, queued_at, self.download_page, url) for url in urls]
             
             for future in futures:
                 try:
                     future.result()
                     completed += 1
-                    
-                    if completed % 5 == 0 or completed == total:
-                        elapsed = time.time() - start_time
-                        avg_time = elapsed / completed
-                        remaining = (total - completed) * avg_time
-                        print(f"[{datetime.now().strftime('%H:%M:%S')}] "
-                              f"Batch progress: {completed}/{total} URLs "
-                              f"(Avg: {avg_time:.1f}s/URL, "
-                              f"Est. remaining: {remaining:.1f}s)")
-                        
                 except Exception as e:
                     print(f"[{datetime.now().strftime('%H:%M:%S')}] "
                           f"Error processing URL in batch ({completed}/{total}): {str(e)}")
@@ -474,6 +930,35 @@ def main():
     parser.add_argument('--threads', type=int, default=16, help='Number of download threads (default: 16)')
     parser.add_argument('--delay', type=float, default=0.5, help='Delay between downloads in seconds (default: 0.5)')
     parser.add_argument('--output-dir', default='wiki_pages', help='Output directory (default: wiki_pages)')
+    parser.add_argument('--engine', choices=['threads', 'async', 'pipeline'], default='threads',
+                        help='Fetch engine: thread pools, asyncio with pooled keep-alive connections, '
+                             'or fetch/parse/write stages with a process pool for parsing (default: threads)')
+    parser.add_argument('--concurrency', type=int, default=32,
+                        help='Maximum in-flight requests for the async engine (default: 32)')
+    parser.add_argument('--parse-workers', type=int,
+                        help='Parse processes for the pipeline engine (default: CPU count)')
+    parser.add_argument('--write-workers', type=int, default=1,
+                        help='Writer threads for the pipeline engine (default: 1)')
+    parser.add_argument('--queue-size', type=int, default=256,
+                        help='Capacity of each pipeline stage queue (default: 256)')
+    parser.add_argument('--source', choices=['html', 'api'], default='html',
+                        help='Fetch rendered HTML pages, or raw wikitext in bulk through the MediaWiki API (default: html)')
+    parser.add_argument('--api-url', help='MediaWiki api.php endpoint for --source api (default: the wiki\'s api.php)')
+    parser.add_argument('--storage', choices=['files', 'shards'], default='files',
+                        help='Store one file per page, or pack pages into compressed shards (default: files)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only refetch pages whose sitemap lastmod changed, using conditional GETs')
+    parser.add_argument('--base-url',
+                        help='Wiki to crawl, e.g. a local replay_server.py (default: https://oldschool.runescape.wiki)')
+    parser.add_argument('--metrics-port', type=int,
+                        help='Serve Prometheus metrics on http://127.0.0.1:PORT/metrics (default: off)')
+    parser.add_argument('--metrics-interval', type=float, default=10,
+                        help='Seconds between progress lines and metrics.json/metrics.prom rewrites (default: 10)')
+    parser.add_argument('--order', choices=['priority', 'sitemap'], default='priority',
+                        help='Crawl the most valuable URLs first (sitemap priority, lastmod, title, past errors '
+                             'and the PageRank of an earlier link_graph.py run), or in sitemap order (default: priority)')
+    parser.add_argument('--time-budget', type=float,
+                        help='Stop starting new pages after this many minutes (default: no limit)')
     
     args = parser.parse_args()
     
@@ -482,12 +967,34 @@ def main():
     print(f"- Threads: {args.threads}")
     print(f"- Delay: {args.delay} seconds")
     print(f"- Output directory: {args.output_dir}")
+    print(f"- Source: {args.source}")
+    print(f"- Storage: {args.storage}")
+    print(f"- Incremental: {args.incremental}")
+    print(f"- Order: {args.order}" + (f" ({args.time_budget} minute budget)" if args.time_budget else ""))
+    print(f"- Engine: {args.engine}" + (f" ({args.concurrency} in flight)" if args.engine == 'async' else ""))
+    if args.engine == 'pipeline':
+        print(f"- Parse workers: {args.parse_workers or os.cpu_count()}")
+        print(f"- Write workers: {args.write_workers}")
     
     crawler = WikiCrawler(
         output_dir=args.output_dir,
         max_pages=args.max_pages,
         threads=args.threads,
-        delay=args.delay
+        delay=args.delay,
+        engine=args.engine,
+        concurrency=args.concurrency,
+        incremental=args.incremental,
+        storage=args.storage,
+        parse_workers=args.parse_workers,
+        write_workers=args.write_workers,
+        queue_size=args.queue_size,
+        source=args.source,
+        api_url=args.api_url,
+        metrics_port=args.metrics_port,
+        metrics_interval=args.metrics_interval,
+        base_url=args.base_url,
+        order=args.order,
+        time_budget=args.time_budget * 60 if args.time_budget else None
     )
     crawler.crawl()
 
@@ -0,0 +1,56 @@
+import threading
+
+
+class PageManifest:
+    """Per-page record of sitemap lastmod, HTTP validators and content hash for incremental recrawls
+
+    Entries live in the validator columns of the crawl state store and are
+    read from memory; each change is queued to the store's writer thread, so
+    only the changed fields of one URL are written rather than the whole
+    manifest.
+    """
+
+    def __init__(self, state, legacy_path=None):
+        self.state = state
+        self.lock = threading.Lock()
+        if legacy_path:
+            migrated = state.import_manifest_json(legacy_path)
+            if migrated:
+                print(f"Migrated {migrated} manifest entries from {legacy_path}")
+        self.entries = state.load_validators()
+
+    def get(self, url):
+        """Return the manifest entry for a URL, or an empty dict"""
+        with self.lock:
+            return dict(self.entries.get(url, {}))
+
+    def is_stale(self, url, lastmod):
+        """Check whether the sitemap says a page changed since we last fetched it"""
+        with self.lock:
+            entry = self.entries.get(url)
+        if not entry or not lastmod:
+            return True
+        return entry.get('lastmod') != lastmod
+
+    def conditional_headers(self, url):
+        """Build If-None-Match/If-Modified-Since headers from the stored validators"""
+        entry = self.get(url)
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def update(self, url, **fields):
+        """Merge fields into a URL's entry, ignoring empty values, and queue the changes to the store"""
+        with self.lock:
+            entry = self.entries.setdefault(url, {})
+            changed = {k: v for k, v in fields.items() if v is not None and entry.get(k) != v}
+            entry.update(changed)
+        if changed:
+            self.state.update_validators(url, changed)
+
+    def save(self):
+        """Block until every queued change is committed"""
+        self.state.flush()
@@ -0,0 +1,231 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency bucket upper bounds in seconds, roughly log-spaced from 1ms to 2 minutes
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60, 120]
+
+# HELP text of the counters the crawler keeps; others are described by their name
+COUNTER_HELP = {
+    'pages_stored': 'Pages written to storage',
+    'pages_unchanged': 'Pages found unchanged by a 304 or their content hash',
+    'pages_failed': 'Failed page downloads',
+    'retries': 'Retried requests by status code or exception type',
+    'http_errors': 'HTTP error responses by status code',
+}
+
+
+class Histogram:
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Approximate a quantile by interpolating inside its bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'p50': round(self.quantile(0.5), 6),
+            'p90': round(self.quantile(0.9), 6),
+            'p99': round(self.quantile(0.99), 6),
+            'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self.counts)),
+        }
+
+
+class CrawlMetrics:
+    """Counters and per-stage latency histograms, exported as JSON/Prometheus text
+
+    A background thread rewrites metrics.json and metrics.prom every interval
+    and prints one progress line, replacing per-URL logging. An optional local
+    HTTP endpoint serves /metrics (Prometheus) and /metrics.json.
+
+    The queue_wait stage is the time work waits for a free worker: a URL in
+    the threads engine's pool, a fetched page waiting for the async engine's
+    save threads, or a page between two stages of the pipeline engine.
+    """
+
+    def __init__(self, output_dir=None, interval=10, port=None):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.port = port
+        self.lock = threading.Lock()
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # stage -> Histogram
+        self.started = time.time()
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = None
+        self._last_progress = (self.started, 0)
+
+    def inc(self, name, value=1, **labels):
+        """Increment a counter, optionally labelled (e.g. status='429')"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, stage, seconds):
+        """Record one latency sample for a stage"""
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        """Time the enclosed block into a stage histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def counter(self, name):
+        """Total of a counter across all labels"""
+        with self.lock:
+            return sum(value for (n, _), value in self.counters.items() if n == name)
+
+    def snapshot(self):
+        """Current metrics as a JSON-serialisable dict"""
+        with self.lock:
+            counters = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                if labels:
+                    counters.setdefault(name, {})[','.join(f"{k}={v}" for k, v in labels)] = value
+                else:
+                    counters[name] = value
+            return {
+                'timestamp': time.time(),
+                'uptime_seconds': round(time.time() - self.started, 3),
+                'counters': counters,
+                'stages': {stage: h.to_dict() for stage, h in sorted(self.histograms.items())},
+            }
+
+    def to_prometheus(self):
+        """Current metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            described = None
+            for (name, labels), value in sorted(self.counters.items()):
+                if name != described:
+                    described = name
+                    lines.append(f"# HELP crawler_{name} {COUNTER_HELP.get(name, name.replace('_', ' ').capitalize())}")
+                    lines.append(f"# TYPE crawler_{name} counter")
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f"crawler_{name}{{{label_text}}} {value}" if label_text else f"crawler_{name} {value}")
+            if self.histograms:
+                lines.append("# HELP crawler_stage_seconds Time spent in each crawl stage")
+                lines.append("# TYPE crawler_stage_seconds histogram")
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets + ['+Inf'], histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'crawler_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'crawler_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'crawler_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_files(self):
+        """Atomically rewrite metrics.json and metrics.prom"""
+        if not self.output_dir:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        for filename, text in (('metrics.json', json.dumps(self.snapshot(), indent=2)),
+                               ('metrics.prom', self.to_prometheus())):
+            path = os.path.join(self.output_dir, filename)
+            with open(path + '.tmp', 'w') as f:
+                f.write(text)
+            os.replace(path + '.tmp', path)
+
+    def progress_line(self):
+        """One-line crawl summary with the rate since the last line"""
+        stored = self.counter('pages_stored')
+        now = time.time()
+        last_time, last_stored = self._last_progress
+        self._last_progress = (now, stored)
+        rate = (stored - last_stored) / max(now - last_time, 1e-9)
+        with self.lock:
+            fetch = self.histograms.get('fetch')
+            p50 = fetch.quantile(0.5) if fetch else 0.0
+        return (f"[{datetime.now().strftime('%H:%M:%S')}] "
+                f"stored {stored} | unchanged {self.counter('pages_unchanged')} | "
+                f"failed {self.counter('pages_failed')} | retries {self.counter('retries')} | "
+                f"{rate:.1f} pages/s | fetch p50 {p50 * 1000:.0f}ms")
+
+    def _report_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write_files()
+                print(self.progress_line())
+            except Exception as e:
+                print(f"Error writing metrics: {str(e)}")
+
+    def start(self):
+        """Start periodic export and, if a port was given, the HTTP endpoint"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._report_loop, daemon=True)
+        self._thread.start()
+        if self.port:
+            metrics = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.startswith('/metrics.json'):
+                        body, content_type = json.dumps(metrics.snapshot()).encode(), 'application/json'
+                    elif self.path.startswith('/metrics'):
+                        body, content_type = metrics.to_prometheus().encode(), 'text/plain; version=0.0.4'
+                    else:
+                        self.send_error(404)
+                        return
+                    self.send_response(200)
+                    self.send_header('Content-Type', content_type)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            self._server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            print(f"Serving metrics on http://127.0.0.1:{self.port}/metrics")
+
+    def stop(self):
+        """Stop reporting and write the final snapshot"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self.write_files()
+        print(self.progress_line())
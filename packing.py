@@ -0,0 +1,61 @@
+import json
+import re
+
+from boilerplate import estimate_tokens
+
+# Packed documents are labelled "Document 1".."Document n" in the prompt; the model may echo the id as 1, "1" or "Document 1"
+_ID_RE = re.compile(r'(\d+)')
+
+
+class DocumentPacker:
+    """Group small documents into packs that go to the model as one prompt
+
+    Documents are taken in arrival order. One estimated at small_tokens or
+    more is sent alone; smaller ones collect in an open pack, which is
+    handed out once the next document would push it past token_budget or
+    it holds max_documents.
+    """
+
+    def __init__(self, token_budget=1024, max_documents=6, small_tokens=400):
+        self.token_budget = token_budget
+        self.max_documents = max_documents
+        self.small_tokens = min(small_tokens, token_budget)
+        self._pack = []
+        self._tokens = 0
+
+    def add(self, name, content):
+        """Take a document; returns the packs (lists of (name, content)) ready to send"""
+        tokens = estimate_tokens(content)
+        if self.max_documents <= 1 or tokens >= self.small_tokens:
+            return [[(name, content)]]
+        ready = []
+        if self._pack and self._tokens + tokens > self.token_budget:
+            ready.append(self.flush()[0])
+        self._pack.append((name, content))
+        self._tokens += tokens
+        if len(self._pack) >= self.max_documents:
+            ready.extend(self.flush())
+        return ready
+
+    def flush(self):
+        """The open pack, if any, as a list of packs"""
+        pack, self._pack, self._tokens = self._pack, [], 0
+        return [pack] if pack else []
+
+
+def split_packed_response(response, count):
+    """{document number (1-based): [pair dicts]} from a packed JSON response; unusable entries are left out"""
+    result = json.loads(response)
+    documents = result.get('documents', []) if isinstance(result, dict) else []
+    pairs = {}
+    for document in documents:
+        if not isinstance(document, dict):
+            continue
+        match = _ID_RE.search(str(document.get('id', '')))
+        if not match or not 1 <= int(match.group(1)) <= count:
+            continue
+        qa_pairs = [pair for pair in document.get('qa_pairs') or []
+                    if isinstance(pair, dict) and pair.get('question') and pair.get('answer')]
+        if qa_pairs:
+            pairs.setdefault(int(match.group(1)), []).extend(qa_pairs)
+    return pairs
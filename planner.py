@@ -0,0 +1,342 @@
+import argparse
+import glob
+import hashlib
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from frontier import title_weight
+from storage import ShardStorage, safe_filename
+
+# Counted per document with one vectorised str.count over each batch
+FEATURE_PATTERNS = {
+    'words': r'\S+',
+    'infobox_fields': r'(?m)^\*\*[^*\n]+:\*\*',  # "**Key:** value" lines from to_markdown
+    'tables': r'(?m)^\|(?:[ \t]*:?-{3,}:?[ \t]*\|)+[ \t]*$',  # Markdown table separator rows
+    'sections': r'(?m)^## ',
+    'numbers': r'\d[\d,.]*',
+}
+
+# A body left as a redirect: unresolved wikitext, or MediaWiki's rendering of a redirect page
+REDIRECT_PATTERN = r'(?im)^[ \t]*(?:#redirect\b|redirect to:)'
+
+# Lines shorter than this are too generic ("* Members: Yes") to count as duplicated content
+MIN_LINE_CHARS = 40
+
+# Rough request cost: instruction block of the prompt, and the answer per question
+PROMPT_OVERHEAD_TOKENS = 150
+ANSWER_TOKENS = 60
+
+
+def page_title(name):
+    """Wiki title of a document name (file names carry a .md suffix)"""
+    return (name[:-3] if name.endswith('.md') else name).replace(' ', '_')
+
+
+def iter_markdown(markdown_dir=None, shard_dir=None):
+    """Yield (name, content) for every document, named as QAGenerator names them"""
+    if shard_dir:
+        yield from ShardStorage(shard_dir).iter_pages('markdown')
+        return
+    for path in glob.glob(os.path.join(markdown_dir, '*.md')):
+        with open(path, 'r', encoding='utf-8') as f:
+            yield os.path.basename(path), f.read()
+
+
+def document_features(names, contents):
+    """DataFrame of the features of a batch of documents, indexed by name, each column computed in one pass"""
+    text = pd.Series(contents, index=names, dtype=object)
+    frame = pd.DataFrame({'chars': text.str.len()}, index=text.index)
+    for column, pattern in FEATURE_PATTERNS.items():
+        frame[column] = text.str.count(pattern)
+
+    # A redirect fetched through its alias is stored under the alias but headed with its target's title
+    headings = text.str.extract(r'\A#[ \t]+([^\n]*)', expand=False).str.strip().str.replace(' ', '_')
+    titles = pd.Series([page_title(name) for name in names], index=text.index)
+    renamed = headings.notna() & (headings.map(safe_filename, na_action='ignore').str.casefold()
+                                  != titles.str.casefold())
+    frame['redirect'] = (renamed | text.str.contains(REDIRECT_PATTERN)).astype(np.int64)
+
+    # Distinct hashes of each document's longer lines, for the corpus-wide duplicate count
+    lines = text.str.split('\n').explode().str.strip()
+    lines = lines[lines.str.len() >= MIN_LINE_CHARS]
+    hashes = pd.Series(pd.util.hash_pandas_object(lines, index=False).values, index=lines.index)
+    blobs = hashes.groupby(level=0).agg(lambda h: np.unique(h.values).astype('<u8').tobytes())
+    frame['line_hashes'] = blobs.reindex(frame.index).fillna(b'')
+    return frame
+
+
+def duplicate_ratios(line_hashes):
+    """Fraction of each document's distinct longer lines that also occur in another document"""
+    arrays = [np.frombuffer(blob, dtype='<u8') for blob in line_hashes]
+    lengths = np.array([len(array) for array in arrays], dtype=np.int64)
+    if not lengths.sum():
+        return np.zeros(len(arrays))
+    hashes = np.concatenate(arrays)
+    documents = np.repeat(np.arange(len(arrays)), lengths)
+    # Hashes are distinct within a document, so a count above 1 means another document shares the line
+    _, inverse, counts = np.unique(hashes, return_inverse=True, return_counts=True)
+    shared = np.bincount(documents, weights=counts[inverse] > 1, minlength=len(arrays))
+    return shared / np.maximum(lengths, 1)
+
+
+def apportion(total, weights, caps=None):
+    """Split total into integers proportional to weights, none above its cap
+
+    Shares clipped at their cap hand their excess to the rest; fractional
+    remainders go to the largest fractions, ties to the earlier entry, so the
+    same inputs always give the same split.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    caps = np.full(len(weights), np.inf) if caps is None else np.asarray(caps, dtype=np.float64)
+    total = min(total, caps.sum())
+    shares = np.zeros(len(weights))
+    active = caps > 0
+    while active.any():
+        left = total - shares.sum()
+        if left <= 1e-9:
+            break
+        active_weights = np.where(active, weights, 0.0)
+        if active_weights.sum() <= 0:
+            active_weights = active.astype(np.float64)
+        proposal = shares + left * active_weights / active_weights.sum()
+        over = active & (proposal > caps)
+        if not over.any():
+            shares = proposal
+            break
+        shares = np.where(over, caps, shares)
+        active &= ~over
+
+    counts = np.floor(shares + 1e-9).astype(np.int64)
+    remainder = int(round(total - counts.sum()))
+    if remainder > 0:
+        order = np.argsort(-(shares - counts), kind='stable')
+        counts[order[:remainder]] += 1
+    return counts
+
+
+class DocumentStatsIndex:
+    """Features of every markdown document in a SQLite WAL table, recomputed only for changed documents
+
+    A document whose content still hashes the same keeps its stored
+    features, so re-planning a large corpus costs one read of every file and
+    feature extraction for the new or edited ones only. The plan a run of
+    the planner produced is kept alongside.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(stats)")}
+        if columns and 'redirect' not in columns:
+            # Indexed before redirects were detected; the features are a cache, so rebuild them
+            self.conn.execute("DROP TABLE stats")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS stats (
+                name TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                chars INTEGER NOT NULL,
+                words INTEGER NOT NULL,
+                infobox_fields INTEGER NOT NULL,
+                tables INTEGER NOT NULL,
+                sections INTEGER NOT NULL,
+                numbers INTEGER NOT NULL,
+                redirect INTEGER NOT NULL,
+                line_hashes BLOB NOT NULL,
+                indexed_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS plan (
+                name TEXT PRIMARY KEY,
+                questions INTEGER NOT NULL,
+                score REAL NOT NULL,
+                excluded TEXT
+            )
+        """)
+        self.conn.commit()
+
+    def update(self, documents, batch_size=2000):
+        """Index (name, content) pairs, dropping documents no longer present; returns (indexed, unchanged)"""
+        known = dict(self.conn.execute("SELECT name, content_hash FROM stats"))
+        seen = set()
+        indexed = 0
+        batch = []
+
+        def flush():
+            names, hashes, contents = zip(*batch)
+            frame = document_features(list(names), list(contents))
+            now = time.time()
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO stats (name, content_hash, chars, words, infobox_fields, tables, "
+                    "sections, numbers, redirect, line_hashes, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    ((name, content_hash, int(row.chars), int(row.words), int(row.infobox_fields), int(row.tables),
+                      int(row.sections), int(row.numbers), int(row.redirect), row.line_hashes, now)
+                     for (name, content_hash), row in zip(zip(names, hashes), frame.itertuples()))
+                )
+            batch.clear()
+
+        for name, content in documents:
+            seen.add(name)
+            content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+            if known.get(name) == content_hash:
+                continue
+            batch.append((name, content_hash, content))
+            indexed += 1
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+        gone = set(known) - seen
+        if gone:
+            with self.conn:
+                self.conn.executemany("DELETE FROM stats WHERE name = ?", ((name,) for name in gone))
+        return indexed, len(seen) - indexed
+
+    def frame(self):
+        """Every indexed document's features as a DataFrame indexed by name, in name order"""
+        return pd.read_sql_query("SELECT * FROM stats ORDER BY name", self.conn, index_col='name')
+
+    def save_plan(self, plan):
+        with self.conn:
+            self.conn.execute("DELETE FROM plan")
+            self.conn.executemany(
+                "INSERT INTO plan (name, questions, score, excluded) VALUES (?, ?, ?, ?)",
+                ((name, int(row.questions), float(row.score), row.excluded) for name, row in plan.iterrows())
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+def load_plan(path):
+    """{name: questions} of every document a saved plan asks questions about"""
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        return dict(conn.execute("SELECT name, questions FROM plan WHERE questions > 0"))
+    finally:
+        conn.close()
+
+
+def plan_questions(stats, questions=None, tokens=None, min_words=40, max_duplicate=0.8,
+                   words_per_question=80, max_questions=20):
+    """Spread a corpus-wide question and/or token budget over documents; returns a DataFrame by name
+
+    Redirects, stubs, date and disambiguation pages, exact copies and mostly
+    duplicated pages are excluded with a reason. Redirects and copies are set
+    aside before lines are compared, so the page they repeat is not counted as
+    duplicated itself. The rest are scored by their distinct words weighted by
+    title type, fact density and structure; with a token budget the best
+    score per token are kept until it is spent. Every kept document gets
+    at least one question and at most one per words_per_question words (up to
+    max_questions), and the remaining budget follows the score.
+    """
+    plan = pd.DataFrame(index=stats.index)
+    redirect = stats['redirect'].to_numpy().astype(bool)
+    # Of identical pages the first that is not a redirect is the original
+    order = np.argsort(redirect, kind='stable')
+    copies = np.zeros(len(stats), dtype=bool)
+    copies[order] = stats['content_hash'].iloc[order].duplicated(keep='first').to_numpy()
+    dropped = redirect | copies
+    duplicate = np.ones(len(stats))
+    duplicate[~dropped] = duplicate_ratios(stats['line_hashes'][~dropped])
+    weight = np.array([title_weight(page_title(name)) for name in stats.index])
+    words = stats['words'].to_numpy(dtype=np.float64)
+
+    density = np.minimum(stats['numbers'].to_numpy() / np.maximum(words, 1), 0.3)
+    structure = 1 + 0.05 * np.minimum(stats['infobox_fields'], 20) + 0.1 * np.minimum(stats['tables'], 5)
+    # Distinct words times quality, so coverage grows with what a page adds to the corpus
+    plan['score'] = words * (1 - duplicate) * weight * (1 + density) * structure.to_numpy()
+    plan['duplicate'] = duplicate
+
+    excluded = pd.Series(None, index=stats.index, dtype=object)
+    excluded[duplicate >= max_duplicate] = 'duplicate content'
+    excluded[copies] = 'copy of another page'
+    excluded[weight <= 0.2] = 'date or disambiguation page'
+    excluded[(words < min_words)] = 'stub'
+    excluded[redirect] = 'redirect'
+    plan['excluded'] = excluded
+
+    # Prompt plus one answer; chunked pages repeat some context, which this ignores
+    cost = stats['chars'].to_numpy() / 4 + PROMPT_OVERHEAD_TOKENS + ANSWER_TOKENS
+    kept = excluded.isna().to_numpy().copy()
+    if tokens is not None:
+        candidates = np.flatnonzero(kept)
+        order = candidates[np.argsort(-(plan['score'].to_numpy()[candidates] / cost[candidates]), kind='stable')]
+        affordable = order[np.cumsum(cost[order]) <= tokens]
+        over_budget = np.setdiff1d(candidates, affordable)
+        plan.iloc[over_budget, plan.columns.get_loc('excluded')] = 'over token budget'
+        kept[over_budget] = False
+        spare = int((tokens - cost[affordable].sum()) // ANSWER_TOKENS) + len(affordable)
+        questions = spare if questions is None else min(questions, spare)
+    elif questions is None:
+        questions = 2 * int(kept.sum())
+
+    caps = np.clip(words // words_per_question, 1, max_questions)
+    counts = np.zeros(len(plan), dtype=np.int64)
+    selected = np.flatnonzero(kept)
+    if questions < len(selected):
+        # Too few questions for one each: the best scored documents get them
+        best = selected[np.argsort(-plan['score'].to_numpy()[selected], kind='stable')[:questions]]
+        plan.iloc[np.setdiff1d(selected, best), plan.columns.get_loc('excluded')] = 'over question budget'
+        selected = np.sort(best)
+    counts[selected] = 1 + apportion(questions - len(selected), plan['score'].to_numpy()[selected],
+                                     caps[selected] - 1)
+    plan['questions'] = counts
+    return plan
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index markdown document features and plan how many questions each gets')
+    parser.add_argument('--markdown-dir', default='wiki_pages/markdown', help='Directory containing markdown files')
+    parser.add_argument('--shard-dir', help='Read markdown from a packed shard store instead of --markdown-dir')
+    parser.add_argument('--index', default='qa_dataset/doc_stats.sqlite',
+                        help='Feature index and plan file, passed to qa_generator.py --plan (default: qa_dataset/doc_stats.sqlite)')
+    parser.add_argument('--questions', type=int, help='Questions to spread over the corpus (default: two per kept document)')
+    parser.add_argument('--tokens', type=int, help='Estimated prompt and answer tokens the run may spend')
+    parser.add_argument('--min-words', type=int, default=40, help='Exclude documents with fewer words (default: 40)')
+    parser.add_argument('--max-duplicate', type=float, default=0.8,
+                        help='Exclude documents with at least this fraction of lines shared with other pages (default: 0.8)')
+    parser.add_argument('--words-per-question', type=int, default=80,
+                        help='At most one question per this many words (default: 80)')
+    parser.add_argument('--max-questions', type=int, default=20, help='Most questions for one document (default: 20)')
+    parser.add_argument('--batch-size', type=int, default=2000, help='Documents per feature batch (default: 2000)')
+    parser.add_argument('--report', type=int, default=10, metavar='N', help='Show the N documents with most questions (default: 10)')
+    args = parser.parse_args()
+
+    directory = os.path.dirname(args.index)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    index = DocumentStatsIndex(args.index)
+    start = time.time()
+    indexed, unchanged = index.update(iter_markdown(args.markdown_dir, args.shard_dir), args.batch_size)
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Indexed {indexed} documents ({unchanged} unchanged) "
+          f"in {time.time() - start:.1f}s")
+
+    stats = index.frame()
+    plan = plan_questions(stats, args.questions, args.tokens, args.min_words, args.max_duplicate,
+                          args.words_per_question, args.max_questions)
+    index.save_plan(plan)
+    index.close()
+
+    planned = plan[plan['questions'] > 0]
+    prompt_tokens = (stats.loc[planned.index, 'chars'] / 4 + PROMPT_OVERHEAD_TOKENS).sum()
+    print(f"Planned {planned['questions'].sum()} questions over {len(planned)} of {len(plan)} documents "
+          f"(~{(prompt_tokens + planned['questions'].sum() * ANSWER_TOKENS) / 1e6:.2f}M tokens)")
+    for reason, count in plan['excluded'].value_counts().items():
+        print(f"  excluded {count}: {reason}")
+    if args.report:
+        print(planned.sort_values(['questions', 'score'], ascending=False)
+              .head(args.report)[['questions', 'score', 'duplicate']].to_string())
+    print(f"Plan saved to {args.index}")
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,124 @@
 import os
 import json
 import csv
+import random
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 import requests
+from requests.adapters import HTTPAdapter
 import argparse
+from storage import ShardStorage
+from job_ledger import JobLedger, default_owner
+from boilerplate import estimate_tokens
+from chunking import chunk_markdown
+from llm_cache import DEFAULT_MAX_BYTES, LLMCache
+from packing import DocumentPacker, split_packed_response
+from planner import apportion, load_plan
+
+# Ollama server used when neither --endpoint nor OLLAMA_HOST gives one
+DEFAULT_ENDPOINT = 'http://10.0.0.9:11434'
+
+# Worth retrying: the server is busy, restarting or timed out loading a model
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Documents shorter than this many characters are skipped
+MIN_CONTENT_CHARS = 100
+
+def resolve_endpoint(endpoint=None):
+    """Ollama base URL from endpoint, else OLLAMA_HOST as Ollama's own clients read it, else the default"""
+    endpoint = endpoint or os.environ.get('OLLAMA_HOST') or DEFAULT_ENDPOINT
+    # OLLAMA_HOST is often a bare host:port
+    return (endpoint if '://' in endpoint else f"http://{endpoint}").rstrip('/')
 
 class QAGenerator:
-    def __init__(self, markdown_dir, output_dir="qa_dataset", model="mistral"):
+    def __init__(self, markdown_dir, output_dir="qa_dataset", model="mistral", shard_dir=None,
+                 endpoint=None, concurrency=1, timeout=300, max_retries=3, delay=0, cache=None,
+                 cache_max_bytes=DEFAULT_MAX_BYTES, variant='', lease_seconds=600, max_attempts=3,
+                 pack_tokens=1024, pack_size=6, chunk_tokens=1536, plan=None):
         self.markdown_dir = Path(markdown_dir)
+        # Read markdown from a packed shard store instead of markdown_dir when given
+        self.storage = ShardStorage(shard_dir) if shard_dir else None
         self.output_dir = Path(output_dir)
         self.model = model
         self.output_dir.mkdir(exist_ok=True)
         self.output_file = self.output_dir / 'qa_dataset.csv'
         
+        self.endpoint = resolve_endpoint(endpoint)
+        # Requests in flight at once; match the server's OLLAMA_NUM_PARALLEL slots
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.delay = delay  # Pause after each document, per worker
+        
+        # Completions already paid for are answered from disk; a new variant samples them afresh
+        self.cache = LLMCache(cache, cache_max_bytes) if cache else None
+        self.variant = variant
+        
+        # Short documents share one prompt of up to pack_tokens of content; pack_size 1 sends each alone
+        self.pack_tokens = pack_tokens
+        self.pack_size = pack_size
+        # Longer documents are split along their sections into chunks generated in parallel; 0 sends them whole
+        self.chunk_tokens = chunk_tokens
+        
+        # {name: questions} from planner.py; documents it leaves out are not sent at all
+        self.plan = load_plan(plan) if plan else None
+        
+        # One keep-alive connection per worker instead of a new connection per request
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
         # Create CSV file with header if it doesn't exist
         if not self.output_file.exists():
             with open(self.output_file, 'w', newline='', encoding='utf-8') as f:
                 writer = csv.writer(f)
                 writer.writerow(['text'])
+        
+        # Which documents are done, and how much of the CSV they own, so reruns resume
+        self.ledger = JobLedger(str(self.output_dir / 'jobs.sqlite'), self.output_file, lease_seconds, max_attempts)
 
     def query_ollama(self, prompt, temperature=0.7):
-        """Send a query to Ollama API and return the response"""
-        try:
-            response = requests.post(
-                "http://10.0.0.9:11434/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "format": "json",
-                    "options": {
-                        "temperature": temperature
-                    }
-                }
-            )
-            return response.json()["response"]
-        except Exception as e:
-            print(f"Error querying Ollama: {str(e)}")
-            return None
+        """Send a query to Ollama API and return the response, from the cache when it has one"""
+        if self.cache:
+            return self.cache.cached('ollama', self.model, prompt, lambda: self._query_ollama(prompt, temperature),
+                                     temperature, self.variant)
+        return self._query_ollama(prompt, temperature)
+
+    def _query_ollama(self, prompt, temperature):
+        """Send a query to Ollama API, retrying busy or failed requests"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(
+                    f"{self.endpoint}/api/generate",
+                    json={
+                        "model": self.model,
+                        "prompt": prompt,
+                        "stream": False,
+                        "format": "json",
+                        "options": {
+                            "temperature": temperature
+                        }
+                    },
+                    timeout=self.timeout
+                )
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response.json()["response"]
+                error = f"HTTP {response.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = str(e)
+            except Exception as e:
+                print(f"Error querying Ollama: {str(e)}")
+                return None
+            
+            if attempt >= self.max_retries:
+                print(f"Error querying Ollama: {error}")
+                return None
+            backoff = 2 ** attempt
+            print(f"Ollama request failed ({error}), retrying in {backoff}s ({attempt + 1}/{self.max_retries})")
+            time.sleep(backoff)
 
     def assess_document_richness(self, content):
         """Determine number of questions based on document length and content richness"""
@@ -62,14 +142,20 @@ class QAGenerator:
         else:
             base_questions = 3
         
-        # Add slight randomness (±1 question, but stay within 1-6 range)
-        import random
-        variation = random.randint(-1, 1)
+        # Add slight randomness (±1 question, but stay within 1-6 range), seeded by the
+        # document so a rerun builds the same prompt and hits the response cache
+        variation = random.Random(content + self.variant).randint(-1, 1)
         num_questions = max(1, min(3, base_questions + variation))
         
         print(f"Word count: {words} -> {num_questions} questions")
         return num_questions
 
+    def question_count(self, name, content):
+        """Questions to ask about a document: its share of the plan if one is loaded, else by its richness"""
+        if self.plan is not None and name in self.plan:
+            return self.plan[name]
+        return self.assess_document_richness(content)
+
     def generate_qa_pairs(self, content, num_questions):
         """Generate Q&A pairs based on the content"""
         prompt = f"""
@@ -114,22 +200,91 @@ class QAGenerator:
             print(f"Raw response: {response}")
             return []
 
-    def process_file(self, markdown_file):
-        """Process a single markdown file and generate Q&A pairs"""
+    def generate_packed_qa_pairs(self, documents):
+        """Generate Q&A pairs for several documents [(content, num_questions)] in one request
+
+        Returns one list of pairs per document; a document the response left
+        out gets an empty list.
+        """
+        sections = "\n\n".join(
+            f"Document {number} ({num_questions} pair{'s' if num_questions != 1 else ''}):\n{content.strip()}"
+            for number, (content, num_questions) in enumerate(documents, 1)
+        )
+        prompt = f"""
+        Generate question-answer pairs about each of the following video game wiki documents.
+        Return the result in the following JSON format:
+        {{
+            "documents": [
+                {{
+                    "id": <document number>,
+                    "qa_pairs": [
+                        {{
+                            "question": "<question text>",
+                            "answer": "<answer extracted from the text>"
+                        }},
+                        ...
+                    ]
+                }},
+                ...
+            ]
+        }}
+
+        Rules for generation:
+        1. Questions should be specific and test knowledge
+        2. Answers must be direct quotes or close paraphrases from the text of the same document
+        3. Every question must make sense without the other documents
+        4. Generate exactly the number of pairs given for each document
+
+        Documents:
+        {sections}
+        """
+        
+        response = self.query_ollama(prompt, temperature=0.7)
+        if not response:
+            return [[] for _ in documents]
+        
+        try:
+            pairs = split_packed_response(response, len(documents))
+        except Exception as e:
+            print(f"Error parsing packed response: {str(e)}")
+            print(f"Raw response: {response}")
+            return [[] for _ in documents]
+        return [[f"question: {pair['question']}\nanswer: {pair['answer']}" for pair in pairs.get(number, [])]
+                for number in range(1, len(documents) + 1)]
+
+    def list_documents(self):
+        """Names of every markdown document, in the order they are stored"""
+        if self.storage:
+            return self.storage.titles('markdown')
+        return [md_file.name for md_file in self.markdown_dir.glob('*.md')]
+
+    def read_document(self, name):
+        """Return the markdown content of a document"""
+        if self.storage:
+            return self.storage.read(name, 'markdown')
+        with open(self.markdown_dir / name, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def iter_documents(self):
+        """Yield (name, content) for every document, reading shards sequentially"""
+        if self.storage:
+            yield from self.storage.iter_pages('markdown')
+            return
+        for name in self.list_documents():
+            yield name, self.read_document(name)
+
+    def process_document(self, name, content):
+        """Process a single markdown document and generate Q&A pairs"""
         try:
-            # Read markdown content
-            with open(markdown_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
             # Skip if content is too short
-            if len(content.strip()) < 100:
-                print(f"Skipping {markdown_file.name} - content too short")
+            if len(content.strip()) < MIN_CONTENT_CHARS:
+                print(f"Skipping {name} - content too short")
                 return []
             
-            print(f"\nProcessing {markdown_file.name}")
+            print(f"\nProcessing {name}")
             
             # Assess document richness
-            num_questions = self.assess_document_richness(content)
+            num_questions = self.question_count(name, content)
             print(f"Generating {num_questions} questions...")
             
             # Generate Q&A pairs
@@ -139,37 +294,148 @@ class QAGenerator:
             return qa_pairs
             
         except Exception as e:
-            print(f"Error processing {markdown_file}: {str(e)}")
+            print(f"Error processing {name}: {str(e)}")
             return []
 
-    def save_qa_pairs(self, qa_pairs):
-        """Save Q&A pairs to CSV file"""
-        with open(self.output_file, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            for pair in qa_pairs:
-                writer.writerow([pair])
+    def _generate(self, name, content):
+        """Worker task: (ledger state, Q&A pairs) for one document, then the optional pause"""
+        if len(content.strip()) < MIN_CONTENT_CHARS:
+            print(f"Skipping {name} - content too short")
+            return 'skipped', []
+        qa_pairs = self.process_document(name, content)
+        if self.delay:
+            time.sleep(self.delay)
+        return ('done' if qa_pairs else 'failed'), qa_pairs
 
-    def generate_dataset(self):
-        """Process all markdown files and generate the dataset"""
-        total_pairs = 0
+    def _generate_pack(self, pack):
+        """Worker task: [(name, ledger state, Q&A pairs)] for a pack of documents answered by one request"""
+        if len(pack) == 1:
+            name, content = pack[0]
+            return [(name, *self._generate(name, content))]
         
-        # Get list of markdown files
-        markdown_files = list(self.markdown_dir.glob('*.md'))
-        print(f"Found {len(markdown_files)} markdown files")
+        names = ', '.join(name for name, _ in pack)
+        print(f"\nProcessing {len(pack)} documents in one request: {names}")
+        documents = [(content, self.question_count(name, content)) for name, content in pack]
+        try:
+            packed_pairs = self.generate_packed_qa_pairs(documents)
+        except Exception as e:
+            print(f"Error processing {names}: {str(e)}")
+            packed_pairs = [[] for _ in pack]
+        if self.delay:
+            time.sleep(self.delay)
         
-        # Process each file
-        for md_file in markdown_files:
-            qa_pairs = self.process_file(md_file)
+        results = []
+        for (name, content), qa_pairs in zip(pack, packed_pairs):
             if qa_pairs:
-                self.save_qa_pairs(qa_pairs)
-                total_pairs += len(qa_pairs)
-                print(f"Saved {len(qa_pairs)} pairs to {self.output_file}")
-            
-            # Add delay to be nice to Ollama
-            time.sleep(1)
+                results.append((name, 'done', qa_pairs))
+            else:
+                # Left out of the packed answer: ask for this document on its own
+                results.append((name, *self._generate(name, content)))
+        print(f"Generated {sum(len(qa_pairs) for _, _, qa_pairs in results)} Q&A pairs for {len(pack)} documents")
+        return results
+
+    def _generate_chunk(self, name, number, total, chunk, num_questions=None):
+        """Worker task: [(name, ledger state, Q&A pairs)] for one chunk of a long document"""
+        print(f"\nProcessing {name} part {number}/{total}")
+        try:
+            qa_pairs = self.generate_qa_pairs(chunk, num_questions or self.assess_document_richness(chunk))
+        except Exception as e:
+            print(f"Error processing {name} part {number}/{total}: {str(e)}")
+            qa_pairs = []
+        if self.delay:
+            time.sleep(self.delay)
+        return [(name, 'done' if qa_pairs else 'failed', qa_pairs)]
+
+    def generate_dataset(self):
+        """Process the markdown files the ledger has not finished, concurrency requests at a time"""
+        names = self.list_documents()
+        self.ledger.add(names)
+        finished = self.ledger.finished()
+        remaining = set(names) - finished
+        if self.plan is not None:
+            remaining &= set(self.plan)
+        print(f"Found {len(names)} markdown files, {len(remaining)} left to process")
+        
+        owner = default_owner()
+        total_pairs = 0
+        states = {'done': 0, 'failed': 0, 'skipped': 0}
+        start_time = time.time()
+        
+        # Documents are read lazily and at most concurrency * 2 wait in memory;
+        # only this thread commits output
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                pending = {}
+                
+                packer = DocumentPacker(self.pack_tokens, self.pack_size)
+                # name -> {'left': chunks outstanding, 'pairs': {chunk number: pairs}, 'failed': chunks failed}
+                chunked = {}
+                
+                def record(done):
+                    nonlocal total_pairs
+                    for future in done:
+                        number = pending.pop(future)
+                        for name, state, qa_pairs in future.result():
+                            if number is not None:
+                                # A chunked document is committed once, with its chunks in page order
+                                parts = chunked[name]
+                                parts['left'] -= 1
+                                parts['pairs'][number] = qa_pairs
+                                parts['failed'] += state == 'failed'
+                                if parts['left']:
+                                    continue
+                                del chunked[name]
+                                # Any failed chunk fails the page; a retry gets the others from the cache
+                                state = 'failed' if parts['failed'] else 'done'
+                                qa_pairs = [pair for n in sorted(parts['pairs']) for pair in parts['pairs'][n]]
+                            states[state] += 1
+                            if state == 'skipped':
+                                self.ledger.skip(name, 'content too short')
+                            elif state == 'failed':
+                                self.ledger.fail(name, 'no Q&A pairs generated')
+                            elif self.ledger.commit(name, [[pair] for pair in qa_pairs]):
+                                total_pairs += len(qa_pairs)
+                                print(f"Saved {len(qa_pairs)} pairs from {name} to {self.output_file}")
+                
+                def submit(fn, *args, number=None):
+                    pending[executor.submit(fn, *args)] = number
+                    if len(pending) >= self.concurrency * 2:
+                        record(wait(pending, return_when=FIRST_COMPLETED).done)
+                
+                for name, content in self.iter_documents():
+                    if name not in remaining or not self.ledger.claim(name, owner):
+                        continue
+                    if len(content.strip()) < MIN_CONTENT_CHARS:
+                        submit(self._generate_pack, [(name, content)])
+                    elif self.chunk_tokens and estimate_tokens(content) > self.chunk_tokens:
+                        chunks = list(enumerate(chunk_markdown(content, self.chunk_tokens), 1))
+                        total = len(chunks)
+                        counts = [None] * total
+                        if self.plan is not None and name in self.plan:
+                            # The planned questions follow chunk length; chunks left without any are not sent
+                            counts = apportion(self.plan[name], [estimate_tokens(chunk) for _, chunk in chunks])
+                            chunks, counts = zip(*[(chunk, int(count)) for chunk, count in zip(chunks, counts) if count])
+                        chunked[name] = {'left': len(chunks), 'pairs': {}, 'failed': 0}
+                        for (number, chunk), count in zip(chunks, counts):
+                            submit(self._generate_chunk, name, number, total, chunk, count, number=number)
+                    else:
+                        for pack in packer.add(name, content):
+                            submit(self._generate_pack, pack)
+                for pack in packer.flush():
+                    submit(self._generate_pack, pack)
+                record(wait(pending).done)
+        finally:
+            # Hand back anything still leased so a restart takes it at once
+            self.ledger.release(owner)
         
+        elapsed = time.time() - start_time
+        documents = sum(states.values())
         print(f"\nDataset generation complete!")
+        print(f"Processed {documents} documents in {elapsed:.1f}s ({documents / max(elapsed, 1e-9):.2f} docs/s): "
+              f"{states['done']} done, {states['failed']} failed, {states['skipped']} skipped")
         print(f"Total Q&A pairs generated: {total_pairs}")
+        if self.cache:
+            print(f"Response cache: {self.cache.hits} hits, {self.cache.misses} misses ({self.cache.path})")
         print(f"Saved to: {self.output_file}")
 
 def main():
@@ -180,13 +446,60 @@ def main():
                       help='Output directory for dataset')
     parser.add_argument('--model', default='mistral',
                       help='Ollama model to use')
+    parser.add_argument('--shard-dir',
+                      help='Read markdown from a packed shard store (e.g. wiki_pages/shards) instead of --markdown-dir')
+    parser.add_argument('--endpoint',
+                      help=f'Ollama server URL (default: $OLLAMA_HOST or {DEFAULT_ENDPOINT})')
+    parser.add_argument('--concurrency', type=int, default=1,
+                      help='Requests in flight at once; set to the server\'s OLLAMA_NUM_PARALLEL (default: 1)')
+    parser.add_argument('--timeout', type=float, default=300,
+                      help='Seconds to wait for one generation (default: 300)')
+    parser.add_argument('--retries', type=int, default=3,
+                      help='Retries for timed out, refused or busy (429/5xx) requests (default: 3)')
+    parser.add_argument('--delay', type=float, default=0,
+                      help='Seconds each worker pauses after a document (default: 0)')
+    parser.add_argument('--cache',
+                      help='Response cache file (default: <output-dir>/llm_cache.sqlite)')
+    parser.add_argument('--no-cache', action='store_true',
+                      help='Query the model for every prompt, even ones answered before')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                      help='Evict least recently used responses past this many MB (default: 1024)')
+    parser.add_argument('--variant', default='',
+                      help='Tag mixed into cache keys; change it to sample fresh completions')
+    parser.add_argument('--pack-tokens', type=int, default=1024,
+                      help='Content tokens several short documents may share one prompt with; keep prompt '
+                           'and answer within the model\'s num_ctx (default: 1024)')
+    parser.add_argument('--pack-size', type=int, default=6,
+                      help='Most documents in one prompt; 1 sends every document alone (default: 6)')
+    parser.add_argument('--chunk-tokens', type=int, default=1536,
+                      help='Split documents longer than this along their sections into chunks generated '
+                           'in parallel; 0 sends every document whole (default: 1536)')
+    parser.add_argument('--plan',
+                      help='Question plan from planner.py (e.g. qa_dataset/doc_stats.sqlite); documents '
+                           'it excludes are skipped and the rest get its question counts')
+    parser.add_argument('--max-attempts', type=int, default=3,
+                      help='Runs a failing document is retried in before it is left failed (default: 3)')
     
     args = parser.parse_args()
     
     generator = QAGenerator(
         markdown_dir=args.markdown_dir,
         output_dir=args.output_dir,
-        model=args.model
+        model=args.model,
+        shard_dir=args.shard_dir,
+        endpoint=args.endpoint,
+        concurrency=args.concurrency,
+        timeout=args.timeout,
+        max_retries=args.retries,
+        delay=args.delay,
+        cache=None if args.no_cache else args.cache or os.path.join(args.output_dir, 'llm_cache.sqlite'),
+        cache_max_bytes=args.cache_size * 1024 * 1024,
+        variant=args.variant,
+        max_attempts=args.max_attempts,
+        pack_tokens=args.pack_tokens,
+        pack_size=args.pack_size,
+        chunk_tokens=args.chunk_tokens,
+        plan=args.plan
     )
     generator.generate_dataset()
 
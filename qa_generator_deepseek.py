@@ -2,33 +2,39 @@ import os
 import time
 import concurrent.futures
 from deepseek import DeepSeek
-from qa_generator import QAGenerator
+from job_ledger import default_owner
+from qa_generator import MIN_CONTENT_CHARS, QAGenerator
 from queue import Empty
-from multiprocessing import Queue, Process, Lock
+from multiprocessing import Queue, Process
 from statistics import mean
 
 class DeepseekQAGenerator(QAGenerator):
-    def __init__(self, markdown_dir, output_dir="qa_dataset_deepseek", process_count=4, threads_per_process=8):
-        super().__init__(markdown_dir, output_dir, model="deepseek")
+    def __init__(self, markdown_dir, output_dir="qa_dataset_deepseek", process_count=4, threads_per_process=8,
+                 shard_dir=None, cache=None, variant=''):
+        super().__init__(markdown_dir, output_dir, model="deepseek", shard_dir=shard_dir, cache=cache,
+                         variant=variant)
         self.process_count = process_count
         self.threads_per_process = threads_per_process
-        self.output_lock = Lock()
         self.batch_times = []
         self.file_times = []
 
     def worker_process(self, file_queue: Queue, output_queue: Queue):
         """Worker process that manages a thread pool for processing files"""
-        deepseek = DeepSeek()  # Each process needs its own DeepSeek instance
+        deepseek = DeepSeek(self.cache, self.variant)  # Each process needs its own DeepSeek instance
+        owner = self.run_owner
         
         def process_single_file(md_file):
+            """(md_file, ledger state, pairs, seconds, error); every queued file reports back exactly once"""
+            start_time = time.time()
+            # Another run may hold the lease or have finished the file since it was queued
+            if not self.ledger.claim(md_file, owner):
+                return md_file, 'leased', [], 0.0, None
             try:
-                start_time = time.time()
-                with open(md_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
+                content = self.read_document(md_file)
                 
-                if len(content.strip()) < 100:
-                    print(f"Skipping {md_file.name} - content too short")
-                    return None
+                if len(content.strip()) < MIN_CONTENT_CHARS:
+                    print(f"Skipping {md_file} - content too short")
+                    return md_file, 'skipped', [], time.time() - start_time, 'content too short'
                 
                 num_questions = self.assess_document_richness(content)
                 result = deepseek.generate_qa_pairs(content, num_questions)
@@ -38,23 +44,32 @@ class DeepseekQAGenerator(QAGenerator):
                     pairs.append(f"question: {pair['question']}\nanswer: {pair['answer']}")
                 
                 processing_time = time.time() - start_time
-                return md_file, pairs, processing_time
+                if not pairs:
+                    return md_file, 'failed', [], processing_time, 'no Q&A pairs generated'
+                return md_file, 'done', pairs, processing_time, None
                 
             except Exception as e:
                 print(f"Error processing {md_file}: {str(e)}")
-                return None
+                return md_file, 'failed', [], time.time() - start_time, str(e)
 
         with concurrent.futures.ThreadPoolExecutor(max_workers=self.threads_per_process) as executor:
             while True:
                 try:
                     batch_start_time = time.time()
-                    # Get a batch of files to process
+                    # Get a batch of files to process. The first get blocks: get_nowait can
+                    # report Empty before the parent's feeder thread has flushed the queue,
+                    # so the end of the work is marked by a None per process instead
                     files = []
-                    for _ in range(self.threads_per_process):
+                    last_batch = False
+                    while len(files) < self.threads_per_process:
                         try:
-                            files.append(file_queue.get_nowait())
+                            md_file = file_queue.get_nowait() if files else file_queue.get()
                         except Empty:
                             break
+                        if md_file is None:
+                            last_batch = True
+                            break
+                        files.append(md_file)
                     
                     if not files:
                         break
@@ -69,36 +84,40 @@ class DeepseekQAGenerator(QAGenerator):
                     batch_results = []
                     for future in concurrent.futures.as_completed(future_to_file):
                         result = future.result()
-                        if result:
+                        output_queue.put(result)
+                        if result[1] == 'done':
                             batch_results.append(result)
-                            output_queue.put(result)
 
                     if batch_results:
                         batch_time = time.time() - batch_start_time
                         output_queue.put(("BATCH_TIME", batch_time, len(batch_results)))
+                    if last_batch:
+                        break
 
                 except Empty:
                     break
                 except Exception as e:
                     print(f"Error in worker process: {str(e)}")
 
-    def save_qa_pairs_safe(self, qa_pairs):
-        """Thread-safe method to save Q&A pairs"""
-        with self.output_lock:
-            self.save_qa_pairs(qa_pairs)
-
     def generate_dataset(self):
-        """Process all markdown files using multiple processes and threads"""
-        markdown_files = list(self.markdown_dir.glob('*.md'))
-        print(f"Found {len(markdown_files)} markdown files")
+        """Process the markdown files the ledger has not finished using multiple processes and threads"""
+        all_files = self.list_documents()
+        self.ledger.add(all_files)
+        finished = self.ledger.finished()
+        markdown_files = [md_file for md_file in all_files if md_file not in finished]
+        print(f"Found {len(all_files)} markdown files, {len(markdown_files)} left to process")
+        # Worker processes lease files under this run's id
+        self.run_owner = default_owner()
 
         # Create queues for input files and output results
         file_queue = Queue()
         output_queue = Queue()
 
-        # Put all files in the queue
+        # Put all files in the queue, then one end marker per worker
         for md_file in markdown_files:
             file_queue.put(md_file)
+        for _ in range(self.process_count):
+            file_queue.put(None)
 
         # Start worker processes
         processes = []
@@ -110,6 +129,7 @@ class DeepseekQAGenerator(QAGenerator):
         # Track progress and save results
         total_pairs = 0
         completed_files = 0
+        leased_files = 0
         total_files = len(markdown_files)
         start_time = time.time()
 
@@ -124,26 +144,37 @@ class DeepseekQAGenerator(QAGenerator):
                     print(f"Batch completed: {batch_size} files in {batch_time:.2f}s "
                           f"(avg: {avg_time_per_file:.2f}s per file)")
                 else:
-                    md_file, qa_pairs, processing_time = result
-                    if qa_pairs:
-                        self.save_qa_pairs_safe(qa_pairs)
-                        total_pairs += len(qa_pairs)
-                        completed_files += 1
-                        self.file_times.append(processing_time)
+                    # Every file counts once whatever its outcome, so the loop ends on its own
+                    md_file, state, qa_pairs, processing_time, error = result
+                    completed_files += 1
+                    if state == 'done':
+                        if self.ledger.commit(md_file, [[pair] for pair in qa_pairs]):
+                            total_pairs += len(qa_pairs)
+                            self.file_times.append(processing_time)
+                            print(f"Progress: {completed_files}/{total_files} files | "
+                                  f"Saved {len(qa_pairs)} pairs from {md_file} "
+                                  f"({processing_time:.2f}s)")
+                    elif state == 'skipped':
+                        self.ledger.skip(md_file, error)
+                    elif state == 'failed':
+                        self.ledger.fail(md_file, error)
+                        print(f"Progress: {completed_files}/{total_files} files | Failed {md_file}: {error}")
+                    elif state == 'leased':
+                        leased_files += 1
                         print(f"Progress: {completed_files}/{total_files} files | "
-                              f"Saved {len(qa_pairs)} pairs from {md_file.name} "
-                              f"({processing_time:.2f}s)")
+                              f"Skipped {md_file}, leased by another run")
             except Empty:
-                # Check if all processes are done
+                # Only reached if a worker process died without reporting its files
                 if all(not p.is_alive() for p in processes):
                     break
             except Exception as e:
                 print(f"Error processing results: {str(e)}")
-                completed_files += 1
 
         # Wait for all processes to complete
         for p in processes:
             p.join()
+        # Files of a worker that died stay leased; hand them back so a restart takes them at once
+        self.ledger.release(self.run_owner)
 
         total_time = time.time() - start_time
         
@@ -151,6 +182,10 @@ class DeepseekQAGenerator(QAGenerator):
         print(f"\nDataset generation complete!")
         print(f"Total time: {total_time:.2f}s")
         print(f"Total Q&A pairs generated: {total_pairs}")
+        if leased_files:
+            print(f"Skipped {leased_files} files leased by another run")
+        if self.cache:
+            print(f"Response cache: {self.cache.path}")
         if self.file_times:
             print(f"Average time per file: {mean(self.file_times):.2f}s")
         if self.batch_times:
@@ -172,6 +207,14 @@ def main():
                       help='Number of threads per process')
     parser.add_argument('--env', default='deepseek.env',
                       help='Path to the environment file')
+    parser.add_argument('--shard-dir',
+                      help='Read markdown from a packed shard store (e.g. wiki_pages/shards) instead of --markdown-dir')
+    parser.add_argument('--cache',
+                      help='Response cache file (default: <output-dir>/llm_cache.sqlite)')
+    parser.add_argument('--no-cache', action='store_true',
+                      help='Query DeepSeek for every prompt, even ones answered before')
+    parser.add_argument('--variant', default='',
+                      help='Tag mixed into cache keys; change it to sample fresh completions')
     
     args = parser.parse_args()
     with open(args.env, 'r') as f:
@@ -181,7 +224,10 @@ def main():
         markdown_dir=args.markdown_dir,
         output_dir=args.output_dir,
         process_count=args.processes,
-        threads_per_process=args.threads_per_process
+        threads_per_process=args.threads_per_process,
+        shard_dir=args.shard_dir,
+        cache=None if args.no_cache else args.cache or os.path.join(args.output_dir, 'llm_cache.sqlite'),
+        variant=args.variant
     )
     generator.generate_dataset()
 
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """Process-wide token bucket shared by every worker thread and coroutine"""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = rate  # Tokens added per second
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token and return how many seconds the caller must wait before using it"""
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Going negative queues the caller behind everyone who reserved before it
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        """Block the calling thread until a token is available"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        """Wait on the event loop until a token is available"""
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on the number of requests in flight across all workers"""
+
+    def __init__(self, initial, minimum=1, maximum=None, increase=1.0, decrease=0.5, cooldown=2.0,
+                 clock=time.monotonic):
+        self.minimum = minimum
+        self.maximum = maximum if maximum is not None else initial
+        self.limit = float(max(minimum, min(initial, self.maximum)))
+        self.increase = increase  # Added to the limit per limit-worth of healthy responses
+        self.decrease = decrease  # Multiplier applied when the server pushes back
+        self.cooldown = cooldown  # Seconds between decreases so one burst of errors counts once
+        self.clock = clock
+        self.in_flight = 0
+        self._last_decrease = float('-inf')
+        self.condition = threading.Condition()
+
+    def try_acquire(self):
+        """Claim a slot if one is free"""
+        with self.condition:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        """Block the calling thread until a slot is free"""
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        """Wait on the event loop until a slot is free"""
+        while not self.try_acquire():
+            await asyncio.sleep(0.05)
+
+    def release(self):
+        """Return a slot to the pool"""
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def on_success(self):
+        """Grow the limit additively while responses stay healthy"""
+        with self.condition:
+            self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+            self.condition.notify_all()
+
+    def on_throttle(self):
+        """Shrink the limit multiplicatively on 429s and server errors"""
+        with self.condition:
+            now = self.clock()
+            if now - self._last_decrease < self.cooldown:
+                return
+            self._last_decrease = now
+            previous = self.limit
+            self.limit = max(self.minimum, self.limit * self.decrease)
+        print(f"Throttled by server, concurrency limit {previous:.1f} -> {self.limit:.1f}")
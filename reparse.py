@@ -0,0 +1,204 @@
+import argparse
+import hashlib
+import io
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import wiki_parser
+import wikitext_parser
+from corpus_util import STREAMING_THRESHOLD, bounded_map
+from storage import open_storage
+from stream_parser import stream_wiki_page
+
+# Parser version of each stored source kind; bumping one re-renders only pages of that kind
+PARSER_VERSIONS = {
+    'html': wiki_parser.PARSER_VERSION,
+    'wikitext': wikitext_parser.PARSER_VERSION,
+}
+
+
+def render_markdown(title, kind, source):
+    """Render one stored page's source to markdown the way the crawler does"""
+    if kind == 'wikitext':
+        return wikitext_parser.parse_wikitext(title.replace('_', ' '), source)
+    if len(source) > STREAMING_THRESHOLD:
+        markdown = io.StringIO()
+        stream_wiki_page(source, markdown)
+        return markdown.getvalue()
+    return wiki_parser.parse_wiki_page(source)
+
+
+def render_batch(batch):
+    """Render a batch of (title, kind, source_hash, source) in a worker process"""
+    results = []
+    for title, kind, source_hash, source in batch:
+        try:
+            results.append((title, kind, source_hash, render_markdown(title, kind, source), None))
+        except Exception as e:
+            results.append((title, kind, source_hash, None, str(e)))
+    return results
+
+
+class ParseCache:
+    """The (source hash, parser version) each stored page's markdown was last rendered from
+
+    A page whose stored source still hashes the same and whose parser version
+    has not been bumped already has up-to-date markdown and is skipped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS renders (
+                title TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                source_hash TEXT NOT NULL,
+                parser_version INTEGER NOT NULL,
+                rendered_at REAL NOT NULL,
+                PRIMARY KEY (title, kind)
+            )
+        """)
+        self.conn.commit()
+
+    def load(self):
+        """Return {(title, kind): (source_hash, parser_version)}"""
+        rows = self.conn.execute("SELECT title, kind, source_hash, parser_version FROM renders")
+        return {(title, kind): (source_hash, version) for title, kind, source_hash, version in rows}
+
+    def record(self, entries):
+        """Record [(title, kind, source_hash, parser_version)] in one transaction"""
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO renders (title, kind, source_hash, parser_version, rendered_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                ((title, kind, source_hash, version, now) for title, kind, source_hash, version in entries)
+            )
+
+    def clear(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM renders")
+
+    def close(self):
+        self.conn.close()
+
+
+class Reparser:
+    """Re-render the markdown of every stored page across a process pool
+
+    The main process reads sources sequentially from the store and hashes them;
+    workers only parse. Results are written back one batch at a time and the
+    cache is updated after the batch is flushed, so an interrupted run never
+    marks a page as rendered when its markdown did not reach the disk.
+    """
+
+    def __init__(self, output_dir="wiki_pages", storage=None, workers=None, batch_size=64,
+                 force=False, kinds=('html', 'wikitext'), limit=None):
+        self.output_dir = output_dir
+        self.storage = open_storage(output_dir, storage)
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.force = force
+        self.kinds = kinds
+        self.limit = limit
+        self.cache = ParseCache(os.path.join(output_dir, 'parse_cache.sqlite'))
+        self.rendered = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def _stale_batches(self):
+        """Yield batches of pages whose markdown is missing or out of date"""
+        cached = {} if self.force else self.cache.load()
+        batch = []
+        queued = 0
+        for kind in self.kinds:
+            for title, source in self.storage.iter_pages(kind):
+                if self.limit is not None and queued >= self.limit:
+                    break
+                source_hash = hashlib.sha256(source.encode('utf-8')).hexdigest()
+                if (cached.get((title, kind)) == (source_hash, PARSER_VERSIONS[kind])
+                        and self.storage.has_page(title, ('markdown',))):
+                    self.skipped += 1
+                    continue
+                batch.append((title, kind, source_hash, source))
+                queued += 1
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _store(self, results):
+        """Write one batch of markdown, then record it in the cache"""
+        done = []
+        for title, kind, source_hash, markdown, error in results:
+            if error is not None:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Error rendering {title}: {error}")
+                self.failed += 1
+                continue
+            self.storage.write_page(title, {'markdown': markdown})
+            done.append((title, kind, source_hash, PARSER_VERSIONS[kind]))
+        self.storage.flush()
+        self.cache.record(done)
+        self.rendered += len(done)
+
+    def run(self):
+        """Render every stale page and return (rendered, skipped, failed)"""
+        start = time.time()
+        last_report = start
+        if self.force:
+            self.cache.clear()
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                # Keep a couple of batches per worker in flight so sources never pile up in memory
+                for results in bounded_map(executor, render_batch, self._stale_batches(), self.workers * 2):
+                    self._store(results)
+                    if time.time() - last_report >= 10:
+                        last_report = time.time()
+                        print(f"[{datetime.now().strftime('%H:%M:%S')}] Rendered {self.rendered} pages, "
+                              f"{self.skipped} unchanged, {self.failed} failed")
+        finally:
+            self.storage.close()
+            self.cache.close()
+
+        elapsed = time.time() - start
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Rendered {self.rendered} pages in {elapsed:.1f}s "
+              f"({self.rendered / max(elapsed, 1e-9):.1f} pages/s), {self.skipped} unchanged, {self.failed} failed")
+        return self.rendered, self.skipped, self.failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-render stored pages to markdown after a parser change')
+    parser.add_argument('--output-dir', default='wiki_pages', help='Crawl output directory (default: wiki_pages)')
+    parser.add_argument('--storage', choices=['files', 'shards'],
+                        help='Storage backend of the crawl (default: detected)')
+    parser.add_argument('--workers', type=int, help='Parse processes (default: one per CPU)')
+    parser.add_argument('--batch-size', type=int, default=64,
+                        help='Pages per worker task and per write batch (default: 64)')
+    parser.add_argument('--kind', choices=['html', 'wikitext'], action='append',
+                        help='Only re-render pages stored as this source kind; repeatable (default: both)')
+    parser.add_argument('--force', action='store_true', help='Ignore the parse cache and re-render everything')
+    parser.add_argument('--limit', type=int, help='Re-render at most this many pages')
+    args = parser.parse_args()
+
+    reparser = Reparser(
+        output_dir=args.output_dir,
+        storage=args.storage,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        force=args.force,
+        kinds=tuple(args.kind or ('html', 'wikitext')),
+        limit=args.limit
+    )
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Re-rendering {args.output_dir} with "
+          f"{reparser.workers} workers (parser versions: {PARSER_VERSIONS})")
+    reparser.run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+from bs4 import BeautifulSoup
+
+from sitemap import SITEMAP_NS
+
+
+def load_pages(pages_dir):
+    """Load saved pages as {title: html}, one file per page named after its title"""
+    pages = {}
+    for name in sorted(os.listdir(pages_dir)):
+        if not name.endswith('.html'):
+            continue
+        with open(os.path.join(pages_dir, name), 'r', encoding='utf-8') as f:
+            html = f.read()
+        # Crawler output keeps only div#content, so wrap it back into a full document
+        if '<body' not in html:
+            html = f"<!DOCTYPE html>\n<html><head><meta charset=\"UTF-8\"></head><body>\n{html}\n</body></html>\n"
+        pages[name[:-len('.html')]] = html
+    return pages
+
+
+def normalise_title(title):
+    """A title as MediaWiki normalises it: spaces for underscores and an upper case first letter"""
+    title = ' '.join(title.replace('_', ' ').split())
+    return title[:1].upper() + title[1:]
+
+
+def html_to_wikitext(title, html):
+    """Rough wikitext of a saved page, its headings, paragraphs and list items, for the API to serve"""
+    soup = BeautifulSoup(html, 'lxml')
+    content = soup.find('div', class_='mw-parser-output') or soup.body or soup
+    lines = [f"'''{normalise_title(title)}''' is a page replayed from saved fixtures."]
+    for element in content.find_all(['h2', 'h3', 'p', 'li']):
+        text = ' '.join(element.get_text(' ', strip=True).replace('[edit]', '').split())
+        if not text:
+            continue
+        if element.name == 'h2':
+            lines += ['', f"== {text} =="]
+        elif element.name == 'h3':
+            lines += ['', f"=== {text} ==="]
+        elif element.name == 'li':
+            lines.append(f"* {text}")
+        else:
+            lines += ['', text]
+    return '\n'.join(lines) + '\n'
+
+
+class ReplayServer:
+    """Local HTTP server replaying a fixture corpus behind a synthetic sitemap
+
+    Serves /images/sitemaps/index.xml, one NS_0-0.xml.gz shard, /w/<title>
+    pages and an /api.php answering action=query for revisions (with
+    normalized and redirects), the same layout the crawler expects from the
+    live wiki. Redirect titles are listed in the sitemap as well. Latency,
+    429s, 5xx responses and slow bodies can be injected at configurable rates;
+    a fixed seed keeps fault sequences reproducible between runs.
+    """
+
+    def __init__(self, pages_dir='fixtures/pages', host='127.0.0.1', port=0, copies=1,
+                 latency=0.0, jitter=0.0, error_429_rate=0.0, error_5xx_rate=0.0,
+                 slow_body_rate=0.0, slow_body_seconds=1.0, seed=0, redirects=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_429_rate = error_429_rate
+        self.error_5xx_rate = error_5xx_rate
+        self.slow_body_rate = slow_body_rate
+        self.slow_body_seconds = slow_body_seconds
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {}  # status code -> responses sent
+
+        # Each fixture is served under `copies` titles to scale the corpus up
+        fixtures = load_pages(pages_dir)
+        if not fixtures:
+            raise ValueError(f"No .html pages found in {pages_dir}")
+        self.pages = {}
+        self.wikitext = {}  # normalised title -> wikitext served by api.php
+        for copy in range(copies):
+            for title, html in fixtures.items():
+                name = title if copy == 0 else f"{title}_({copy})"
+                body = html.encode('utf-8')
+                self.pages[name] = (body, f'"{hashlib.md5(body).hexdigest()}"')
+                # A saved <title>.wikitext next to the page is served as is
+                wikitext_path = os.path.join(pages_dir, f"{title}.wikitext")
+                if os.path.exists(wikitext_path):
+                    with open(wikitext_path, 'r', encoding='utf-8') as f:
+                        self.wikitext[normalise_title(name)] = f.read()
+                else:
+                    self.wikitext[normalise_title(name)] = html_to_wikitext(name, html)
+        self.redirects = {normalise_title(source): normalise_title(target)
+                          for source, target in (redirects or {}).items()}
+        self.timestamp = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        self.last_modified = formatdate(usegmt=True)
+
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        self.index_xml, self.shard_gz = self._build_sitemap()
+        self._thread = None
+
+    def _build_sitemap(self):
+        """Build the sitemap index and its single gzipped shard"""
+        ns = SITEMAP_NS.strip('{}')
+        lastmod = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        titles = list(self.pages) + [title.replace(' ', '_') for title in self.redirects]
+        urls = ''.join(
+            f"<url><loc>{self.url}/w/{quote(title)}</loc><lastmod>{lastmod}</lastmod><priority>0.5</priority></url>\n"
+            for title in titles
+        )
+        shard = f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{ns}">\n{urls}</urlset>\n'
+        index = (f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{ns}">\n'
+                 f'<sitemap><loc>{self.url}/images/sitemaps/NS_0-0.xml.gz</loc><lastmod>{lastmod}</lastmod></sitemap>\n'
+                 f'</sitemapindex>\n')
+        # mtime=0 keeps the shard bytes identical across runs
+        return index.encode('utf-8'), gzip.compress(shard.encode('utf-8'), mtime=0)
+
+    def _count(self, status):
+        with self.lock:
+            self.stats[status] = self.stats.get(status, 0) + 1
+
+    def _roll(self):
+        """Draw the injected delay and fault for one page request"""
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            fault = self.random.random()
+        if fault < self.error_429_rate:
+            return delay, 429
+        if fault < self.error_429_rate + self.error_5xx_rate:
+            return delay, 503
+        if fault < self.error_429_rate + self.error_5xx_rate + self.slow_body_rate:
+            return delay, 'slow'
+        return delay, None
+
+    def api_query(self, params):
+        """Answer to an api.php action=query&prop=revisions request, in formatversion=2 JSON"""
+        if params.get('action') != 'query':
+            return {'error': {'code': 'badvalue', 'info': 'Only action=query is replayed'}}
+        normalized = []
+        redirects = []
+        pages = {}
+        for requested in filter(None, params.get('titles', '').split('|')):
+            title = normalise_title(requested)
+            if title != requested:
+                normalized.append({'from': requested, 'to': title})
+            if params.get('redirects') and title in self.redirects:
+                redirects.append({'from': title, 'to': self.redirects[title]})
+                title = self.redirects[title]
+            # Titles resolving to the same page list it once, as MediaWiki does
+            if title in pages:
+                continue
+            wikitext = self.wikitext.get(title)
+            if wikitext is None:
+                pages[title] = {'ns': 0, 'title': title, 'missing': True}
+                continue
+            pages[title] = {
+                'pageid': len(pages) + 1,
+                'ns': 0,
+                'title': title,
+                'revisions': [{
+                    'timestamp': self.timestamp,
+                    'slots': {'main': {'contentmodel': 'wikitext', 'contentformat': 'text/x-wiki',
+                                       'content': wikitext}},
+                }],
+            }
+        query = {'pages': list(pages.values())}
+        if normalized:
+            query['normalized'] = normalized
+        if redirects:
+            query['redirects'] = redirects
+        return {'batchcomplete': True, 'query': query}
+
+    def _handler(self):
+        replay = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, like the real wiki
+
+            def _send(self, status, body=b'', content_type='text/html; charset=UTF-8', headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                if body and self.command != 'HEAD':
+                    self.wfile.write(body)
+                replay._count(status)
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path == '/images/sitemaps/index.xml':
+                    self._send(200, replay.index_xml, 'application/xml')
+                elif path == '/images/sitemaps/NS_0-0.xml.gz':
+                    self._send(200, replay.shard_gz, 'application/gzip')
+                elif path.startswith('/w/'):
+                    self._page(unquote(path[len('/w/'):]))
+                elif path == '/api.php':
+                    self._api(urlparse(self.path).query)
+                else:
+                    self._send(404, b'Not found')
+
+            do_HEAD = do_GET
+
+            def _api(self, query):
+                delay, fault = replay._roll()
+                if delay:
+                    time.sleep(delay)
+                if fault == 429:
+                    self._send(429, b'Too many requests', headers={'Retry-After': '1'})
+                    return
+                if fault == 503:
+                    self._send(503, b'Service unavailable')
+                    return
+                params = {key: values[-1] for key, values in parse_qs(query).items()}
+                body = json.dumps(replay.api_query(params)).encode('utf-8')
+                self._send(200, body, 'application/json; charset=utf-8')
+
+            def _page(self, title):
+                page = replay.pages.get(title)
+                if page is None:
+                    self._send(404, b'Not found')
+                    return
+                body, etag = page
+                delay, fault = replay._roll()
+                if delay:
+                    time.sleep(delay)
+                if fault == 429:
+                    self._send(429, b'Too many requests', headers={'Retry-After': '1'})
+                    return
+                if fault == 503:
+                    self._send(503, b'Service unavailable')
+                    return
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    replay._count(304)
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=UTF-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', replay.last_modified)
+                self.end_headers()
+                if fault == 'slow':
+                    # Trickle the body out in chunks over slow_body_seconds
+                    chunks = 10
+                    step = -(-len(body) // chunks)
+                    for start in range(0, len(body), step):
+                        self.wfile.write(body[start:start + step])
+                        self.wfile.flush()
+                        time.sleep(replay.slow_body_seconds / chunks)
+                else:
+                    self.wfile.write(body)
+                replay._count(200)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """Serve requests on a background thread"""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and release the port"""
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay saved wiki pages behind a synthetic sitemap')
+    parser.add_argument('--pages', default='fixtures/pages',
+                        help='Directory of saved .html pages, e.g. a crawl\'s wiki_pages/html (default: fixtures/pages)')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on (default: 8080)')
+    parser.add_argument('--copies', type=int, default=1, help='Serve each page under this many titles (default: 1)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Added delay per page in seconds (default: 0)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random delay up to this many seconds (default: 0)')
+    parser.add_argument('--error-429-rate', type=float, default=0.0, help='Fraction of page requests answered 429 (default: 0)')
+    parser.add_argument('--error-5xx-rate', type=float, default=0.0, help='Fraction of page requests answered 503 (default: 0)')
+    parser.add_argument('--slow-body-rate', type=float, default=0.0, help='Fraction of pages sent slowly (default: 0)')
+    parser.add_argument('--slow-body-seconds', type=float, default=1.0, help='Time taken to send a slow body (default: 1)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for injected faults (default: 0)')
+    parser.add_argument('--redirect', action='append', default=[], metavar='FROM=TO',
+                        help='Serve the title FROM as a redirect to TO through api.php; repeatable')
+    args = parser.parse_args()
+
+    server = ReplayServer(
+        pages_dir=args.pages,
+        host=args.host,
+        port=args.port,
+        copies=args.copies,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_429_rate=args.error_429_rate,
+        error_5xx_rate=args.error_5xx_rate,
+        slow_body_rate=args.slow_body_rate,
+        slow_body_seconds=args.slow_body_seconds,
+        seed=args.seed,
+        redirects=dict(redirect.split('=', 1) for redirect in args.redirect)
+    )
+    print(f"Replaying {len(server.pages)} pages on {server.url}")
+    print(f"Crawl it with base_url={server.url!r}, or through {server.url}/api.php with --source api")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+        print(f"Responses sent: {server.stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import gzip
+import hashlib
+import os
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+
+SITEMAP_NS = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+
+SitemapURL = namedtuple('SitemapURL', ['loc', 'lastmod', 'priority'])
+
+
+def iter_sitemap(fileobj):
+    """Stream <url> records out of a sitemap, clearing parsed elements as it goes"""
+    context = ET.iterparse(fileobj, events=('start', 'end'))
+    _, root = next(context)
+    for event, elem in context:
+        if event != 'end' or elem.tag != SITEMAP_NS + 'url':
+            continue
+        loc = elem.findtext(SITEMAP_NS + 'loc')
+        if loc:
+            priority = elem.findtext(SITEMAP_NS + 'priority')
+            yield SitemapURL(
+                loc.strip(),
+                elem.findtext(SITEMAP_NS + 'lastmod'),
+                float(priority) if priority else None
+            )
+        # Drop finished <url> elements from the root so memory stays flat
+        root.clear()
+
+
+def iter_sitemap_file(path):
+    """Stream records from a gzipped sitemap shard without decompressing it into memory"""
+    with gzip.open(path, 'rb') as gz_file:
+        yield from iter_sitemap(gz_file)
+
+
+def parse_sitemap_index(content):
+    """Return every shard URL listed in a sitemap index document"""
+    root = ET.fromstring(content)
+    return [loc.text.strip() for loc in root.iter(SITEMAP_NS + 'loc') if loc.text]
+
+
+def _file_md5(path):
+    """MD5 of a file, read in chunks"""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def download_shard(session, url, dest_dir):
+    """Stream one sitemap shard to disk, returning its path and whether it changed"""
+    path = os.path.join(dest_dir, os.path.basename(urlparse(url).path))
+    tmp_path = path + '.tmp'
+    digest = hashlib.md5()
+    with session.get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        with open(tmp_path, 'wb') as f:
+            for chunk in response.iter_content(1 << 16):
+                digest.update(chunk)
+                f.write(chunk)
+
+    if os.path.exists(path) and _file_md5(path) == digest.hexdigest():
+        os.remove(tmp_path)
+        return path, False
+    os.replace(tmp_path, path)
+    return path, True
+
+
+def download_sitemaps(index_url, dest_dir, headers=None, max_workers=8):
+    """Fetch the sitemap index and download all of its shards concurrently"""
+    with requests.Session() as session:
+        session.headers.update(headers or {})
+        response = session.get(index_url, timeout=60)
+        response.raise_for_status()
+        shard_urls = parse_sitemap_index(response.content)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(download_shard, session, url, dest_dir) for url in shard_urls]
+            return [future.result() for future in futures]
@@ -0,0 +1,339 @@
+import json
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+
+try:
+    import zstandard
+except ImportError:  # zlib with a preset dictionary is the fallback codec
+    zstandard = None
+
+# Page kinds and the per-page file layout used by FileStorage
+KINDS = {
+    'html': ('html', '.html'),
+    'markdown': ('markdown', '.md'),
+    'wikitext': ('wikitext', '.wiki'),
+    'tables': ('tables', '.json'),
+}
+
+
+def safe_filename(title):
+    """Map a page title to the file name stem used on disk"""
+    return re.sub(r'[\\/:*?"<>|]', '_', title)
+
+
+class FileStorage:
+    """One file per page and kind, written atomically (the original crawler layout)"""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+    def path(self, title, kind):
+        """Path of the file holding one kind of a page"""
+        directory, extension = KINDS[kind]
+        return os.path.join(self.output_dir, directory, f"{safe_filename(title)}{extension}")
+
+    def has_page(self, title, kinds=('html', 'markdown')):
+        """Check whether every requested kind of a page is stored"""
+        return all(os.path.exists(self.path(title, kind)) for kind in kinds)
+
+    def write_page(self, title, contents):
+        """Write {kind: text} for a page, each file via a .tmp + os.replace cycle"""
+        for kind, text in contents.items():
+            filename = self.path(title, kind)
+            tmp_file = filename + '.tmp'
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            try:
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                os.replace(tmp_file, filename)
+            finally:
+                try:
+                    if os.path.exists(tmp_file):
+                        os.remove(tmp_file)
+                except:
+                    pass
+
+    def read(self, title, kind):
+        """Return the stored text for a page, or None"""
+        try:
+            with open(self.path(title, kind), 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def titles(self, kind):
+        """Stored page names for a kind, sorted"""
+        directory, extension = KINDS[kind]
+        directory = os.path.join(self.output_dir, directory)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-len(extension)] for name in os.listdir(directory) if name.endswith(extension))
+
+    def iter_pages(self, kind):
+        """Yield (title, text) for every stored page of a kind"""
+        for title in self.titles(kind):
+            text = self.read(title, kind)
+            if text is not None:
+                yield title, text
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ShardStorage:
+    """Pages packed into a few large append-only shard files with a title index
+
+    Each record is compressed on its own against a dictionary trained on the
+    first pages written, so common wiki boilerplate costs almost nothing and
+    any page can be decompressed without touching its neighbours. Use a single
+    writer per store; any number of processes can read.
+    """
+
+    def __init__(self, shard_dir, batch_size=64, max_shard_bytes=256 * 1024 * 1024,
+                 dictionary_samples=256, dictionary_size=112 * 1024, level=9):
+        self.shard_dir = shard_dir
+        self.batch_size = batch_size
+        self.max_shard_bytes = max_shard_bytes
+        self.dictionary_samples = dictionary_samples
+        self.dictionary_size = dictionary_size
+        self.level = level
+        self.meta_file = os.path.join(shard_dir, 'meta.json')
+        self.index_file = os.path.join(shard_dir, 'index.jsonl')
+        self.dictionary_file = os.path.join(shard_dir, 'dictionary.bin')
+        os.makedirs(shard_dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.index = {}  # (title, kind) -> (shard, offset, length)
+        self._pending = []  # (title, kind, text) waiting for the next flush
+        self._handles = {}
+        self._compressor = None
+        self._decompressor = None
+
+        self.meta = {'codec': 'zstd' if zstandard else 'zlib', 'has_dictionary': False, 'shard': 0}
+        if os.path.exists(self.meta_file):
+            with open(self.meta_file, 'r') as f:
+                self.meta = json.load(f)
+            if self.meta['codec'] == 'zstd' and zstandard is None:
+                raise ImportError("This shard store was written with zstd; install the zstandard package to read it")
+        self._load_index()
+        self._init_codec()
+
+    @staticmethod
+    def exists(shard_dir):
+        """Check whether a directory holds a shard store"""
+        return os.path.exists(os.path.join(shard_dir, 'meta.json'))
+
+    def _load_index(self):
+        """Replay the append-only index; later entries replace earlier ones"""
+        if not os.path.exists(self.index_file):
+            return
+        with open(self.index_file, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn line from an interrupted flush; later flushes start on a fresh line after it
+                    continue
+                self.index[(entry['title'], entry['kind'])] = (entry['shard'], entry['offset'], entry['length'])
+
+    def _save_meta(self):
+        tmp_file = self.meta_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_file, self.meta_file)
+
+    def _init_codec(self):
+        """Build compressor/decompressor objects once the dictionary is known"""
+        dictionary = None
+        if self.meta['has_dictionary']:
+            with open(self.dictionary_file, 'rb') as f:
+                dictionary = f.read()
+
+        if self.meta['codec'] == 'zstd':
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            self._compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dict_data)
+            self._decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+            self._compress = self._compressor.compress
+            self._decompress = self._decompressor.decompress
+        else:
+            zdict = dictionary or b''
+
+            def compress(data):
+                compressor = zlib.compressobj(self.level, zdict=zdict) if zdict else zlib.compressobj(self.level)
+                return compressor.compress(data) + compressor.flush()
+
+            def decompress(data):
+                decompressor = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+                return decompressor.decompress(data) + decompressor.flush()
+
+            self._compress = compress
+            self._decompress = decompress
+
+    def _train_dictionary(self, samples):
+        """Train a compression dictionary from sample pages"""
+        if self.meta['codec'] == 'zstd':
+            return zstandard.train_dictionary(self.dictionary_size, samples).as_bytes()
+
+        # zlib can only use the last 32KB of a preset dictionary, so keep the
+        # lines repeated most across pages, the most valuable nearest the end
+        counts = Counter()
+        for sample in samples:
+            counts.update(set(sample.splitlines(keepends=True)))
+        common = [line for line, count in counts.most_common() if count > 1]
+        dictionary = b''
+        for line in common:
+            if len(dictionary) + len(line) > 32 * 1024:
+                break
+            dictionary = line + dictionary
+        return dictionary
+
+    def _ensure_dictionary(self, force=False):
+        """Train the dictionary once enough pages are buffered"""
+        if self.meta['has_dictionary'] or self.index:
+            return True
+        if len(self._pending) < self.dictionary_samples and not force:
+            return False
+        samples = [text.encode('utf-8') for _, _, text in self._pending]
+        try:
+            dictionary = self._train_dictionary(samples) if len(samples) >= 8 else b''
+        except Exception as e:
+            print(f"Error training shard dictionary, storing without one: {str(e)}")
+            dictionary = b''
+        if dictionary:
+            with open(self.dictionary_file, 'wb') as f:
+                f.write(dictionary)
+            self.meta['has_dictionary'] = True
+        self._save_meta()
+        self._init_codec()
+        return True
+
+    def _shard_path(self, shard):
+        return os.path.join(self.shard_dir, f"shard-{shard:05d}.bin")
+
+    def has_page(self, title, kinds=('html', 'markdown')):
+        """Check whether every requested kind of a page is stored or pending"""
+        with self.lock:
+            stored = {kind for t, kind, _ in self._pending if t == title}
+            return all((title, kind) in self.index or kind in stored for kind in kinds)
+
+    def write_page(self, title, contents):
+        """Queue {kind: text} for a page; records hit disk in batches"""
+        with self.lock:
+            for kind, text in contents.items():
+                self._pending.append((title, kind, text))
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+
+    def _flush_locked(self, force=False):
+        if not self._pending or not self._ensure_dictionary(force):
+            return
+
+        shard = self.meta['shard']
+        path = self._shard_path(shard)
+        if os.path.exists(path) and os.path.getsize(path) >= self.max_shard_bytes:
+            shard += 1
+            self.meta['shard'] = shard
+            self._save_meta()
+            path = self._shard_path(shard)
+
+        entries = []
+        with open(path, 'ab') as f:
+            offset = f.tell()
+            for title, kind, text in self._pending:
+                blob = self._compress(text.encode('utf-8'))
+                f.write(blob)
+                entries.append({'title': title, 'kind': kind, 'shard': shard, 'offset': offset, 'length': len(blob)})
+                offset += len(blob)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # The index is written after the data so an entry never points at missing bytes
+        torn = False
+        if os.path.exists(self.index_file) and os.path.getsize(self.index_file):
+            with open(self.index_file, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b'\n'
+        with open(self.index_file, 'a', encoding='utf-8') as f:
+            if torn:
+                f.write('\n')  # Close off a torn line so the next entry is not glued onto it
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+                self.index[(entry['title'], entry['kind'])] = (entry['shard'], entry['offset'], entry['length'])
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending = []
+
+    def flush(self):
+        """Write every queued record to disk"""
+        with self.lock:
+            self._flush_locked(force=True)
+
+    def _read_record(self, shard, offset, length):
+        handle = self._handles.get(shard)
+        if handle is None:
+            handle = self._handles[shard] = open(self._shard_path(shard), 'rb')
+        # pread leaves the shared file offset alone, so forked readers can share handles
+        return self._decompress(os.pread(handle.fileno(), length, offset)).decode('utf-8')
+
+    def read(self, title, kind):
+        """Return the stored text for a page, or None"""
+        with self.lock:
+            for t, k, text in reversed(self._pending):
+                if t == title and k == kind:
+                    return text
+            location = self.index.get((title, kind))
+            if location is None:
+                return None
+            return self._read_record(*location)
+
+    def titles(self, kind):
+        """Stored page names for a kind, in on-disk order"""
+        with self.lock:
+            entries = sorted((loc, title) for (title, k), loc in self.index.items() if k == kind)
+        return [title for _, title in entries]
+
+    def iter_pages(self, kind):
+        """Yield (title, text) for every page of a kind, reading the shards sequentially"""
+        with self.lock:
+            entries = sorted((loc, title) for (title, k), loc in self.index.items() if k == kind)
+        for (shard, offset, length), title in entries:
+            with self.lock:
+                text = self._read_record(shard, offset, length)
+            yield title, text
+
+    def close(self):
+        """Flush pending records and release file handles"""
+        self.flush()
+        with self.lock:
+            for handle in self._handles.values():
+                handle.close()
+            self._handles = {}
+
+    def __getstate__(self):
+        # Locks and open handles stay behind when a reader is sent to another process
+        state = self.__dict__.copy()
+        for key in ('lock', '_handles', '_compressor', '_decompressor', '_compress', '_decompress'):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self._handles = {}
+        self._init_codec()
+
+
+def open_storage(output_dir, backend=None):
+    """Open the page store under output_dir, detecting the backend when not given"""
+    shard_dir = os.path.join(output_dir, 'shards')
+    if backend is None:
+        backend = 'shards' if ShardStorage.exists(shard_dir) else 'files'
+    if backend == 'shards':
+        return ShardStorage(shard_dir)
+    return FileStorage(output_dir)
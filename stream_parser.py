@@ -0,0 +1,677 @@
+import argparse
+import hashlib
+import html
+import os
+import sys
+from datetime import datetime
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+
+from bs4.dammit import EntitySubstitution
+
+from table_grid import GridLayout, MarkdownRows, make_cell
+from wiki_parser import (HIDDEN_TEXT_TAGS, MULTI_VALUED_ATTRIBUTES, SKIPPED_SECTIONS, SKIPPED_TABLE_CLASSES,
+                         OSRSWikiParser, clean_cell)
+
+# Elements BeautifulSoup closes as soon as they open
+VOID_ELEMENTS = {'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr', 'image',
+                 'img', 'input', 'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid', 'param', 'source',
+                 'spacer', 'track', 'wbr'}
+
+# Whitespace-only strings inside these are kept as they are instead of collapsed
+PRESERVE_WHITESPACE_TAGS = ('pre', 'textarea')
+
+# Elements html.parser reads as raw text, so their strings are serialised unescaped
+RAW_TEXT_TAGS = ('script', 'style')
+
+ASCII_SPACES = ' \n\t\x0c\r'
+
+
+class _Node:
+    """An open element and the callbacks to run when it closes."""
+    __slots__ = ('tag', 'attrs', 'classes', 'parent', 'captures', 'on_end')
+
+    def __init__(self, tag, attrs, parent):
+        self.tag = tag
+        self.attrs = attrs
+        self.classes = attrs.get('class', '').split()
+        self.parent = parent
+        self.captures = None
+        self.on_end = None
+
+
+class _Capture:
+    """Text below one element as get_text() returns it, plus img srcs when asked for."""
+    __slots__ = ('parts', 'images')
+
+    def __init__(self, images=False):
+        self.parts = []
+        self.images = [] if images else None
+
+    @property
+    def text(self) -> str:
+        return ''.join(self.parts)
+
+
+class _Cell:
+    """A th/td below a table row."""
+    __slots__ = ('tag', 'classes', 'rowspan', 'colspan', 'counted', 'own', 'capture')
+
+    def __init__(self, node, counted, own, capture):
+        self.tag = node.tag
+        self.classes = node.classes
+        self.rowspan = node.attrs.get('rowspan')
+        self.colspan = node.attrs.get('colspan', 1)
+        self.counted = counted
+        self.own = own
+        self.capture = capture
+
+    @property
+    def text(self) -> str:
+        return self.capture.text
+
+
+class _Row:
+    """A tr with its cells and, when asked for, a digest of its subtree for tr == tr comparisons."""
+    __slots__ = ('index', 'own', 'cells', 'has_th', 'digest')
+
+    def __init__(self, index, own, signed):
+        self.index = index
+        self.own = own  # Belongs to the tracked table rather than a nested one
+        self.cells = []
+        self.has_th = False
+        self.digest = hashlib.md5() if signed else None
+
+
+class _RowTracker:
+    """Follows the rows of one table and hands each one over in document order once it closes.
+
+    Cells are shared with every open row above them, the way tr.find_all(['th', 'td'])
+    sees them. Finished rows wait only while an enclosing row is still open.
+    """
+
+    def __init__(self, parser, table, on_row, signed=None, images=False):
+        self.parser = parser
+        self.table = table
+        self.on_row = on_row
+        self.signed = signed  # None, 'first' or 'all'
+        self.images = images
+        counted = not any(n.tag == 'table' and _skipped(n) for n in parser.stack[:-1])
+        self.scopes = [(counted, True)]  # (counted towards columns, belongs to this table)
+        self.open_rows = []
+        self.done_rows = []
+        self.started = 0
+
+    def _feed(self, token):
+        for row in self.open_rows:
+            if row.digest is not None:
+                row.digest.update(repr(token).encode('utf-8'))
+
+    def start(self, node):
+        tag = node.tag
+        if tag == 'table':
+            self.scopes.append((self.scopes[-1][0] and not _skipped(node), False))
+        elif tag == 'tr':
+            signed = self.signed == 'all' or (self.signed == 'first' and self.started == 0)
+            self.open_rows.append(_Row(self.started, self.scopes[-1][1], signed))
+            self.started += 1
+        elif tag in ('th', 'td') and self.open_rows:
+            counted, own = self.scopes[-1]
+            cell = _Cell(node, counted, own, self.parser.capture(node, self.images))
+            for row in self.open_rows:
+                row.cells.append(cell)
+                if tag == 'th':
+                    row.has_th = True
+        if self.signed:
+            attrs = sorted((k, v.split() if k in MULTI_VALUED_ATTRIBUTES else v) for k, v in node.attrs.items())
+            self._feed(('s', tag, attrs))
+
+    def end(self, node):
+        if self.signed:
+            self._feed(('e', node.tag))
+        if node.tag == 'table':
+            self.scopes.pop()
+        elif node.tag == 'tr':
+            # Elements close innermost first, so this is the most recently opened row
+            self.done_rows.append(self.open_rows.pop())
+            if not self.open_rows:
+                self.done_rows.sort(key=lambda row: row.index)
+                for row in self.done_rows:
+                    self.on_row(row)
+                self.done_rows = []
+
+    def string(self, text):
+        # Comments and other special strings compare equal to text with the same content
+        if self.signed:
+            self._feed(('t', text))
+
+
+def _skipped(node) -> bool:
+    return any(c in SKIPPED_TABLE_CLASSES for c in node.classes)
+
+
+def _grid_cell(cell):
+    return make_cell(cell.tag, clean_cell(cell.text.strip()), cell.rowspan, cell.colspan)
+
+
+class _WikiEventParser(HTMLParser):
+    """Turns html.parser events into the element stack BeautifulSoup's html.parser builder would build.
+
+    Subclasses see start(node)/end(node) for every element, with whitespace-only
+    strings collapsed and end tags matched the way BeautifulSoup does it. With a
+    scope_id only the first div with that id is reported.
+    """
+
+    def __init__(self, scope_id: Optional[str] = None, html_writer=None):
+        # Character references are resolved here, as BeautifulSoup does, rather than by html.parser
+        super().__init__(convert_charrefs=False)
+        self.scope_id = scope_id
+        self.scope_found = scope_id is None
+        self.in_scope = scope_id is None
+        self.scope = None
+        self.html_writer = html_writer
+        self.stack: List[_Node] = []
+        self.open_counts: Dict[str, int] = {}
+        self.hidden = 0
+        self.preserved = 0
+        self.raw_text = 0
+        self.captures: List[_Capture] = []
+        self.trackers: List[_RowTracker] = []
+        self._data = []
+
+    # Hooks for subclasses
+
+    def start(self, node: _Node):
+        pass
+
+    def end(self, node: _Node):
+        pass
+
+    # Helpers for subclasses
+
+    def capture(self, node: _Node, images: bool = False) -> _Capture:
+        """Collect the text of node until it closes."""
+        capture = _Capture(images)
+        self.captures.append(capture)
+        if node.captures is None:
+            node.captures = []
+        node.captures.append(capture)
+        return capture
+
+    def on_close(self, node: _Node, callback):
+        if node.on_end is None:
+            node.on_end = []
+        node.on_end.append(callback)
+
+    def track(self, table: _Node, on_row, signed=None, images=False):
+        """Hand every row of table to on_row as it closes."""
+        self.trackers.append(_RowTracker(self, table, on_row, signed, images))
+
+    # Element stack
+
+    def _open(self, tag, attrs):
+        self._flush()
+        attr_dict = {}
+        for key, value in attrs:
+            attr_dict[key] = '' if value is None else value
+        node = _Node(tag, attr_dict, self.stack[-1] if self.stack else None)
+        self.stack.append(node)
+        self.open_counts[tag] = self.open_counts.get(tag, 0) + 1
+        if tag in HIDDEN_TEXT_TAGS:
+            self.hidden += 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserved += 1
+        if tag in RAW_TEXT_TAGS:
+            self.raw_text += 1
+
+        if not self.scope_found and tag == 'div' and attr_dict.get('id') == self.scope_id:
+            self.scope_found = self.in_scope = True
+            self.scope = node
+        if not self.in_scope:
+            return
+        if self.html_writer is not None:
+            self.html_writer.write(self.get_starttag_text())
+        if tag == 'img':
+            for capture in self.captures:
+                if capture.images is not None:
+                    capture.images.append(attr_dict.get('src'))
+        for tracker in self.trackers:
+            tracker.start(node)
+        self.start(node)
+
+    def _pop(self):
+        node = self.stack.pop()
+        tag = node.tag
+        self.open_counts[tag] -= 1
+        if tag in HIDDEN_TEXT_TAGS:
+            self.hidden -= 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserved -= 1
+        if tag in RAW_TEXT_TAGS:
+            self.raw_text -= 1
+        if not self.in_scope:
+            return
+
+        if self.html_writer is not None and tag not in VOID_ELEMENTS:
+            self.html_writer.write(f"</{tag}>")
+        while self.trackers and self.trackers[-1].table is node:
+            self.trackers.pop()
+        for tracker in self.trackers:
+            tracker.end(node)
+        if node.captures:
+            for capture in node.captures:
+                self.captures.remove(capture)
+        if node.on_end:
+            for callback in node.on_end:
+                callback()
+        self.end(node)
+        if self.scope_id is not None and node is self.scope:
+            self.in_scope = False
+
+    def _pop_to(self, tag):
+        if self.open_counts.get(tag):
+            while self.stack[-1].tag != tag:
+                self._pop()
+            self._pop()
+
+    # Strings
+
+    def _flush(self):
+        """Turn the buffered text into one string, as BeautifulSoup's endData() does."""
+        if not self._data:
+            return
+        text = ''.join(self._data)
+        self._data = []
+        if not self.preserved and all(c in ASCII_SPACES for c in text):
+            text = '\n' if '\n' in text else ' '
+        if not self.in_scope:
+            return
+        if self.html_writer is not None:
+            self.html_writer.write(text if self.raw_text else html.escape(text, quote=False))
+        if not self.hidden:
+            for capture in self.captures:
+                capture.parts.append(text)
+        for tracker in self.trackers:
+            tracker.string(text)
+
+    def _special_string(self, text, markup, is_text=False):
+        """A comment, declaration or CDATA section: its own string, and only CDATA counts as text."""
+        self._flush()
+        if not self.in_scope:
+            return
+        if self.html_writer is not None:
+            self.html_writer.write(markup)
+        if is_text:
+            for capture in self.captures:
+                capture.parts.append(text)
+        for tracker in self.trackers:
+            tracker.string(text)
+
+    # html.parser callbacks
+
+    def handle_starttag(self, tag, attrs):
+        self._open(tag, attrs)
+        if tag in VOID_ELEMENTS:
+            self._pop()
+
+    def handle_startendtag(self, tag, attrs):
+        self._open(tag, attrs)
+        self._pop_to(tag)
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag not in VOID_ELEMENTS:
+            self._pop_to(tag)
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self._data.append(character if character is not None else f"&{name}")
+
+    def handle_charref(self, name):
+        self._data.append(html.unescape(f"&#{name};"))
+
+    def handle_comment(self, data):
+        self._special_string(data, f"<!--{data}-->")
+
+    def handle_decl(self, decl):
+        self._special_string(decl[len('DOCTYPE '):], f"<!{decl}>")
+
+    def handle_pi(self, data):
+        self._special_string(data, f"<?{data}>")
+
+    def unknown_decl(self, data):
+        if data.upper().startswith('CDATA['):
+            self._special_string(data[len('CDATA['):], f"<![{data}]]>", is_text=True)
+        else:
+            self._special_string(data, f"<![{data}]>")
+
+    def close(self):
+        super().close()
+        self._flush()
+        while self.stack:
+            self._pop()
+
+
+class PageScan:
+    """What the first pass learns about a page: the fields that precede the sections and per-table layout."""
+
+    def __init__(self):
+        self.title = ""
+        self.infobox = {}
+        self.description = ""
+        self.combat_stats = {}
+        self.tables = []  # One _TableLayout per direct child table of the content div
+
+
+class _TableLayout:
+    """Column count, header row and first-row digest of one section table."""
+    __slots__ = ('max_cols', 'headers', 'first_digest', 'grid')
+
+    def __init__(self):
+        self.max_cols = 0
+        self.headers = []
+        self.first_digest = None
+        self.grid = GridLayout()  # Rowspans can widen a row past its own cells
+
+
+class _PageScanner(_WikiEventParser):
+    """First pass: title, infobox, combat stats, description and the layout of each section table."""
+
+    def __init__(self, scope_id=None, html_writer=None):
+        super().__init__(scope_id, html_writer)
+        self.scan = PageScan()
+        self.wiki = OSRSWikiParser('html.parser')
+        self.title_seen = False
+        self.infobox_seen = False
+        self.bonuses_seen = False
+        self.bonus_section = None
+        self.content = None
+        self.content_in_table = False
+
+    def start(self, node):
+        tag = node.tag
+        if tag == 'h1':
+            if not self.title_seen and 'firstHeading' in node.classes:
+                self.title_seen = True
+                capture = self.capture(node)
+                self.on_close(node, lambda: setattr(self.scan, 'title', capture.text.strip()))
+        elif tag == 'table':
+            if not self.infobox_seen and 'infobox' in node.classes:
+                self.infobox_seen = True
+                self.track(node, self._infobox_row, images=True)
+            if not self.bonuses_seen and 'infobox-bonuses' in node.classes:
+                self.bonuses_seen = True
+                self.scan.combat_stats = {'attack_bonuses': {}, 'defence_bonuses': {}, 'other_bonuses': {}}
+                self.track(node, self._bonus_row)
+            if self.content is not None and node.parent is self.content:
+                layout = _TableLayout()
+                self.scan.tables.append(layout)
+                if not _skipped(node):
+                    self.track(node, lambda row: self._layout_row(layout, row), signed='first')
+        elif tag == 'div':
+            if self.content is None and 'mw-parser-output' in node.classes:
+                self.content = node
+                self.content_in_table = self.open_counts.get('table', 0) > 0
+        elif tag == 'p' and self.content is not None and node.parent is self.content:
+            if not self.scan.description and not self.content_in_table:
+                capture = self.capture(node)
+                self.on_close(node, lambda: self._paragraph(capture.text.strip()))
+
+    def _paragraph(self, text):
+        if not self.scan.description and text:
+            self.scan.description = text
+
+    def _infobox_row(self, row):
+        header = next((c for c in row.cells if c.tag == 'th'), None)
+        data = next((c for c in row.cells if c.tag == 'td'), None)
+        if header and data:
+            images = data.capture.images
+            if images:
+                if None in images:
+                    raise KeyError('src')  # As img['src'] does for an img without one
+                value = images
+            else:
+                value = data.text.strip()
+            self.scan.infobox[header.text.strip()] = value
+
+    def _bonus_row(self, row):
+        header = next((c for c in row.cells if c.tag == 'th' and 'infobox-header' in c.classes), None)
+        if header:
+            text = header.text.strip().lower()
+            if 'attack' in text:
+                self.bonus_section = 'attack_bonuses'
+            elif 'defence' in text:
+                self.bonus_section = 'defence_bonuses'
+            elif 'other' in text:
+                self.bonus_section = 'other_bonuses'
+            return
+        if self.bonus_section:
+            values = [c.text.strip() for c in row.cells if c.tag == 'td' and 'infobox-nested' in c.classes]
+            if values:
+                self.scan.combat_stats[self.bonus_section] = self.wiki._bonus_values(self.bonus_section, values)
+
+    def _layout_row(self, layout, row):
+        counted = [c for c in row.cells if c.counted]
+        if row.own:
+            layout.grid.place([_grid_cell(c) for c in row.cells if c.own])
+        layout.max_cols = max(layout.max_cols, sum(int(c.colspan) for c in counted), layout.grid.width)
+        if not layout.headers:
+            layout.headers = [clean_cell(c.text.strip()) for c in counted if c.tag == 'th']
+        if row.index == 0:
+            layout.first_digest = row.digest.digest()
+
+
+class _MarkdownEmitter(_WikiEventParser):
+    """Second pass: writes each section's paragraphs, lists and tables as soon as they close."""
+
+    def __init__(self, scan: PageScan, writer, scope_id=None):
+        super().__init__(scope_id)
+        self.scan = scan
+        self.writer = writer
+        self.content = None
+        self.tables_seen = 0
+        self.section_open = False
+        self.items = 0
+        self.lines = 0
+        self.headers_written = False
+        self.list_node = None
+        self.open_items = []
+        self.done_items = []
+        self.items_started = 0
+
+        # Everything before the sections comes from the first pass
+        preamble = OSRSWikiParser('html.parser').to_markdown({
+            'title': scan.title,
+            'infobox': scan.infobox,
+            'description': scan.description,
+            'combat_stats': scan.combat_stats,
+            'sections': {},
+        })
+        writer.write(preamble)
+
+    def start(self, node):
+        tag = node.tag
+        if tag == 'li' and self.list_node is not None:
+            self.open_items.append((self.items_started, self.capture(node)))
+            self.items_started += 1
+            return
+        if tag == 'div' and self.content is None and 'mw-parser-output' in node.classes:
+            self.content = node
+            return
+        if self.content is None or node.parent is not self.content:
+            return
+
+        if tag == 'h2':
+            capture = self.capture(node)
+            self.on_close(node, lambda: self._section(capture.text.strip()))
+        elif tag == 'p':
+            if self.section_open:
+                capture = self.capture(node)
+                self.on_close(node, lambda: self._item(capture.text.strip()))
+        elif tag == 'ul':
+            if self.section_open:
+                self._item('')
+                self.lines = 0
+                self.list_node = node
+                self.items_started = 0
+        elif tag == 'table':
+            layout = self.scan.tables[self.tables_seen]
+            self.tables_seen += 1
+            if self.section_open:
+                self._item('')
+                if not _skipped(node):
+                    self.lines = 0
+                    self.headers_written = False
+                    grid = MarkdownRows()
+                    self.track(node, lambda row: self._table_row(layout, grid, row), signed='all')
+
+    def _section(self, name):
+        self._end_section()
+        # Sections named '' collect nothing and the skipped ones are dropped from the markdown
+        if name and name.lower() not in SKIPPED_SECTIONS:
+            self.section_open = True
+            self.items = 0
+            self.writer.write(f"\n## {name}\n\n")
+
+    def _end_section(self):
+        if self.section_open:
+            self.writer.write("\n")
+            self.section_open = False
+
+    def _item(self, text):
+        if self.items:
+            self.writer.write("\n")
+        self.items += 1
+        self.writer.write(text)
+
+    def _line(self, text):
+        if self.lines:
+            self.writer.write("\n")
+        self.lines += 1
+        self.writer.write(text)
+
+    def _table_row(self, layout, grid, row):
+        if not row.own:
+            return
+        header = row.has_th and (row.index == 0 or row.digest.digest() == layout.first_digest)
+        cells = grid.row([_grid_cell(cell) for cell in row.cells if cell.own], shown=not header)
+        if cells is None:
+            return
+        cells.extend([''] * (layout.max_cols - len(cells)))
+
+        if not self.headers_written:
+            self.headers_written = True
+            headers = list(layout.headers) or [f"Column {i+1}" for i in range(layout.max_cols)]
+            if len(headers) < layout.max_cols:
+                headers.extend([f"Column {i+1}" for i in range(len(headers), layout.max_cols)])
+            self._line('| ' + ' | '.join(headers) + ' |')
+            self._line('|' + '|'.join(['---' for _ in range(layout.max_cols)]) + '|')
+        self._line('| ' + ' | '.join(cells) + ' |')
+
+    def end(self, node):
+        if self.list_node is not None:
+            if node.tag == 'li' and self.open_items:
+                # Nested items close first but are listed after their parent, as find_all('li') orders them
+                self.done_items.append(self.open_items.pop())
+                if not self.open_items:
+                    self.done_items.sort(key=lambda item: item[0])
+                    for _, capture in self.done_items:
+                        self._line(f"* {capture.text.strip()}")
+                    self.done_items = []
+            elif node is self.list_node:
+                self.list_node = None
+        if node is self.content:
+            self._end_section()
+            self.content = False  # Only the first content div has sections
+
+
+def _feed(parser, source, chunk_size):
+    """Feed HTML text or a text file to parser in chunks and close it."""
+    if isinstance(source, str):
+        for start in range(0, len(source), chunk_size):
+            parser.feed(source[start:start + chunk_size])
+    else:
+        source.seek(0)
+        for chunk in iter(lambda: source.read(chunk_size), ''):
+            parser.feed(chunk)
+    parser.close()
+
+
+class StreamingWikiConverter:
+    """Render a wiki page to markdown in two streaming passes over the HTML.
+
+    The first pass collects what precedes the sections in the markdown (title,
+    description, infobox, combat stats) and each section table's column count
+    and header row. The second pass writes the sections to the writer as their
+    elements close, so memory holds the current row rather than the page's tree.
+    That bound is the converter's own: a source passed as a string, and
+    whatever the writer keeps, stay O(page size) and are the caller's.
+    Output matches parse_wiki_page() with the html.parser backend, except that a
+    repeated h2 title keeps each occurrence in place instead of only the last.
+    """
+
+    def __init__(self, chunk_size: int = 1 << 16, scope_id: Optional[str] = None):
+        self.chunk_size = chunk_size
+        self.scope_id = scope_id
+
+    def scan(self, source, html_writer=None) -> Optional[PageScan]:
+        """First pass; also writes the scoped HTML to html_writer. None if the scope is missing."""
+        scanner = _PageScanner(self.scope_id, html_writer)
+        _feed(scanner, source, self.chunk_size)
+        return scanner.scan if scanner.scope_found else None
+
+    def emit(self, source, scan: PageScan, writer):
+        """Second pass: write the markdown for a scanned page."""
+        _feed(_MarkdownEmitter(scan, writer, self.scope_id), source, self.chunk_size)
+
+    def convert(self, source, writer, html_writer=None) -> bool:
+        """Write the markdown for source (HTML text or a seekable text file). False if the scope is missing."""
+        scan = self.scan(source, html_writer)
+        if scan is None:
+            return False
+        self.emit(source, scan, writer)
+        return True
+
+
+def stream_wiki_page(source, writer):
+    """Write the markdown for a wiki page to writer, as parse_wiki_page() returns it."""
+    StreamingWikiConverter().convert(source, writer)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert saved wiki pages to markdown without building a tree')
+    parser.add_argument('paths', nargs='+', help='HTML files, or directories of .html files')
+    parser.add_argument('--output-dir', help='Write <page>.md files here (default: print to stdout)')
+    parser.add_argument('--scope', help='Only convert the first div with this id, e.g. content for full pages')
+    args = parser.parse_args()
+
+    files = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.html'))
+        else:
+            files.append(path)
+
+    converter = StreamingWikiConverter(scope_id=args.scope)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    for path in files:
+        with open(path, 'r', encoding='utf-8') as f:
+            if not args.output_dir:
+                converter.convert(f, sys.stdout)
+                sys.stdout.write('\n')
+                continue
+            name = os.path.splitext(os.path.basename(path))[0] + '.md'
+            with open(os.path.join(args.output_dir, name), 'w', encoding='utf-8') as out:
+                found = converter.convert(f, out)
+        if not found:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] No div#{args.scope} in {path}")
+
+    if args.output_dir:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Converted {len(files)} pages to {args.output_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import List, Optional
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+from corpus_util import bounded_map
+from storage import open_storage
+from table_grid import Cell, make_cell, resolve_grid
+from wiki_parser import BACKENDS, clean_cell, element_classes, element_text, etree
+
+# One extracted wikitable: its position on the page, caption, enclosing heading and typed grid
+ExtractedTable = namedtuple('ExtractedTable', ['table_no', 'caption', 'section', 'frame'])
+
+HEADINGS = ('h2', 'h3', 'h4')
+
+# Cell values the typing pass understands: "1,452,019", "+5", "2.5%", "1/128", "~3/128", "Always"
+_NUMBER_RE = re.compile(r'^[+-]?\d[\d,]*(?:\.\d+)?%?$')
+_FRACTION_RE = re.compile(r'^(\d[\d,]*(?:\.\d+)?)\s*/\s*(\d[\d,]*(?:\.\d+)?)$')
+
+
+def parse_cell(text):
+    """Numeric value of a table cell (rarities as probabilities), or None"""
+    value = text.replace('\xa0', ' ').strip().lstrip('~≈').strip()
+    if value == 'Always':
+        return 1.0
+    match = _FRACTION_RE.match(value)
+    if match:
+        denominator = float(match.group(2).replace(',', ''))
+        return float(match.group(1).replace(',', '')) / denominator if denominator else None
+    if _NUMBER_RE.match(value):
+        return float(value.rstrip('%').replace(',', ''))
+    return None
+
+
+def _column_names(header_rows, width):
+    """One name per column from the header rows, joining stacked headers with " / " """
+    names = []
+    for col in range(width):
+        parts = []
+        for row in header_rows:
+            cell = row[col]
+            if cell is not None and cell.text and cell.text not in parts:
+                parts.append(cell.text)
+        names.append(' / '.join(parts) or f"Column {col + 1}")
+
+    # Spanned headers repeat their name; number the copies
+    seen = {}
+    for i, name in enumerate(names):
+        if name in seen:
+            seen[name] += 1
+            names[i] = f"{name}_{seen[name]}"
+        else:
+            seen[name] = 1
+    return names
+
+
+def _typed(values):
+    """A Series of cell texts as Int64/Float64 when every value is numeric, else string"""
+    series = pd.Series(values, dtype='object')
+    present = series.dropna()
+    if len(present):
+        numbers = present.map(parse_cell)
+        if numbers.notna().all():
+            numbers = series.map(lambda v: None if v is None else parse_cell(v)).astype('Float64')
+            integral = (numbers.dropna() % 1 == 0).all() and not present.str.contains('/').any()
+            return numbers.astype('Int64') if integral else numbers
+    return series.astype('string')
+
+
+def build_frame(rows: List[List[Cell]]) -> pd.DataFrame:
+    """Turn a table's rows into a typed DataFrame with one column per grid column"""
+    grid = resolve_grid(rows)
+    if not grid or not grid[0]:
+        return pd.DataFrame()
+    width = len(grid[0])
+
+    # Leading all-th rows are the header; later all-th rows are repeated headers or group titles
+    header_count = 0
+    while header_count < len(grid) and all(c is None or c.header for c in grid[header_count]):
+        header_count += 1
+    names = _column_names(grid[:header_count], width)
+
+    body = [row for row in grid[header_count:] if not all(c is None or c.header for c in row)]
+    columns = {}
+    for col, name in enumerate(names):
+        columns[name] = _typed([row[col].text if row[col] is not None and row[col].text else None for row in body])
+    return pd.DataFrame(columns)
+
+
+class TableExtractor:
+    """Pull every wikitable out of a page's HTML as a typed DataFrame"""
+
+    def __init__(self, backend: Optional[str] = None):
+        if backend is None:
+            backend = 'lxml' if etree else 'html.parser'
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown parser backend {backend!r}, expected one of {BACKENDS}")
+        if backend == 'lxml' and etree is None:
+            raise ImportError("The lxml parser backend needs the lxml package")
+        self.backend = backend
+
+    def extract(self, html_content: str) -> List[ExtractedTable]:
+        """Return the page's wikitables in document order"""
+        if self.backend == 'lxml':
+            raw_tables = self._tables_lxml(html_content)
+        else:
+            raw_tables = self._tables_soup(html_content)
+        return [ExtractedTable(i, caption, section, build_frame(rows))
+                for i, (caption, section, rows) in enumerate(raw_tables)]
+
+    def _tables_lxml(self, html_content):
+        root = etree.HTML(html_content)
+        if root is None:
+            return []
+        tables = []
+        section = ""
+        for elem in root.iter('table', *HEADINGS):
+            if elem.tag in HEADINGS:
+                section = clean_cell(element_text(elem).strip())
+                continue
+            if 'wikitable' not in element_classes(elem):
+                continue
+            caption = next((c for c in elem if c.tag == 'caption'), None)
+            rows = []
+            for tr in elem.iter('tr'):
+                # Rows of nested tables belong to those tables
+                if next(tr.iterancestors('table')) is not elem:
+                    continue
+                rows.append([self._cell(cell.tag, element_text(cell), cell.get('rowspan'), cell.get('colspan'))
+                             for cell in tr if cell.tag in ('th', 'td')])
+            tables.append((clean_cell(element_text(caption).strip()) if caption is not None else "", section, rows))
+        return tables
+
+    def _tables_soup(self, html_content):
+        soup = BeautifulSoup(html_content, 'html.parser')
+        tables = []
+        section = ""
+        for elem in soup.find_all(['table', *HEADINGS]):
+            if elem.name in HEADINGS:
+                section = clean_cell(elem.get_text().strip())
+                continue
+            if 'wikitable' not in elem.get('class', []):
+                continue
+            caption = elem.find('caption', recursive=False)
+            rows = []
+            for tr in elem.find_all('tr'):
+                if tr.find_parent('table') is not elem:
+                    continue
+                rows.append([self._cell(cell.name, cell.get_text(), cell.get('rowspan'), cell.get('colspan'))
+                             for cell in tr.find_all(['th', 'td'], recursive=False)])
+            tables.append((clean_cell(caption.get_text().strip()) if caption else "", section, rows))
+        return tables
+
+    @staticmethod
+    def _cell(tag, text, rowspan, colspan):
+        return make_cell(tag, clean_cell(text.strip()).strip(), rowspan, colspan)
+
+
+def extract_tables(html_content: str, backend: Optional[str] = None) -> List[ExtractedTable]:
+    """Extract every wikitable on a page as a typed DataFrame."""
+    return TableExtractor(backend).extract(html_content)
+
+
+def tables_to_json(tables: List[ExtractedTable]) -> str:
+    """Serialise a page's tables, keeping column dtypes, for the 'tables' storage kind"""
+    return json.dumps([{
+        'caption': table.caption,
+        'section': table.section,
+        'columns': list(table.frame.columns),
+        'dtypes': [str(dtype) for dtype in table.frame.dtypes],
+        # Through Python objects so floats round-trip exactly and missing cells become null
+        'rows': table.frame.astype(object).where(table.frame.notna(), None).values.tolist(),
+    } for table in tables])
+
+
+def tables_from_json(text: str) -> List[ExtractedTable]:
+    """Inverse of tables_to_json"""
+    tables = []
+    for i, entry in enumerate(json.loads(text)):
+        frame = pd.DataFrame(entry['rows'], columns=entry['columns'])
+        frame = frame.astype(dict(zip(entry['columns'], entry['dtypes'])))
+        tables.append(ExtractedTable(i, entry['caption'], entry['section'], frame))
+    return tables
+
+
+class TableIndex:
+    """SQLite index of stored tables by page, caption, section and column names"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS tables (
+                page TEXT NOT NULL,
+                table_no INTEGER NOT NULL,
+                caption TEXT NOT NULL,
+                section TEXT NOT NULL,
+                columns TEXT NOT NULL,
+                row_count INTEGER NOT NULL,
+                PRIMARY KEY (page, table_no)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS tables_caption ON tables (caption)")
+        self.conn.commit()
+
+    def replace_page(self, page, tables: List[ExtractedTable]):
+        """Swap a page's index entries for its current tables"""
+        with self.conn:
+            self.conn.execute("DELETE FROM tables WHERE page = ?", (page,))
+            self.conn.executemany(
+                "INSERT INTO tables (page, table_no, caption, section, columns, row_count) VALUES (?, ?, ?, ?, ?, ?)",
+                ((page, t.table_no, t.caption, t.section, json.dumps(list(t.frame.columns)), len(t.frame))
+                 for t in tables)
+            )
+
+    def find(self, caption=None, section=None, column=None, page=None):
+        """Return [(page, table_no, caption, section, columns, row_count)] matching every given filter"""
+        query = "SELECT page, table_no, caption, section, columns, row_count FROM tables WHERE 1"
+        params = []
+        for field, value in (('caption', caption), ('section', section), ('page', page)):
+            if value is not None:
+                query += f" AND {field} = ?"
+                params.append(value)
+        rows = []
+        for page_name, table_no, caption_text, section_text, columns, row_count in self.conn.execute(query, params):
+            columns = json.loads(columns)
+            if column is None or column in columns:
+                rows.append((page_name, table_no, caption_text, section_text, columns, row_count))
+        return rows
+
+    def close(self):
+        self.conn.close()
+
+
+def load_tables(output_dir="wiki_pages", caption=None, section=None, column=None, storage=None):
+    """Concatenate every stored table matching the filters into one DataFrame with page and table_no columns
+
+    load_tables(column='Rarity') gathers every drop table on the wiki for one
+    vectorised query.
+    """
+    index = TableIndex(os.path.join(output_dir, 'tables_index.sqlite'))
+    store = open_storage(output_dir, storage)
+    try:
+        matches = index.find(caption=caption, section=section, column=column)
+        frames = []
+        pages = {}
+        for page, table_no, _, _, _, _ in matches:
+            pages.setdefault(page, []).append(table_no)
+        for page, numbers in pages.items():
+            text = store.read(page, 'tables')
+            if text is None:
+                continue
+            tables = tables_from_json(text)
+            for table_no in numbers:
+                frame = tables[table_no].frame.copy()
+                frame.insert(0, 'table_no', table_no)
+                frame.insert(0, 'page', page)
+                frames.append(frame)
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    finally:
+        index.close()
+        store.close()
+
+
+def extract_batch(batch):
+    """Extract the tables of a batch of (title, html) in a worker process"""
+    extractor = TableExtractor()
+    results = []
+    for title, html in batch:
+        try:
+            results.append((title, extractor.extract(html), None))
+        except Exception as e:
+            results.append((title, None, str(e)))
+    return results
+
+
+def extract_corpus(output_dir="wiki_pages", storage=None, workers=None, batch_size=64):
+    """Store every page's wikitables next to its markdown and rebuild the table index"""
+    store = open_storage(output_dir, storage)
+    index = TableIndex(os.path.join(output_dir, 'tables_index.sqlite'))
+    workers = workers or os.cpu_count() or 1
+    start = time.time()
+    pages = tables_found = 0
+
+    def batches():
+        batch = []
+        for title, html in store.iter_pages('html'):
+            batch.append((title, html))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for results in bounded_map(executor, extract_batch, batches(), workers * 2):
+                for title, tables, error in results:
+                    if error is not None:
+                        print(f"[{datetime.now().strftime('%H:%M:%S')}] Error extracting tables from {title}: {error}")
+                        continue
+                    store.write_page(title, {'tables': tables_to_json(tables)})
+                    pages += 1
+                    tables_found += len(tables)
+                # Index entries only point at tables that reached the disk
+                store.flush()
+                for title, tables, error in results:
+                    if error is None:
+                        index.replace_page(title, tables)
+    finally:
+        store.close()
+        index.close()
+
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Extracted {tables_found} tables from {pages} pages "
+          f"in {time.time() - start:.1f}s")
+    return pages, tables_found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract wikitables from stored pages as typed tables')
+    parser.add_argument('--output-dir', default='wiki_pages', help='Crawl output directory (default: wiki_pages)')
+    parser.add_argument('--storage', choices=['files', 'shards'],
+                        help='Storage backend of the crawl (default: detected)')
+    parser.add_argument('--workers', type=int, help='Parse processes (default: one per CPU)')
+    parser.add_argument('--batch-size', type=int, default=64, help='Pages per worker task (default: 64)')
+    parser.add_argument('--column', help='Instead of extracting, load every stored table with this column')
+    parser.add_argument('--caption', help='Instead of extracting, load every stored table with this caption')
+    args = parser.parse_args()
+
+    if args.column or args.caption:
+        frame = load_tables(args.output_dir, caption=args.caption, column=args.column, storage=args.storage)
+        print(frame.to_string(max_rows=50))
+        print(f"{len(frame)} rows from {frame['page'].nunique() if len(frame) else 0} pages")
+        return
+
+    extract_corpus(args.output_dir, args.storage, args.workers, args.batch_size)
+
+if __name__ == "__main__":
+    main()
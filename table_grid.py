@@ -0,0 +1,96 @@
+from collections import namedtuple
+from typing import List, Optional
+
+# A table cell before spans are resolved
+Cell = namedtuple('Cell', ['text', 'header', 'rowspan', 'colspan'])
+
+# Browsers clamp spans to these, and so do we, so a bad attribute can't blow up the grid
+MAX_COLSPAN = 1000
+MAX_ROWSPAN = 65534
+
+
+def parse_span(value, limit):
+    """A rowspan/colspan attribute as a count of 1..limit"""
+    try:
+        span = int(value)
+    except (TypeError, ValueError):
+        return 1
+    # rowspan="0" means "to the end of the section", which wiki tables don't use; treat it as 1
+    return min(span, limit) if span > 0 else 1
+
+
+def make_cell(tag, text, rowspan, colspan):
+    """Cell of a th/td from its text and raw span attributes"""
+    return Cell(text, tag == 'th', parse_span(rowspan, MAX_ROWSPAN), parse_span(colspan, MAX_COLSPAN))
+
+
+class GridLayout:
+    """Lays a table's rows out on its grid one row at a time, carrying rowspans down"""
+
+    def __init__(self):
+        self.carried = {}  # column -> (rows still covered, cell) for rowspans from earlier rows
+        self.width = 0
+
+    def place(self, row: List[Cell]) -> List[Optional[Cell]]:
+        """The slots of the next row: each cell repeated over the columns it spans, None for gaps"""
+        carried = self.carried
+        out = []
+        cells = iter(row)
+        cell = next(cells, None)
+        while cell is not None or any(col >= len(out) for col in carried):
+            col = len(out)
+            if col in carried:
+                remaining, spanning = carried[col]
+                out.append(spanning)
+                if remaining > 1:
+                    carried[col] = (remaining - 1, spanning)
+                else:
+                    del carried[col]
+            elif cell is not None:
+                for offset in range(cell.colspan):
+                    out.append(cell)
+                    if cell.rowspan > 1:
+                        carried[col + offset] = (cell.rowspan - 1, cell)
+                cell = next(cells, None)
+            else:
+                out.append(None)  # Gap before a column still covered by a rowspan
+        self.width = max(self.width, len(out))
+        return out
+
+
+def resolve_grid(rows: List[List[Cell]]) -> List[List[Optional[Cell]]]:
+    """Lay cells out on a grid, repeating rowspan/colspan cells into every slot they cover"""
+    layout = GridLayout()
+    grid = [layout.place(row) for row in rows]
+    for row in grid:
+        row.extend([None] * (layout.width - len(row)))
+    return grid
+
+
+class MarkdownRows:
+    """Cell texts of a table's markdown rows, laid out on the rowspan/colspan grid
+
+    Every tr of the table goes through row() in document order, repeated header
+    rows too so their spans take up the right slots. A rowspan cell's text is
+    repeated down each row it covers; a colspan cell's text stands in its first
+    column and the others are left blank, as are slots a hidden row spans into.
+    """
+
+    def __init__(self):
+        self.layout = GridLayout()
+        self.hidden = {}  # id -> cell, for the cells of rows that are not shown
+
+    @property
+    def width(self):
+        return self.layout.width
+
+    def row(self, cells: List[Cell], shown=True) -> Optional[List[str]]:
+        """Texts of one row's slots, or None if the row is hidden or has no text of its own"""
+        slots = self.layout.place(cells)
+        if not shown:
+            self.hidden.update((id(cell), cell) for cell in cells)
+            return None
+        if not any(cell.text.strip() for cell in cells):
+            return None
+        return ['' if cell is None or id(cell) in self.hidden or (col and slots[col - 1] is cell) else cell.text
+                for col, cell in enumerate(slots)]
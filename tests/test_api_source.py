@@ -0,0 +1,44 @@
+from main import WikiCrawler
+from replay_server import ReplayServer
+
+
+def test_api_source_stores_every_redirect_origin(tmp_path):
+    redirects = {'Whip_weapon': 'Abyssal_whip', 'Abyssal whip (weapon)': 'Abyssal_whip'}
+    with ReplayServer('fixtures/pages', redirects=redirects) as server:
+        crawler = WikiCrawler(
+            output_dir=str(tmp_path / 'out'),
+            dataset_dir=str(tmp_path / 'dataset'),
+            base_url=server.url,
+            source='api',
+            threads=2,
+            delay=0,
+            max_requests=1000,
+            metrics_interval=3600
+        )
+        crawler.crawl()
+        stored = crawler.metrics.counter('pages_stored')
+        failed = crawler.metrics.counter('pages_failed')
+        crawler.storage.close()
+
+    # Five fixture pages plus both titles redirecting to the whip
+    assert stored == len(server.pages) + len(redirects)
+    assert failed == 0
+    whip = crawler.storage.read('Abyssal_whip', 'wikitext')
+    assert whip.startswith("'''Abyssal whip'''")
+    assert crawler.storage.read('Whip_weapon', 'wikitext') == whip
+    assert crawler.storage.read('Abyssal_whip_(weapon)', 'wikitext') == whip
+    assert crawler.storage.read('Whip_weapon', 'markdown')
+
+
+def test_api_query_normalises_and_marks_missing():
+    server = ReplayServer('fixtures/pages', redirects={'Whip weapon': 'Abyssal whip'})
+    try:
+        query = server.api_query({'action': 'query', 'redirects': '1',
+                                  'titles': 'abyssal_demon|Whip weapon|No such page'})['query']
+    finally:
+        server.server.server_close()
+    assert query['normalized'] == [{'from': 'abyssal_demon', 'to': 'Abyssal demon'}]
+    assert query['redirects'] == [{'from': 'Whip weapon', 'to': 'Abyssal whip'}]
+    pages = {page['title']: page for page in query['pages']}
+    assert pages['No such page']['missing'] is True
+    assert pages['Abyssal whip']['revisions'][0]['slots']['main']['content']
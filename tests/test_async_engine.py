@@ -0,0 +1,41 @@
+import asyncio
+
+from main import WikiCrawler
+from replay_server import ReplayServer
+
+
+def on_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def test_async_engine_keeps_storage_off_the_event_loop(tmp_path):
+    calls = []
+
+    with ReplayServer('fixtures/pages') as server:
+        crawler = WikiCrawler(
+            output_dir=str(tmp_path / 'out'),
+            dataset_dir=str(tmp_path / 'dataset'),
+            base_url=server.url,
+            engine='async',
+            concurrency=4,
+            delay=0,
+            max_requests=1000,
+            metrics_interval=3600
+        )
+        storage = crawler.storage
+        for name in ('has_page', 'write_page'):
+            method = getattr(storage, name)
+
+            def traced(*args, _method=method, _name=name):
+                calls.append((_name, on_event_loop()))
+                return _method(*args)
+            setattr(storage, name, traced)
+        crawler.crawl()
+
+    assert crawler.metrics.counter('pages_stored') == len(server.pages)
+    assert {name for name, _ in calls} == {'has_page', 'write_page'}
+    assert not any(on_loop for _, on_loop in calls)
@@ -0,0 +1,42 @@
+from boilerplate import candidate_blocks, fingerprint, restore_page, strip_page
+
+BONUSES = '\n'.join(f"* {stat}: +0" for stat in (
+    'Stab', 'Slash', 'Crush', 'Magic', 'Ranged', 'Strength bonus', 'Ranged strength', 'Magic damage', 'Prayer bonus'))
+NAVIGATION = '\n'.join(f"* [Slayer equipment item number {n}](/w/Slayer_equipment)" for n in range(8))
+
+
+def item_page(title):
+    return '\n'.join([
+        f"# {title}\n",
+        f"{title} is an item that does nothing special.\n",
+        "## Combat Statistics\n",
+        "### Attack Bonuses",
+        BONUSES,
+        "",
+        "### Defence Bonuses",
+        BONUSES,
+        "",
+        "## Navigation\n",
+        NAVIGATION,
+        "",
+    ])
+
+
+def test_subsections_of_protected_sections_are_not_candidates():
+    markdown = item_page('Bucket')
+    lines = markdown.split('\n')
+    protected_end = lines.index('## Navigation')
+    candidates = list(candidate_blocks(markdown, min_bytes=100))
+    assert candidates
+    assert all(start >= protected_end for _, start, _, _ in candidates)
+    assert any(text.startswith('## Navigation') for kind, _, _, text in candidates if kind == 'section')
+
+
+def test_strip_keeps_repeated_bonus_tables():
+    boilerplate = {fingerprint(text) for _, _, _, text in candidate_blocks(item_page('Bucket'), min_bytes=100)}
+    markdown = item_page('Pot')
+    stripped, removed = strip_page(markdown, boilerplate, min_bytes=100)
+    assert stripped.count(BONUSES) == 2
+    assert NAVIGATION not in stripped
+    assert len(removed) == 1
+    assert restore_page(stripped, removed) == markdown
@@ -0,0 +1,65 @@
+from boilerplate import estimate_tokens
+from chunking import chunk_markdown
+
+HEADER = '| Item | Quantity | Rarity |'
+SEPARATOR = '|---|---|---|'
+ROWS = [f"| Drop number {i} of the abyssal demon | {i * 10} | 1/{i + 2} |" for i in range(120)]
+
+PAGE = '\n'.join([
+    '# Abyssal demon',
+    '',
+    'Abyssal demons are demons that require level 85 Slayer to kill. ' * 3,
+    '',
+    '## Item information',
+    '',
+    '* Members: Yes',
+    '',
+    '## Drops',
+    '',
+    'Abyssal demons drop the following items.',
+    HEADER,
+    SEPARATOR,
+    *ROWS,
+    '',
+    '## Strategy',
+    '',
+    'Bring a whip and protect from melee. ' * 20,
+])
+
+
+def test_short_page_is_one_chunk():
+    assert chunk_markdown('# Whip\n\nA short page.\n', max_tokens=100) == ['# Whip\n\nA short page.\n']
+
+
+def test_every_chunk_carries_the_page_context():
+    chunks = chunk_markdown(PAGE, max_tokens=400, context_tokens=128)
+    assert len(chunks) > 3
+    for chunk in chunks:
+        assert chunk.startswith('# Abyssal demon')
+        assert '* Members: Yes' in chunk
+
+
+def test_split_table_keeps_rows_together_and_repeats_its_header():
+    chunks = chunk_markdown(PAGE, max_tokens=400, context_tokens=128)
+    table_chunks = [chunk for chunk in chunks if '| Drop number' in chunk]
+    assert len(table_chunks) > 1
+    seen = []
+    for chunk in table_chunks:
+        lines = chunk.split('\n')
+        start = lines.index(HEADER)
+        assert lines[start + 1] == SEPARATOR
+        table = lines[start:]
+        table = table[:table.index('')] if '' in table else table
+        # No blank lines between rows: the table runs unbroken to its end in the chunk
+        assert all(line.startswith('| Drop number') for line in table[2:])
+        seen += table[2:]
+        assert estimate_tokens(chunk) <= 400 * 1.1
+    assert seen == ROWS
+    assert sum('## Drops (continued)' in chunk for chunk in table_chunks) == len(table_chunks) - 1
+
+
+def test_sections_stay_in_page_order():
+    chunks = chunk_markdown(PAGE, max_tokens=400, context_tokens=128)
+    text = '\n'.join(chunks)
+    assert text.index('## Drops') < text.index('## Strategy')
+    assert 'Bring a whip' in chunks[-1]
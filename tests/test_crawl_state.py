@@ -0,0 +1,90 @@
+import json
+import sqlite3
+
+from crawl_state import CrawlStateStore
+from main import WikiCrawler
+from replay_server import ReplayServer
+
+
+def test_resume_after_reopen(tmp_path):
+    path = str(tmp_path / 'state.sqlite')
+    state = CrawlStateStore(path, flush_interval=0.05)
+    state.mark_done('a')
+    state.mark_failed('b', 'timeout')
+    state.mark_failed('b', 'HTTP 500')
+    state.mark_done('c')
+    state.mark_failed('c', 'late retry')
+    state.update_validators('d', {'etag': '"v1"'})
+    state.close()
+
+    state = CrawlStateStore(path)
+    try:
+        # A failure after success leaves the URL done, and a validator alone doesn't finish a URL
+        assert state.load_done() == {'a', 'c'}
+        assert state.load_error_counts() == {'b': 2, 'c': 1}
+        assert state.load_validators() == {'d': {'etag': '"v1"'}}
+    finally:
+        state.close()
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT last_error FROM pages WHERE url = 'b'").fetchone() == ('HTTP 500',)
+    conn.close()
+
+
+def test_validators_merge_per_field(tmp_path):
+    state = CrawlStateStore(str(tmp_path / 'state.sqlite'), flush_interval=0.05)
+    try:
+        state.mark_done('a')
+        state.update_validators('a', {'etag': '"v1"', 'lastmod': '2024-01-01'})
+        state.update_validators('a', {'etag': '"v2"'})
+        state.flush()
+        assert state.load_validators() == {'a': {'etag': '"v2"', 'lastmod': '2024-01-01'}}
+        assert state.load_done() == {'a'}
+    finally:
+        state.close()
+
+
+def test_legacy_json_is_imported_only_into_an_empty_store(tmp_path):
+    visited = tmp_path / 'visited_pages.json'
+    visited.write_text(json.dumps(['a', 'b']))
+    manifest = tmp_path / 'manifest.json'
+    manifest.write_text(json.dumps({'a': {'etag': '"v1"', 'content_hash': 'abc'}}))
+
+    state = CrawlStateStore(str(tmp_path / 'state.sqlite'), flush_interval=0.05)
+    try:
+        assert state.import_visited_json(str(visited)) == 2
+        assert state.import_manifest_json(str(manifest)) == 1
+        # A second run finds the store populated and leaves it alone
+        visited.write_text(json.dumps(['a', 'b', 'c']))
+        assert state.import_visited_json(str(visited)) == 0
+        assert state.import_manifest_json(str(manifest)) == 0
+        assert state.import_visited_json(str(tmp_path / 'missing.json')) == 0
+        assert state.load_done() == {'a', 'b'}
+        assert state.load_validators() == {'a': {'etag': '"v1"', 'content_hash': 'abc'}}
+    finally:
+        state.close()
+
+
+def test_crawler_resumes_without_refetching(tmp_path):
+    def crawler(server):
+        return WikiCrawler(
+            output_dir=str(tmp_path / 'out'),
+            dataset_dir=str(tmp_path / 'dataset'),
+            base_url=server.url,
+            threads=2,
+            delay=0,
+            max_requests=1000,
+            metrics_interval=3600
+        )
+
+    with ReplayServer('fixtures/pages') as server:
+        first = crawler(server)
+        first.crawl()
+        second = crawler(server)
+        requests = sum(server.stats.values())
+        second.crawl()
+        refetched = sum(server.stats.values()) - requests
+
+    assert first.metrics.counter('pages_stored') == len(server.pages)
+    assert second.metrics.counter('pages_stored') == 0
+    assert refetched <= 2  # The sitemap index and shard, no pages
+    assert len(second.state.load_done()) == len(server.pages)
@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+from export_parquet import build_frame, query_filters
+
+RECORDS = [
+    {'title': 'Abyssal_whip', 'kind': 'html', 'page_type': 'equipment', 'attack_slash': '+82',
+     'strength': '+82', 'magic_damage': '0%', 'weight': '0.453 kg', 'high_alch': '72,000 coins',
+     'examine': 'A weapon from the abyss.'},
+    {'title': 'Ancestral_hat', 'kind': 'html', 'page_type': 'equipment', 'attack_slash': '0',
+     'strength': '0', 'magic_damage': '2.5%', 'weight': '0.4 kg', 'high_alch': '1', 'examine': '42'},
+    {'title': 'Abyssal_demon', 'kind': 'wikitext', 'page_type': 'monster', 'combat_level': '124',
+     'examine': 'A denizen of the Abyss!'},
+]
+
+
+def test_build_frame_types():
+    frame = build_frame(RECORDS)
+    assert list(frame.columns[:4]) == ['title', 'kind', 'page_type', 'attack_stab']
+    assert frame['attack_slash'].dtype == 'Int64'
+    assert frame['strength'].tolist()[:2] == [82, 0]
+    assert frame['prayer'].dtype == 'Int64' and frame['prayer'].isna().all()
+    # Magic damage keeps its fraction even when most values are whole
+    assert frame['magic_damage'].dtype == 'Float64'
+    assert frame['magic_damage'].tolist()[:2] == [0.0, 2.5]
+    assert frame['weight'].dtype == 'Float64'
+    assert frame['high_alch'].dtype == 'Int64'
+    assert frame['high_alch'].tolist()[:2] == [72000, 1]
+    assert frame['combat_level'].dtype == 'Int64'
+    # A column with any non-numeric value stays text, numbers included
+    assert frame['examine'].dtype == 'string'
+    assert frame.loc[1, 'examine'] == '42'
+
+
+def test_query_filters():
+    assert query_filters("attack_slash > 80 and page_type == 'equipment'") == [
+        ('attack_slash', '>', 80), ('page_type', '=', 'equipment')]
+    assert query_filters('magic_damage >= 2.5') == [('magic_damage', '>=', 2.5)]
+    assert query_filters('attack_slash > 80 or strength > 80') is None
+    assert query_filters('attack_slash > strength') is None
+
+
+def test_query_reads_only_matching_rows_and_columns(tmp_path):
+    pytest.importorskip('pyarrow')
+    from export_parquet import query_dataset, write_dataset
+
+    path = str(tmp_path / 'pages.parquet')
+    write_dataset(build_frame(RECORDS), path)
+    matches, rows = query_dataset(path, "attack_slash > 80 - 1 and page_type == 'equipment'")
+    assert rows == 3
+    assert list(matches.columns) == ['title', 'page_type', 'attack_slash']
+    assert matches['title'].tolist() == ['Abyssal_whip']
+
+    matches, _ = query_dataset(path, "magic_damage > 1")
+    assert matches['title'].tolist() == ['Ancestral_hat']
+    assert pd.api.types.is_float_dtype(matches['magic_damage'])
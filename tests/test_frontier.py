@@ -0,0 +1,52 @@
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from frontier import CrawlFrontier, UrlScorer, title_weight
+from sitemap import SitemapURL
+
+BASE = 'https://oldschool.runescape.wiki/w/'
+
+
+def test_pops_best_score_first_and_ties_in_insertion_order():
+    frontier = CrawlFrontier()
+    frontier.extend([('a', 1.0), ('b', 2.0), ('c', 1.0)])
+    frontier.push('d', 2.0)
+    frontier.push('e', 0.5)
+    assert frontier.peek(2) == [('b', 2.0), ('d', 2.0)]
+    assert list(frontier) == ['b', 'd', 'a', 'c', 'e']
+    assert len(frontier) == 0
+    assert frontier.pop() is None
+
+
+def test_stops_once_the_deadline_passes():
+    frontier = CrawlFrontier(deadline=time.time() - 1)
+    frontier.push('a', 1.0)
+    assert list(frontier) == []
+    assert len(frontier) == 1
+
+
+@pytest.mark.parametrize('title, weight', [
+    ('Abyssal_whip', 1.0),
+    ('Abyssal_demon/Strategies', 0.6),
+    ('Update:Slayer_rewards', 0.3),
+    ('Whip_(disambiguation)', 0.2),
+    ('26_January', 0.1),
+    ('2005', 0.1),
+])
+def test_title_weight(title, weight):
+    assert title_weight(title) == weight
+
+
+def test_scorer_ranks_articles_recent_edits_and_clean_urls_first():
+    now = datetime(2024, 6, 1, tzinfo=timezone.utc)
+    scorer = UrlScorer(error_counts={BASE + 'Failing_page': 2}, now=now)
+    article = scorer.score(SitemapURL(BASE + 'Abyssal_whip', None, None))
+    assert scorer.score(SitemapURL(BASE + '2005', None, None)) < article
+    assert scorer.score(SitemapURL(BASE + 'Failing_page', None, None)) == pytest.approx(article - 0.5)
+    recent = scorer.score(SitemapURL(BASE + 'Abyssal_whip', '2024-05-31T00:00:00Z', None))
+    stale = scorer.score(SitemapURL(BASE + 'Abyssal_whip', '2014-05-31', None))
+    assert article < stale < recent
+    # The default sitemap priority is 0.5
+    assert scorer.score(SitemapURL(BASE + 'Abyssal_whip', None, 1.0)) == pytest.approx(article + 0.5)
@@ -0,0 +1,79 @@
+import csv
+import time
+
+from job_ledger import JobLedger
+
+
+def read_rows(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+
+def test_each_document_is_committed_once(tmp_path):
+    output = tmp_path / 'qa_dataset.csv'
+    ledger = JobLedger(str(tmp_path / 'jobs.sqlite'), output)
+    ledger.add(['a', 'b'])
+    assert ledger.claim('a', 'run-1')
+    assert ledger.commit('a', [['qa 1'], ['qa 2']])
+    # A second commit of the same document, e.g. from a run that lost its lease, writes nothing
+    assert not ledger.commit('a', [['qa 1'], ['qa 2']])
+    assert not ledger.claim('a', 'run-2')
+    assert ledger.finished() == {'a'}
+    assert read_rows(output) == [['qa 1'], ['qa 2']]
+    ledger.close()
+
+
+def test_uncommitted_tail_is_truncated(tmp_path):
+    output = tmp_path / 'qa_dataset.csv'
+    ledger = JobLedger(str(tmp_path / 'jobs.sqlite'), output)
+    ledger.add(['a', 'b'])
+    ledger.claim('a', 'run-1')
+    ledger.commit('a', [['qa a']])
+    ledger.close()
+    # Rows of a crash between the append and the ledger update
+    with open(output, 'a', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerow(['qa b, half written'])
+
+    ledger = JobLedger(str(tmp_path / 'jobs.sqlite'), output)
+    assert read_rows(output) == [['qa a']]
+    ledger.claim('b', 'run-2')
+    ledger.commit('b', [['qa b']])
+    assert read_rows(output) == [['qa a'], ['qa b']]
+    ledger.close()
+
+
+def test_expired_lease_can_be_claimed(tmp_path):
+    ledger = JobLedger(str(tmp_path / 'jobs.sqlite'), tmp_path / 'qa_dataset.csv', lease_seconds=0.05)
+    ledger.add(['a'])
+    assert ledger.claim('a', 'run-1')
+    assert not ledger.claim('a', 'run-2')
+    time.sleep(0.1)
+    assert ledger.claim('a', 'run-2')
+    ledger.close()
+
+
+def test_release_returns_only_the_owners_documents(tmp_path):
+    ledger = JobLedger(str(tmp_path / 'jobs.sqlite'), tmp_path / 'qa_dataset.csv')
+    ledger.add(['a', 'b'])
+    ledger.claim('a', 'run-1')
+    ledger.claim('b', 'run-2')
+    assert ledger.release('run-1') == 1
+    assert ledger.counts()['pending'] == 1
+    assert ledger.counts()['in_flight'] == 1
+    # Released documents get their attempt back
+    assert ledger.claim('a', 'run-3')
+    assert ledger._conn().execute("SELECT attempts FROM jobs WHERE name = 'a'").fetchone()[0] == 1
+    ledger.close()
+
+
+def test_failed_documents_retry_until_max_attempts(tmp_path):
+    ledger = JobLedger(str(tmp_path / 'jobs.sqlite'), tmp_path / 'qa_dataset.csv', max_attempts=2)
+    ledger.add(['a'])
+    for _ in range(2):
+        assert ledger.claim('a', 'run-1')
+        ledger.fail('a', 'no Q&A pairs generated')
+    assert not ledger.claim('a', 'run-1')
+    assert ledger.finished() == {'a'}
+    assert ledger.retry_failed() == 1
+    assert ledger.claim('a', 'run-1')
+    ledger.close()
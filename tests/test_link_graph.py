@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+import pytest
+
+from link_graph import LinkGraphBuilder
+from main import WikiCrawler
+from storage import FileStorage, ShardStorage
+
+
+def page(*links):
+    anchors = ''.join(f'<p><a href="/w/{link}">{link}</a></p>' for link in links)
+    return f'<html><body><h1 id="firstHeading">Page</h1><div class="mw-parser-output">{anchors}</div></body></html>'
+
+
+@pytest.mark.parametrize('backend', ['files', 'shards'])
+def test_titles_with_slashes_are_one_node(tmp_path, backend):
+    output_dir = str(tmp_path / 'pages')
+    storage = FileStorage(output_dir) if backend == 'files' else ShardStorage(str(tmp_path / 'pages' / 'shards'))
+    storage.write_page('Slayer/Tasks', {'html': page('Abyssal_demon', 'Slayer')})
+    storage.write_page('Slayer', {'html': page('Slayer/Tasks')})
+    storage.write_page('Abyssal_demon', {'html': page('Slayer/Tasks', 'slayer')})
+    storage.close()
+
+    graph = LinkGraphBuilder(output_dir, storage=backend, workers=1).build(str(tmp_path / 'graph'))
+    assert len(graph) == 3
+    assert graph.out_degree('Slayer/Tasks') == 2
+    assert graph.in_degree('Slayer/Tasks') == 2
+    assert sorted(graph.in_neighbours('Slayer')) == ['Abyssal_demon', 'Slayer_Tasks']
+    assert graph.id('Slayer/Tasks') == graph.id('Slayer_Tasks')
+    assert np.isclose(np.sum(graph.ranks), 1.0)
+    assert graph.top_pagerank(1)[0][0] == 'Slayer_Tasks'
+
+
+def test_crawler_pagerank_lookup_reads_the_graph(tmp_path):
+    output_dir = str(tmp_path / 'pages')
+    storage = FileStorage(output_dir)
+    storage.write_page('Slayer/Tasks', {'html': page('Slayer')})
+    storage.write_page('Slayer', {'html': page('Slayer/Tasks')})
+    storage.write_page('Abyssal_demon', {'html': page('Slayer')})
+    graph = LinkGraphBuilder(output_dir, workers=1).build(os.path.join(output_dir, 'link_graph'))
+
+    crawler = WikiCrawler(output_dir=output_dir, dataset_dir=str(tmp_path / 'dataset'))
+    rank = crawler._load_pagerank()
+    crawler.state.close()
+    assert rank('Slayer/Tasks') == pytest.approx(graph.pagerank('Slayer/Tasks') * 3)
+    assert rank('Slayer') > rank('Abyssal_demon')
+    assert rank('Missing page') is None
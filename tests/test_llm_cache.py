@@ -0,0 +1,74 @@
+import pickle
+import threading
+
+import llm_cache
+from llm_cache import LLMCache, cache_key
+
+
+def test_key_covers_every_part():
+    key = cache_key('ollama', 'qwen', 'prompt', 0.7, 'qa')
+    assert key == cache_key('ollama', 'qwen', 'prompt', 0.7, 'qa')
+    assert len({
+        key,
+        cache_key('deepseek', 'qwen', 'prompt', 0.7, 'qa'),
+        cache_key('ollama', 'llama', 'prompt', 0.7, 'qa'),
+        cache_key('ollama', 'qwen', 'prompt!', 0.7, 'qa'),
+        cache_key('ollama', 'qwen', 'prompt', 0.0, 'qa'),
+        cache_key('ollama', 'qwen', 'prompt', 0.7, 'packed'),
+    }) == 6
+
+
+def test_cached_generates_once_and_skips_empty(tmp_path):
+    cache = LLMCache(str(tmp_path / 'cache.sqlite'))
+    calls = []
+    assert cache.cached('ollama', 'qwen', 'p', lambda: calls.append(1) or 'answer') == 'answer'
+    assert cache.cached('ollama', 'qwen', 'p', lambda: calls.append(1) or 'other') == 'answer'
+    assert len(calls) == 1
+    assert cache.cached('ollama', 'qwen', 'empty', lambda: '') == ''
+    assert cache.get(cache_key('ollama', 'qwen', 'empty')) is None
+    assert (cache.hits, cache.misses) == (1, 3)
+    cache.close()
+
+
+def test_evicts_least_recently_used(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(llm_cache.time, 'time', lambda: clock[0])
+    cache = LLMCache(str(tmp_path / 'cache.sqlite'), max_bytes=350)
+    for i in range(3):
+        clock[0] += llm_cache.TOUCH_INTERVAL + 1
+        cache.put(f"k{i}", 'ollama', 'qwen', 'x' * 100)
+    # Reading k0 makes k1 the least recently used
+    clock[0] += llm_cache.TOUCH_INTERVAL + 1
+    assert cache.get('k0') is not None
+    clock[0] += 1
+    cache.put('k3', 'ollama', 'qwen', 'x' * 100)
+    assert cache.evict() == 1
+    assert cache.get('k1') is None
+    assert all(cache.get(key) is not None for key in ('k0', 'k2', 'k3'))
+    cache.close()
+
+
+def test_counters_are_exact_across_threads(tmp_path):
+    cache = LLMCache(str(tmp_path / 'cache.sqlite'))
+    cache.put('hit', 'ollama', 'qwen', 'answer')
+
+    def read():
+        for _ in range(200):
+            cache.get('hit')
+            cache.get('miss')
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert (cache.hits, cache.misses) == (800, 800)
+
+
+def test_survives_pickling(tmp_path):
+    cache = LLMCache(str(tmp_path / 'cache.sqlite'))
+    cache.put('k', 'ollama', 'qwen', 'answer')
+    copy = pickle.loads(pickle.dumps(cache))
+    assert copy.get('k') == 'answer'
+    copy.close()
+    cache.close()
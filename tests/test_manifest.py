@@ -0,0 +1,73 @@
+import json
+import sqlite3
+
+from crawl_state import CrawlStateStore
+from manifest import PageManifest
+
+URL = 'https://oldschool.runescape.wiki/w/Abyssal_whip'
+
+
+def test_updates_persist_per_url(tmp_path):
+    state = CrawlStateStore(str(tmp_path / 'crawl_state.sqlite'))
+    manifest = PageManifest(state)
+    manifest.update(URL, etag='"abc"', last_modified='Mon, 05 Oct 2026 10:00:00 GMT', lastmod=None)
+    manifest.update(URL, content_hash='f00d')
+    state.mark_done(URL)
+    manifest.save()
+    state.close()
+
+    state = CrawlStateStore(str(tmp_path / 'crawl_state.sqlite'))
+    manifest = PageManifest(state)
+    assert manifest.get(URL) == {'etag': '"abc"', 'last_modified': 'Mon, 05 Oct 2026 10:00:00 GMT',
+                                 'content_hash': 'f00d'}
+    assert manifest.conditional_headers(URL) == {'If-None-Match': '"abc"',
+                                                 'If-Modified-Since': 'Mon, 05 Oct 2026 10:00:00 GMT'}
+    assert state.load_done() == {URL}
+    state.close()
+
+
+def test_unchanged_fields_are_not_queued(tmp_path):
+    state = CrawlStateStore(str(tmp_path / 'crawl_state.sqlite'))
+    manifest = PageManifest(state)
+    manifest.update(URL, etag='"abc"')
+    manifest.save()
+    queued = []
+    state.update_validators = lambda url, fields: queued.append((url, fields))
+    manifest.update(URL, etag='"abc"', lastmod='2026-10-01T00:00:00Z')
+    assert queued == [(URL, {'lastmod': '2026-10-01T00:00:00Z'})]
+    state.close()
+
+
+def test_legacy_manifest_is_migrated_once(tmp_path):
+    legacy = tmp_path / 'manifest.json'
+    legacy.write_text(json.dumps({URL: {'lastmod': '2026-09-01T00:00:00Z', 'etag': '"old"'}}))
+    state = CrawlStateStore(str(tmp_path / 'crawl_state.sqlite'))
+    manifest = PageManifest(state, str(legacy))
+    assert not manifest.is_stale(URL, '2026-09-01T00:00:00Z')
+    assert manifest.is_stale(URL, '2026-10-01T00:00:00Z')
+    manifest.update(URL, etag='"new"')
+    manifest.save()
+    state.close()
+
+    # A second start keeps the newer validators instead of importing the file again
+    state = CrawlStateStore(str(tmp_path / 'crawl_state.sqlite'))
+    assert PageManifest(state, str(legacy)).get(URL)['etag'] == '"new"'
+    state.close()
+
+
+def test_old_state_store_gains_validator_columns(tmp_path):
+    path = str(tmp_path / 'crawl_state.sqlite')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE pages (url TEXT PRIMARY KEY, status TEXT NOT NULL, "
+                 "error_count INTEGER NOT NULL DEFAULT 0, last_error TEXT, updated_at REAL NOT NULL)")
+    conn.execute("INSERT INTO pages (url, status, updated_at) VALUES (?, 'done', 0)", (URL,))
+    conn.commit()
+    conn.close()
+
+    state = CrawlStateStore(path)
+    PageManifest(state).update(URL, etag='"abc"')
+    state.close()
+    state = CrawlStateStore(path)
+    assert state.load_validators() == {URL: {'etag': '"abc"'}}
+    assert state.load_done() == {URL}
+    state.close()
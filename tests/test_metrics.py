@@ -0,0 +1,41 @@
+import pytest
+
+from main import WikiCrawler
+from metrics import CrawlMetrics
+from replay_server import ReplayServer
+
+
+def test_prometheus_families_are_described_once():
+    metrics = CrawlMetrics()
+    metrics.inc('retries', status='429')
+    metrics.inc('retries', status='503')
+    metrics.inc('pages_stored')
+    metrics.observe('fetch', 0.2)
+    metrics.observe('write', 0.01)
+    lines = metrics.to_prometheus().splitlines()
+    assert lines.count('# TYPE crawler_retries counter') == 1
+    assert lines.count('# TYPE crawler_pages_stored counter') == 1
+    assert lines.count('# TYPE crawler_stage_seconds histogram') == 1
+    # Each family's description comes before its samples
+    assert lines.index('# TYPE crawler_retries counter') < lines.index('crawler_retries{status="429"} 1')
+    assert 'crawler_stage_seconds_count{stage="write"} 1' in lines
+
+
+@pytest.mark.parametrize('engine', ['threads', 'async', 'pipeline'])
+def test_every_engine_records_queue_wait(tmp_path, engine):
+    with ReplayServer('fixtures/pages') as server:
+        crawler = WikiCrawler(
+            output_dir=str(tmp_path / 'out'),
+            dataset_dir=str(tmp_path / 'dataset'),
+            base_url=server.url,
+            engine=engine,
+            threads=2,
+            concurrency=2,
+            parse_workers=1,
+            delay=0,
+            max_requests=1000,
+            metrics_interval=3600
+        )
+        crawler.crawl()
+    assert crawler.metrics.counter('pages_stored') == len(server.pages)
+    assert crawler.metrics.histograms['queue_wait'].count >= len(server.pages)
@@ -0,0 +1,65 @@
+import json
+
+from packing import DocumentPacker, split_packed_response
+from qa_generator import QAGenerator
+
+
+def test_packer_sends_large_documents_alone():
+    packer = DocumentPacker(token_budget=100, max_documents=6, small_tokens=40)
+    assert packer.add('big', 'word ' * 200) == [[('big', 'word ' * 200)]]
+    assert packer.flush() == []
+
+
+def packs(packer, documents):
+    ready = []
+    for name, content in documents:
+        ready += packer.add(name, content)
+    ready += packer.flush()
+    return [[name for name, _ in pack] for pack in ready]
+
+
+def test_packer_closes_a_pack_before_it_passes_the_budget():
+    # About 38 tokens each, so a third would take a pack past 100
+    documents = [(name, 'word ' * 30) for name in 'abcde']
+    assert packs(DocumentPacker(token_budget=100, max_documents=6, small_tokens=40), documents) == \
+        [['a', 'b'], ['c', 'd'], ['e']]
+
+
+def test_packer_closes_a_full_pack():
+    documents = [(name, 'word ' * 5) for name in 'abcdefg']
+    assert packs(DocumentPacker(token_budget=1000, max_documents=3, small_tokens=40), documents) == \
+        [['a', 'b', 'c'], ['d', 'e', 'f'], ['g']]
+
+
+def test_split_reads_every_id_form_and_drops_junk():
+    response = json.dumps({'documents': [
+        {'id': 1, 'qa_pairs': [{'question': 'q1', 'answer': 'a1'}]},
+        {'id': 'Document 2', 'qa_pairs': [{'question': 'q2', 'answer': 'a2'}, {'question': '', 'answer': 'x'}]},
+        {'id': '2', 'qa_pairs': [{'question': 'q2b', 'answer': 'a2b'}]},
+        {'id': 7, 'qa_pairs': [{'question': 'q7', 'answer': 'a7'}]},
+        {'id': 3, 'qa_pairs': None},
+        'not a document',
+    ]})
+    pairs = split_packed_response(response, 3)
+    assert pairs == {1: [{'question': 'q1', 'answer': 'a1'}],
+                     2: [{'question': 'q2', 'answer': 'a2'}, {'question': 'q2b', 'answer': 'a2b'}]}
+
+
+def test_documents_left_out_of_a_pack_are_asked_alone(tmp_path):
+    generator = QAGenerator(tmp_path / 'markdown', tmp_path / 'qa_dataset')
+    prompts = []
+
+    def query(prompt, temperature=0.7):
+        prompts.append(prompt)
+        if '"documents"' in prompt:
+            # The packed answer only covers the first document
+            return json.dumps({'documents': [{'id': 1, 'qa_pairs': [{'question': 'q1', 'answer': 'a1'}]}]})
+        return json.dumps({'qa_pairs': [{'question': 'q2', 'answer': 'a2'}]})
+
+    generator.query_ollama = query
+    content = 'The abyssal whip is a one-handed melee weapon. ' * 5
+    results = generator._generate_pack([('Abyssal_whip', content), ('Whip', content.replace('abyssal ', ''))])
+    assert results == [('Abyssal_whip', 'done', ['question: q1\nanswer: a1']),
+                       ('Whip', 'done', ['question: q2\nanswer: a2'])]
+    assert len(prompts) == 2
+    assert 'Document 2' in prompts[0] and 'Document' not in prompts[1]
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+from planner import DocumentStatsIndex, apportion, plan_questions
+
+
+def page(title, topic, lines=30, heading=True):
+    body = ''.join(f"{topic} fact {i}: {title} is described here in a sentence long enough to count.\n"
+                   for i in range(lines))
+    return f"# {title}\n\n{body}" if heading else body
+
+
+def plan_for(tmp_path, documents, **kwargs):
+    index = DocumentStatsIndex(str(tmp_path / 'stats.sqlite'))
+    index.update(documents.items())
+    stats = index.frame()
+    index.close()
+    return plan_questions(stats, **kwargs)
+
+
+def test_copy_does_not_make_its_original_a_duplicate(tmp_path):
+    # Without a title heading the copy can't be told apart from a redirect by name
+    whip = page('Abyssal whip', 'Whip', heading=False)
+    plan = plan_for(tmp_path, {
+        'Abyssal_whip.md': whip,
+        'Abyssal_whip_copy.md': whip,
+        'Abyssal_demon.md': page('Abyssal demon', 'Demon'),
+    })
+    assert pd.isna(plan.loc['Abyssal_whip.md', 'excluded'])
+    assert plan.loc['Abyssal_whip.md', 'duplicate'] == 0
+    assert plan.loc['Abyssal_whip_copy.md', 'excluded'] == 'copy of another page'
+    assert plan.loc['Abyssal_whip.md', 'questions'] > 0
+
+
+def test_redirects_are_excluded_and_leave_the_target_as_original(tmp_path):
+    whip = page('Abyssal whip', 'Whip')
+    plan = plan_for(tmp_path, {
+        # Sorts first, so without redirect handling the target would be the copy
+        'Abyss_whip.md': whip,
+        'Abyssal_whip.md': whip,
+        'Whip_weapon.md': '# Whip weapon\n\n#REDIRECT [[Abyssal whip]]\n',
+        'Cook\'s_Assistant.md': page("Cook's Assistant", 'Quest'),
+        'Slayer_task_list.md': page('Slayer task/list', 'Slayer'),
+    })
+    assert plan.loc['Abyss_whip.md', 'excluded'] == 'redirect'
+    assert plan.loc['Whip_weapon.md', 'excluded'] == 'redirect'
+    assert pd.isna(plan.loc['Abyssal_whip.md', 'excluded'])
+    # Titles whose characters are replaced in file names are not mistaken for redirects
+    assert pd.isna(plan.loc['Slayer_task_list.md', 'excluded'])
+    assert pd.isna(plan.loc["Cook's_Assistant.md", 'excluded'])
+
+
+def test_question_budget_is_spread_deterministically(tmp_path):
+    documents = {f'Page_{n}.md': page(f'Page {n}', f'Topic{n}', lines=5 + 10 * n) for n in range(5)}
+    first = plan_for(tmp_path, documents, questions=12)
+    second = plan_for(tmp_path, dict(reversed(documents.items())), questions=12)
+    assert first['questions'].sum() == 12
+    assert (first['questions'] >= 1).all()
+    assert first['questions'].equals(second['questions'])
+    assert first['questions'].is_monotonic_increasing
+
+
+def test_apportion_respects_caps_and_total():
+    shares = apportion(10, [5, 3, 2], caps=[2, 10, 10])
+    assert shares.sum() == 10
+    assert shares[0] == 2
+    assert list(apportion(3, [1, 1, 1, 1])) == [1, 1, 1, 0]
+    assert apportion(100, [1, 1], caps=[3, 4]).sum() == 7
+    assert np.array_equal(apportion(0, [1, 2]), [0, 0])
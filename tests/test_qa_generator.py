@@ -0,0 +1,102 @@
+import csv
+import json
+import threading
+
+import pytest
+import requests
+
+import qa_generator
+from qa_generator import DEFAULT_ENDPOINT, QAGenerator, resolve_endpoint
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return {'response': self.body}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {self.status_code}")
+
+
+class FakeSession:
+    """Answers posts from a script of responses and exceptions"""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.urls = []
+
+    def post(self, url, json=None, timeout=None):
+        self.urls.append(url)
+        outcome = self.script.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(qa_generator.time, 'sleep', slept.append)
+    return slept
+
+
+def generator(tmp_path, script, **kwargs):
+    gen = QAGenerator(tmp_path / 'markdown', tmp_path / 'qa_dataset', **kwargs)
+    gen.session = FakeSession(script)
+    return gen
+
+
+def test_retries_busy_and_unreachable_server(tmp_path, sleeps):
+    gen = generator(tmp_path, [FakeResponse(429), FakeResponse(503), requests.ConnectionError('refused'),
+                               FakeResponse(200, '{"qa_pairs": []}')], endpoint='http://ollama:11434')
+    assert gen.query_ollama('prompt') == '{"qa_pairs": []}'
+    assert sleeps == [1, 2, 4]
+    assert gen.session.urls == ['http://ollama:11434/api/generate'] * 4
+
+
+def test_gives_up_after_max_retries(tmp_path, sleeps):
+    gen = generator(tmp_path, [FakeResponse(503)] * 3, max_retries=2)
+    assert gen.query_ollama('prompt') is None
+    assert len(gen.session.urls) == 3
+    assert sleeps == [1, 2]
+
+
+def test_client_errors_are_not_retried(tmp_path, sleeps):
+    gen = generator(tmp_path, [FakeResponse(404)])
+    assert gen.query_ollama('prompt') is None
+    assert len(gen.session.urls) == 1
+    assert sleeps == []
+
+
+def test_endpoint_resolution(monkeypatch):
+    monkeypatch.delenv('OLLAMA_HOST', raising=False)
+    assert resolve_endpoint() == DEFAULT_ENDPOINT
+    monkeypatch.setenv('OLLAMA_HOST', '127.0.0.1:11434')
+    assert resolve_endpoint() == 'http://127.0.0.1:11434'
+    # --endpoint wins over the environment
+    assert resolve_endpoint('https://gpu-box:8443/') == 'https://gpu-box:8443'
+
+
+def test_requests_run_concurrently_over_one_pool(tmp_path):
+    markdown_dir = tmp_path / 'markdown'
+    markdown_dir.mkdir()
+    for n in range(3):
+        (markdown_dir / f'Page_{n}.md').write_text(f"# Page {n}\n\n" + f"Page {n} is a page about things. " * 10)
+    gen = QAGenerator(markdown_dir, tmp_path / 'qa_dataset', concurrency=3, pack_size=1)
+    assert gen.session.get_adapter('http://ollama')._pool_maxsize == 3
+    # Every request waits for the other two, so this only finishes if all three are in flight at once
+    barrier = threading.Barrier(3, timeout=10)
+
+    def query(prompt, temperature=0.7):
+        barrier.wait()
+        return json.dumps({'qa_pairs': [{'question': 'q', 'answer': 'a'}]})
+
+    gen.query_ollama = query
+    gen.generate_dataset()
+    with open(gen.output_file, newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    assert rows == [['text']] + [['question: q\nanswer: a']] * 3
@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+from rate_limiter import AdaptiveConcurrency, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_burst_then_refill():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+
+    # Tokens owed are paid back before new ones build up, and never past capacity
+    clock.now += 1.0
+    assert bucket.reserve() == pytest.approx(0.5)
+    clock.now += 60
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, 0.0, pytest.approx(0.5)]
+
+
+def test_reserve_queues_concurrent_callers():
+    bucket = TokenBucket(rate=10, capacity=1, clock=FakeClock())
+    delays = []
+    lock = threading.Lock()
+    start = threading.Barrier(8)
+
+    def worker():
+        start.wait()
+        for _ in range(5):
+            delay = bucket.reserve()
+            with lock:
+                delays.append(delay)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Each caller waits one interval longer than the one before it, so no two share a slot
+    assert sorted(delays) == pytest.approx([n / 10 for n in range(40)])
+
+
+def test_aimd_decrease_with_floor_then_additive_increase(capsys):
+    clock = FakeClock()
+    limiter = AdaptiveConcurrency(8, minimum=2, maximum=10, cooldown=2.0, clock=clock)
+    limiter.on_throttle()
+    assert limiter.limit == 4
+    # A burst of 429s within the cooldown counts once
+    limiter.on_throttle()
+    assert limiter.limit == 4
+    clock.now += 2
+    limiter.on_throttle()
+    clock.now += 2
+    limiter.on_throttle()
+    assert limiter.limit == 2
+    assert 'concurrency limit 4.0 -> 2.0' in capsys.readouterr().out
+
+    # One limit-worth of successes adds one slot
+    limiter.on_success()
+    limiter.on_success()
+    assert limiter.limit == pytest.approx(2 + 1 / 2 + 1 / 2.5)
+    for _ in range(200):
+        limiter.on_success()
+    assert limiter.limit == 10
+
+
+def test_slots_follow_the_limit():
+    limiter = AdaptiveConcurrency(4, minimum=1, clock=FakeClock())
+    assert [limiter.try_acquire() for _ in range(5)] == [True, True, True, True, False]
+    limiter.on_throttle()
+    limiter.release()
+    limiter.release()
+    # Two still in flight against a limit of two
+    assert not limiter.try_acquire()
+    limiter.release()
+    assert limiter.try_acquire()
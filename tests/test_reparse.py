@@ -0,0 +1,80 @@
+import glob
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import reparse as reparse_module
+from corpus_util import bounded_map
+from reparse import ParseCache, Reparser
+from storage import FileStorage
+from wiki_parser import parse_wiki_page
+
+FIXTURES = sorted(glob.glob('fixtures/pages/*.html'))
+
+
+def store_fixtures(output_dir):
+    storage = FileStorage(output_dir)
+    for path in FIXTURES:
+        with open(path, 'r', encoding='utf-8') as f:
+            storage.write_page(os.path.basename(path)[:-len('.html')], {'html': f.read()})
+    return storage
+
+
+def reparse(output_dir, **kwargs):
+    return Reparser(output_dir, storage='files', workers=1, **kwargs).run()
+
+
+def test_unchanged_pages_are_skipped(tmp_path):
+    output_dir = str(tmp_path)
+    storage = store_fixtures(output_dir)
+    assert reparse(output_dir) == (len(FIXTURES), 0, 0)
+    title = os.path.basename(FIXTURES[0])[:-len('.html')]
+    assert storage.read(title, 'markdown') == parse_wiki_page(storage.read(title, 'html'))
+
+    assert reparse(output_dir) == (0, len(FIXTURES), 0)
+
+    # An edited source and a deleted markdown file are both rendered again
+    storage.write_page(title, {'html': storage.read(title, 'html').replace('</p>', ' Edited.</p>', 1)})
+    os.remove(storage.path(os.path.basename(FIXTURES[1])[:-len('.html')], 'markdown'))
+    assert reparse(output_dir) == (2, len(FIXTURES) - 2, 0)
+    assert 'Edited.' in storage.read(title, 'markdown')
+
+
+def test_parser_version_bump_rerenders_that_kind(tmp_path, monkeypatch):
+    output_dir = str(tmp_path)
+    store_fixtures(output_dir)
+    reparse(output_dir)
+    monkeypatch.setitem(reparse_module.PARSER_VERSIONS, 'html', 99)
+    assert reparse(output_dir) == (len(FIXTURES), 0, 0)
+    assert reparse(output_dir) == (0, len(FIXTURES), 0)
+    assert reparse(output_dir, force=True) == (len(FIXTURES), 0, 0)
+
+
+def test_parse_cache_records_latest_render(tmp_path):
+    cache = ParseCache(str(tmp_path / 'cache.sqlite'))
+    cache.record([('A', 'html', 'h1', 1), ('A', 'wikitext', 'h2', 1)])
+    cache.record([('A', 'html', 'h3', 2)])
+    assert cache.load() == {('A', 'html'): ('h3', 2), ('A', 'wikitext'): ('h2', 1)}
+    cache.clear()
+    assert cache.load() == {}
+    cache.close()
+
+
+def test_bounded_map_keeps_window_in_flight():
+    lock = threading.Lock()
+    submitted = []
+    finished = []
+
+    def batches():
+        for n in range(20):
+            with lock:
+                # Never more than window batches submitted ahead of the results consumed
+                assert len(submitted) - len(finished) <= 3
+                submitted.append(n)
+            yield n
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for result in bounded_map(executor, lambda n: n * n, batches(), 3):
+            with lock:
+                finished.append(result)
+    assert sorted(finished) == [n * n for n in range(20)]
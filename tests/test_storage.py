@@ -0,0 +1,36 @@
+import os
+
+from storage import ShardStorage
+
+
+def write_pages(shard_dir, pages):
+    storage = ShardStorage(shard_dir, batch_size=1, dictionary_samples=1)
+    for title, text in pages.items():
+        storage.write_page(title, {'markdown': text})
+    storage.close()
+
+
+def test_roundtrip(tmp_path):
+    pages = {f"Page_{i}": f"# Page {i}\n" + "Some wiki text. " * i for i in range(20)}
+    write_pages(tmp_path, pages)
+    storage = ShardStorage(tmp_path)
+    assert dict(storage.iter_pages('markdown')) == pages
+    assert storage.read('Page_7', 'markdown') == pages['Page_7']
+    storage.close()
+
+
+def test_torn_index_line_keeps_later_entries(tmp_path):
+    write_pages(tmp_path, {'A': 'first page ' * 10, 'B': 'second page ' * 10})
+    index_file = os.path.join(tmp_path, 'index.jsonl')
+    # A crash mid-flush leaves half an entry without its newline
+    with open(index_file, 'a', encoding='utf-8') as f:
+        f.write('{"title": "C", "kind": "markdown", "sha')
+
+    write_pages(tmp_path, {'D': 'fourth page ' * 10})
+    write_pages(tmp_path, {'E': 'fifth page ' * 10})
+
+    storage = ShardStorage(tmp_path)
+    assert sorted(storage.titles('markdown')) == ['A', 'B', 'D', 'E']
+    assert storage.read('D', 'markdown') == 'fourth page ' * 10
+    assert storage.read('E', 'markdown') == 'fifth page ' * 10
+    storage.close()
@@ -0,0 +1,46 @@
+import glob
+import io
+import os
+
+import pytest
+
+from main import render_large_page, render_page
+from stream_parser import StreamingWikiConverter, stream_wiki_page
+from wiki_parser import parse_wiki_page
+
+FIXTURES = sorted(glob.glob('fixtures/pages/*.html'))
+
+
+def read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('path', FIXTURES, ids=os.path.basename)
+def test_stream_matches_tree_parser(path):
+    html = read(path)
+    writer = io.StringIO()
+    stream_wiki_page(html, writer)
+    assert writer.getvalue() == parse_wiki_page(html, 'html.parser')
+
+
+@pytest.mark.parametrize('path', FIXTURES, ids=os.path.basename)
+def test_chunk_boundaries_and_file_sources_do_not_change_output(path):
+    html = read(path)
+    expected = parse_wiki_page(html, 'html.parser')
+    # A tiny chunk size splits tags, entities and text runs across feeds
+    writer = io.StringIO()
+    StreamingWikiConverter(chunk_size=7).convert(html, writer)
+    assert writer.getvalue() == expected
+    writer = io.StringIO()
+    StreamingWikiConverter().convert(io.StringIO(html), writer)
+    assert writer.getvalue() == expected
+
+
+@pytest.mark.parametrize('path', FIXTURES, ids=os.path.basename)
+def test_large_page_path_matches_render_page(path):
+    html = read(path)
+    tree, stream = render_page(html), render_large_page(html)
+    assert stream.markdown == tree.markdown
+    # The stored div#content may order attributes differently but parses the same
+    assert parse_wiki_page(stream.html) == parse_wiki_page(tree.html)
@@ -0,0 +1,61 @@
+import io
+
+import pytest
+
+from stream_parser import stream_wiki_page
+from table_extractor import extract_tables
+from table_grid import Cell, resolve_grid
+from wiki_parser import parse_wiki_page
+
+DROP_TABLE = """<html><body><div class="mw-parser-output">
+<h2>Drops</h2>
+<table class="wikitable">
+<tr><th rowspan="2">Item</th><th colspan="2">Drop</th></tr>
+<tr><th>Quantity</th><th>Rarity</th></tr>
+<tr><td rowspan="2">Coins</td><td>50</td><td>1/4</td></tr>
+<tr><td>1,000</td><td>1/128</td></tr>
+<tr><td>Abyssal whip</td><td colspan="2">Always</td></tr>
+</table>
+</div></body></html>"""
+
+
+def cell(text, rowspan=1, colspan=1, header=False):
+    return Cell(text, header, rowspan, colspan)
+
+
+def test_resolve_grid_repeats_spans():
+    a, b, c, d = cell('a', rowspan=2), cell('b', colspan=2), cell('c'), cell('d')
+    grid = resolve_grid([[a, b], [c], [d]])
+    assert grid == [[a, b, b], [a, c, None], [d, None, None]]
+
+
+def test_resolve_grid_fills_gap_before_carried_column():
+    a, b = cell('a'), cell('b', rowspan=2)
+    grid = resolve_grid([[a, b], []])
+    assert grid == [[a, b], [None, b]]
+
+
+def test_frame_from_stacked_headers_and_spans():
+    frame = extract_tables(DROP_TABLE)[0].frame
+    assert list(frame.columns) == ['Item', 'Drop / Quantity', 'Drop / Rarity']
+    assert list(frame['Item']) == ['Coins', 'Coins', 'Abyssal whip']
+    assert list(frame['Drop / Quantity']) == [50, 1000, 1]
+    assert list(frame['Drop / Rarity']) == [0.25, 1 / 128, 1.0]
+
+
+@pytest.mark.parametrize('backend', ['lxml', 'html.parser', 'stream'])
+def test_markdown_rows_follow_the_grid(backend):
+    if backend == 'stream':
+        writer = io.StringIO()
+        stream_wiki_page(DROP_TABLE, writer)
+        markdown = writer.getvalue()
+    else:
+        markdown = parse_wiki_page(DROP_TABLE, backend)
+    rows = [line for line in markdown.split('\n') if line.startswith('|')]
+    # The stacked header row keeps blanks where the first row's rowspan covers it
+    assert rows[2:] == [
+        '|  | Quantity | Rarity |',
+        '| Coins | 50 | 1/4 |',
+        '| Coins | 1,000 | 1/128 |',
+        '| Abyssal whip | Always |  |',
+    ]
@@ -0,0 +1,29 @@
+import glob
+import os
+
+import pytest
+
+from main import render_page
+from wiki_parser import OSRSWikiParser, parse_wiki_page
+
+FIXTURES = sorted(glob.glob('fixtures/pages/*.html'))
+
+
+def read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('path', FIXTURES, ids=os.path.basename)
+def test_backends_parse_alike(path):
+    html = read(path)
+    # Both the saved page and the div#content the crawler stores
+    for source in (html, render_page(html).html):
+        parsed = OSRSWikiParser('lxml').parse_html(source)
+        assert parsed == OSRSWikiParser('html.parser').parse_html(source)
+        assert parse_wiki_page(source, 'lxml') == parse_wiki_page(source, 'html.parser')
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        OSRSWikiParser('html5lib')
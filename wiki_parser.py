@@ -1,9 +1,117 @@
 from bs4 import BeautifulSoup
 import re
 from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from table_grid import MarkdownRows, make_cell
+
+try:
+    from lxml import etree
+except ImportError:  # BeautifulSoup's html.parser is the fallback backend
+    etree = None
+
+BACKENDS = ('lxml', 'html.parser')
+
+# Bump whenever a change alters the markdown produced for some page, so reparse.py re-renders it
+PARSER_VERSION = 2
+
+# Tables whose cells are left out of column counts and headers
+SKIPPED_TABLE_CLASSES = ('navbox', 'infobox-smw-data')
+
+# BeautifulSoup's get_text() leaves out strings inside these elements
+HIDDEN_TEXT_TAGS = ('script', 'style', 'template', 'rt', 'rp')
+
+# Attributes BeautifulSoup splits into lists, which matters when rows are compared
+MULTI_VALUED_ATTRIBUTES = {'class', 'rel', 'rev', 'accept-charset', 'headers', 'accesskey', 'dropzone'}
+
+# Sections to_markdown() leaves out, compared case-insensitively
+SKIPPED_SECTIONS = ('combat stats', 'item information')
+
+# Links into these namespaces are not pages; the crawler skips the same ones in the sitemaps
+EXCLUDED_NAMESPACES = ('special:', 'file:', 'template:', 'category:', 'talk:', 'user:')
+
+_EDIT_LINK_RE = re.compile(r'\[edit.*?\]')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def element_classes(elem) -> List[str]:
+    """Class names of an lxml element."""
+    return elem.get('class', '').split()
+
+
+def element_text(elem) -> str:
+    """Text of an lxml element, matching BeautifulSoup's get_text()."""
+    if elem.tag in HIDDEN_TEXT_TAGS or next(elem.iter(*HIDDEN_TEXT_TAGS), None) is None:
+        return ''.join(elem.itertext())
+    
+    parts = []
+    def collect(node):
+        if node.text:
+            parts.append(node.text)
+        for child in node:
+            if isinstance(child.tag, str) and child.tag not in HIDDEN_TEXT_TAGS:
+                collect(child)
+            if child.tail:
+                parts.append(child.tail)
+    collect(elem)
+    return ''.join(parts)
+
+
+def _same_tree(a, b) -> bool:
+    """Structural equality of two lxml elements, as BeautifulSoup's Tag == compares them."""
+    if not isinstance(a.tag, str) or not isinstance(b.tag, str):
+        return a.tag is b.tag and a.text == b.text
+    if a.tag != b.tag or len(a) != len(b) or (a.text or '') != (b.text or ''):
+        return False
+    attrs_a = {k: v.split() if k in MULTI_VALUED_ATTRIBUTES else v for k, v in a.attrib.items()}
+    attrs_b = {k: v.split() if k in MULTI_VALUED_ATTRIBUTES else v for k, v in b.attrib.items()}
+    if attrs_a != attrs_b:
+        return False
+    return all((x.tail or '') == (y.tail or '') and _same_tree(x, y) for x, y in zip(a, b))
+
+
+def page_name(title: str) -> Optional[str]:
+    """Normalise a link target to the page name pages are stored under, or None if it is not an article."""
+    name = title.split('#', 1)[0].strip().replace(' ', '_')
+    if not name or any(namespace in name.lower() for namespace in EXCLUDED_NAMESPACES):
+        return None
+    # MediaWiki capitalises the first letter of every title
+    return name[0].upper() + name[1:]
+
+
+def link_target(href: str) -> Optional[str]:
+    """Page name an internal /w/ href points at, or None for external, namespaced and action links."""
+    parts = urlsplit(href)
+    if parts.scheme or parts.netloc or parts.query or not parts.path.startswith('/w/'):
+        return None
+    return page_name(unquote(parts.path[len('/w/'):]))
+
+
+def unique_links(hrefs) -> List[str]:
+    """Page names of the internal links among hrefs, first occurrence order."""
+    links = {}
+    for href in hrefs:
+        target = link_target(href)
+        if target:
+            links[target] = None
+    return list(links)
+
+
+def clean_cell(text: str) -> str:
+    """Remove edit links and collapse whitespace in a table cell."""
+    return _WHITESPACE_RE.sub(' ', _EDIT_LINK_RE.sub('', text))
+
 
 class OSRSWikiParser:
-    def __init__(self):
+    def __init__(self, backend: Optional[str] = None):
+        """Use the lxml backend when lxml is installed, else BeautifulSoup's html.parser."""
+        if backend is None:
+            backend = 'lxml' if etree else 'html.parser'
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown parser backend {backend!r}, expected one of {BACKENDS}")
+        if backend == 'lxml' and etree is None:
+            raise ImportError("The lxml parser backend needs the lxml package")
+        self.backend = backend
         self.infobox_stats = {}
         self.combat_stats = {}
         self.description = ""
@@ -11,6 +119,8 @@ class OSRSWikiParser:
         
     def parse_html(self, html_content: str) -> Dict:
         """Parse the HTML content of a wiki page and extract relevant information."""
+        if self.backend == 'lxml':
+            return self._parse_lxml(html_content)
         soup = BeautifulSoup(html_content, 'html.parser')
         result = {
             'title': self._get_title(soup),
@@ -18,6 +128,7 @@ class OSRSWikiParser:
             'description': self._get_description(soup),
             'sections': self._parse_sections(soup),
             'combat_stats': self._parse_combat_stats(soup),
+            'links': self._get_links(soup),
         }
         return result
     
@@ -26,6 +137,13 @@ class OSRSWikiParser:
         title_elem = soup.find('h1', class_='firstHeading')
         return title_elem.get_text().strip() if title_elem else ""
 
+    def _get_links(self, soup: BeautifulSoup) -> List[str]:
+        """Extract the pages the article content links to."""
+        content = soup.find('div', class_='mw-parser-output')
+        if not content:
+            return []
+        return unique_links(a['href'] for a in content.find_all('a', href=True))
+
     def _parse_infobox(self, soup: BeautifulSoup) -> Dict:
         """Parse the infobox information."""
         infobox = soup.find('table', class_='infobox')
@@ -86,32 +204,27 @@ class OSRSWikiParser:
                 
             if current_section and row.find_all('td', class_='infobox-nested'):
                 values = [td.get_text().strip() for td in row.find_all('td', class_='infobox-nested')]
-                if current_section == 'attack_bonuses':
-                    stats[current_section] = {
-                        'stab': values[0],
-                        'slash': values[1],
-                        'crush': values[2],
-                        'magic': values[3],
-                        'ranged': values[4]
-                    }
-                elif current_section == 'defence_bonuses':
-                    stats[current_section] = {
-                        'stab': values[0],
-                        'slash': values[1],
-                        'crush': values[2],
-                        'magic': values[3],
-                        'ranged': values[4]
-                    }
-                elif current_section == 'other_bonuses':
-                    stats[current_section] = {
-                        'strength': values[0],
-                        'ranged_strength': values[1],
-                        'magic_damage': values[2],
-                        'prayer': values[3]
-                    }
+                stats[current_section] = self._bonus_values(current_section, values)
                     
         return stats
 
+    def _bonus_values(self, section: str, values: List[str]) -> Dict:
+        """Name the values of one row of an infobox-bonuses table."""
+        if section == 'other_bonuses':
+            return {
+                'strength': values[0],
+                'ranged_strength': values[1],
+                'magic_damage': values[2],
+                'prayer': values[3]
+            }
+        return {
+            'stab': values[0],
+            'slash': values[1],
+            'crush': values[2],
+            'magic': values[3],
+            'ranged': values[4]
+        }
+
     def _parse_sections(self, soup: BeautifulSoup) -> Dict:
         """Parse all content sections."""
         sections = {}
@@ -184,10 +297,12 @@ class OSRSWikiParser:
                             text = re.sub(r'\s+', ' ', text)
                             headers.append(text)
             
-            # Second pass: collect data rows
+            # Second pass: collect data rows on the rowspan/colspan grid
+            grid = MarkdownRows()
+            first_tr = elem.find('tr')
             for tr in elem.find_all('tr'):
-                # Skip pure header rows
-                if tr.find_all('th') and tr == elem.find('tr'):
+                # Rows of nested tables belong to those tables
+                if tr.find_parent('table') is not elem:
                     continue
                 
                 cells = []
@@ -195,26 +310,19 @@ class OSRSWikiParser:
                 for cell in tr.find_all(['th', 'td']):
                     if cell.find_parent('table') != elem:
                         continue
-                        
                     # Clean up cell content
-                    content = cell.get_text().strip()
-                    # Remove edit links and other unwanted text
-                    content = re.sub(r'\[edit.*?\]', '', content)
-                    content = re.sub(r'\s+', ' ', content)
-                    
-                    # Handle colspan
-                    colspan = int(cell.get('colspan', 1))
-                    if colspan > 1:
-                        cells.extend([content] + [''] * (colspan - 1))
-                    else:
-                        cells.append(content)
+                    content = clean_cell(cell.get_text().strip())
+                    cells.append(make_cell(cell.name, content, cell.get('rowspan'), cell.get('colspan')))
                 
-                # Only add row if it has content
-                if cells and any(cell.strip() for cell in cells):
-                    # Pad cells if needed
-                    while len(cells) < max_cols:
-                        cells.append('')
-                    data_rows.append(cells)
+                # Pure header rows only place their spans; rows without content are dropped
+                row = grid.row(cells, shown=not (tr.find_all('th') and tr == first_tr))
+                if row is not None:
+                    data_rows.append(row)
+            
+            # Rowspans can push a row past the widest one counted above
+            max_cols = max(max_cols, grid.width)
+            for cells in data_rows:
+                cells.extend([''] * (max_cols - len(cells)))
             
             # If we have data but no headers, generate them
             if data_rows and not headers:
@@ -238,6 +346,192 @@ class OSRSWikiParser:
             
         return ""
 
+    def _parse_lxml(self, html_content: str) -> Dict:
+        """Extract every field from an lxml tree in a single pass over the document."""
+        result = {'title': "", 'infobox': {}, 'description': "", 'sections': {}, 'combat_stats': {}, 'links': []}
+        root = etree.HTML(html_content)
+        if root is None:  # Empty document
+            return result
+        
+        # Locate the landmarks the html.parser backend finds with separate soup.find() calls
+        title_elem = infobox = bonuses = content = None
+        for elem in root.iter('h1', 'table', 'div'):
+            classes = element_classes(elem)
+            if elem.tag == 'h1':
+                if title_elem is None and 'firstHeading' in classes:
+                    title_elem = elem
+            elif elem.tag == 'table':
+                if infobox is None and 'infobox' in classes:
+                    infobox = elem
+                if bonuses is None and 'infobox-bonuses' in classes:
+                    bonuses = elem
+            elif content is None and 'mw-parser-output' in classes:
+                content = elem
+        
+        if title_elem is not None:
+            result['title'] = element_text(title_elem).strip()
+        if infobox is not None:
+            result['infobox'] = self._infobox_lxml(infobox)
+        if content is not None:
+            result['description'], result['sections'] = self._content_lxml(content)
+            result['links'] = unique_links(a.get('href') for a in content.iter('a') if a.get('href') is not None)
+        if bonuses is not None:
+            result['combat_stats'] = self._combat_stats_lxml(bonuses)
+        return result
+
+    def _infobox_lxml(self, infobox) -> Dict:
+        """Parse the infobox table from an lxml tree."""
+        info_dict = {}
+        for row in infobox.iter('tr'):
+            header = next(row.iter('th'), None)
+            data = next(row.iter('td'), None)
+            if header is not None and data is not None:
+                key = element_text(header).strip()
+                images = list(data.iter('img'))
+                if images:
+                    value = [img.attrib['src'] for img in images]
+                else:
+                    value = element_text(data).strip()
+                info_dict[key] = value
+        return info_dict
+
+    def _combat_stats_lxml(self, stats_table) -> Dict:
+        """Parse the infobox-bonuses table from an lxml tree."""
+        stats = {
+            'attack_bonuses': {},
+            'defence_bonuses': {},
+            'other_bonuses': {}
+        }
+        
+        current_section = None
+        for row in stats_table.iter('tr'):
+            header = next((th for th in row.iter('th') if 'infobox-header' in element_classes(th)), None)
+            if header is not None:
+                text = element_text(header).strip().lower()
+                if 'attack' in text:
+                    current_section = 'attack_bonuses'
+                elif 'defence' in text:
+                    current_section = 'defence_bonuses'
+                elif 'other' in text:
+                    current_section = 'other_bonuses'
+                continue
+            
+            if current_section:
+                values = [element_text(td).strip() for td in row.iter('td') if 'infobox-nested' in element_classes(td)]
+                if values:
+                    stats[current_section] = self._bonus_values(current_section, values)
+        return stats
+
+    def _content_lxml(self, content) -> Tuple[str, Dict]:
+        """Collect the description and the h2 sections in one walk over the content children."""
+        description = ""
+        # A description paragraph must not sit inside a table
+        in_table = any(ancestor.tag == 'table' for ancestor in content.iterancestors())
+        sections = {}
+        current_section = None
+        current_content = []
+        
+        for elem in content:
+            tag = elem.tag
+            text = None
+            if tag == 'p':
+                text = element_text(elem).strip()
+                if not description and not in_table and text:
+                    description = text
+            
+            if tag == 'h2':
+                if current_section:
+                    sections[current_section] = '\n'.join(current_content)
+                current_section = element_text(elem).strip()
+                current_content = []
+            elif current_section and tag in ('p', 'ul', 'table'):
+                if tag == 'p':
+                    current_content.append(text)
+                elif tag == 'ul':
+                    current_content.append('\n'.join(f"* {element_text(li).strip()}" for li in elem.iter('li')))
+                else:
+                    current_content.append(self._table_markdown_lxml(elem))
+        
+        if current_section:
+            sections[current_section] = '\n'.join(current_content)
+        return description, sections
+
+    def _table_markdown_lxml(self, table) -> str:
+        """Convert a table to markdown from one walk over its rows, as _convert_to_markdown does."""
+        if any(c in SKIPPED_TABLE_CLASSES for c in element_classes(table)):
+            return ""
+        
+        def skipped(elem):
+            return any(c in SKIPPED_TABLE_CLASSES for c in element_classes(elem))
+        
+        # Every tr in document order with the th/td cells below it; each cell records
+        # whether it counts towards columns (no skipped table above it) and whether
+        # it belongs to this table rather than a nested one
+        rows = []
+        open_rows = []
+        counted = not any(skipped(a) for a in table.iterancestors('table'))
+        scopes = [(counted, True)]
+        for event, elem in etree.iterwalk(table, events=('start', 'end'), tag=('table', 'tr', 'th', 'td')):
+            tag = elem.tag
+            if elem is table:
+                continue
+            if tag == 'table':
+                if event == 'start':
+                    scopes.append((scopes[-1][0] and not skipped(elem), False))
+                else:
+                    scopes.pop()
+            elif tag == 'tr':
+                if event == 'start':
+                    row = (elem, [], scopes[-1][1])
+                    rows.append(row)
+                    open_rows.append(row)
+                else:
+                    open_rows.pop()
+            elif event == 'start':
+                cell = (elem, *scopes[-1])
+                for row in open_rows:
+                    row[1].append(cell)
+        
+        # First pass: column count and the first header row
+        headers = []
+        max_cols = 0
+        for tr, cells, _ in rows:
+            counted_cells = [cell for cell, counted, _ in cells if counted]
+            max_cols = max(max_cols, sum(int(cell.get('colspan', 1)) for cell in counted_cells))
+            if not headers:
+                headers = [clean_cell(element_text(cell).strip()) for cell in counted_cells if cell.tag == 'th']
+        
+        # Second pass: data rows of this table on the rowspan/colspan grid; header rows
+        # identical to the first row only place their spans
+        first_tr = rows[0][0] if rows else None
+        grid = MarkdownRows()
+        data_rows = []
+        for tr, cells, own_row in rows:
+            if not own_row:
+                continue
+            header = any(cell.tag == 'th' for cell, _, _ in cells) and (tr is first_tr or _same_tree(tr, first_tr))
+            row_cells = grid.row([make_cell(cell.tag, clean_cell(element_text(cell).strip()),
+                                            cell.get('rowspan'), cell.get('colspan'))
+                                  for cell, _, own in cells if own], shown=not header)
+            if row_cells is not None:
+                data_rows.append(row_cells)
+        
+        max_cols = max(max_cols, grid.width)
+        for row_cells in data_rows:
+            row_cells.extend([''] * (max_cols - len(row_cells)))
+        
+        if data_rows and not headers:
+            headers = [f"Column {i+1}" for i in range(max_cols)]
+        elif len(headers) < max_cols:
+            headers.extend([f"Column {i+1}" for i in range(len(headers), max_cols)])
+        
+        if headers and data_rows:
+            lines = ['| ' + ' | '.join(headers) + ' |',
+                     '|' + '|'.join(['---' for _ in range(max_cols)]) + '|']
+            lines.extend('| ' + ' | '.join(cells) + ' |' for cells in data_rows)
+            return '\n'.join(lines)
+        return ""
+
     def to_markdown(self, parsed_data: Dict) -> str:
         """Convert parsed data to markdown format."""
         md_parts = []
@@ -269,14 +563,14 @@ class OSRSWikiParser:
         
         # Other sections
         for section, content in parsed_data['sections'].items():
-            if section.lower() not in ['combat stats', 'item information']:
+            if section.lower() not in SKIPPED_SECTIONS:
                 md_parts.append(f"## {section}\n")
                 md_parts.append(content + "\n")
         
         return '\n'.join(md_parts)
 
-def parse_wiki_page(html_content: str) -> str:
+def parse_wiki_page(html_content: str, backend: Optional[str] = None) -> str:
     """Parse a wiki page and return markdown content."""
-    parser = OSRSWikiParser()
+    parser = OSRSWikiParser(backend)
     parsed_data = parser.parse_html(html_content)
     return parser.to_markdown(parsed_data) 
\ No newline at end of file
@@ -0,0 +1,379 @@
+import re
+from typing import Dict, List, Tuple
+
+from wiki_parser import OSRSWikiParser, page_name
+
+# Bump whenever a change alters the markdown produced for some page, so reparse.py re-renders it
+PARSER_VERSION = 1
+
+# Infobox parameter names mapped to the labels the rendered infobox shows
+INFOBOX_LABELS = {
+    'name': 'Name',
+    'release': 'Released',
+    'update': 'Update',
+    'members': 'Members',
+    'quest': 'Quest item',
+    'tradeable': 'Tradeable',
+    'equipable': 'Equipable',
+    'stackable': 'Stackable',
+    'noteable': 'Noteable',
+    'options': 'Options',
+    'destroy': 'Destroy',
+    'examine': 'Examine',
+    'value': 'Value',
+    'alchable': 'Alchable',
+    'highalch': 'High alch',
+    'lowalch': 'Low alch',
+    'weight': 'Weight',
+    'exchange': 'Exchange',
+    'id': 'Item ID',
+    'combat': 'Combat level',
+    'size': 'Size',
+    'hitpoints': 'Hitpoints',
+    'max hit': 'Max hit',
+    'aggressive': 'Aggressive',
+    'poisonous': 'Poisonous',
+    'attack style': 'Attack style',
+    'attack speed': 'Attack speed',
+    'slayxp': 'Slayer XP',
+    'cat': 'Slayer category',
+    'assignedby': 'Assigned by',
+    'number': 'Quest number',
+    'series': 'Quest series',
+    'difficulty': 'Official difficulty',
+    'length': 'Official length',
+    'developer': 'Developer',
+}
+
+# Infobox Bonuses parameters in the order OSRSWikiParser._parse_combat_stats emits them
+BONUS_PARAMS = {
+    'attack_bonuses': [('stab', 'astab'), ('slash', 'aslash'), ('crush', 'acrush'),
+                       ('magic', 'amagic'), ('ranged', 'arange')],
+    'defence_bonuses': [('stab', 'dstab'), ('slash', 'dslash'), ('crush', 'dcrush'),
+                        ('magic', 'dmagic'), ('ranged', 'drange')],
+    'other_bonuses': [('strength', 'str'), ('ranged_strength', 'rstr'),
+                      ('magic_damage', 'mdmg'), ('prayer', 'prayer')],
+}
+
+# Inline templates that render to plain text; everything else is dropped
+INLINE_TEMPLATES = {
+    'coins': lambda args: f"{args[0]} coins" if args else "",
+    'plink': lambda args: args[-1] if args else "",
+    'plinkp': lambda args: "",
+    'skillclickpic': lambda args: args[0] if args else "",
+    'scp': lambda args: " ".join(args[:2]) if args else "",
+    'nowrap': lambda args: args[0] if args else "",
+}
+
+
+def _scan_templates(text: str) -> List[Tuple[int, int]]:
+    """Return (start, end) spans of the top-level {{...}} templates in text."""
+    spans = []
+    depth = 0
+    start = 0
+    i = 0
+    while i < len(text) - 1:
+        pair = text[i:i + 2]
+        if pair == '{{':
+            if depth == 0:
+                start = i
+            depth += 1
+            i += 2
+        elif pair == '}}' and depth:
+            depth -= 1
+            i += 2
+            if depth == 0:
+                spans.append((start, i))
+        else:
+            i += 1
+    return spans
+
+
+def _split_params(body: str) -> List[str]:
+    """Split a template body on the pipes that are not nested in links or templates."""
+    parts = []
+    depth = 0
+    current = []
+    i = 0
+    while i < len(body):
+        pair = body[i:i + 2]
+        if pair in ('{{', '[['):
+            depth += 1
+            current.append(pair)
+            i += 2
+        elif pair in ('}}', ']]') and depth:
+            depth -= 1
+            current.append(pair)
+            i += 2
+        elif body[i] == '|' and depth == 0:
+            parts.append(''.join(current))
+            current = []
+            i += 1
+        else:
+            current.append(body[i])
+            i += 1
+    parts.append(''.join(current))
+    return parts
+
+
+def parse_template(source: str) -> Tuple[str, List[str], Dict[str, str]]:
+    """Parse '{{Name|a|key=value}}' into its name, positional and named arguments."""
+    parts = _split_params(source[2:-2])
+    name = parts[0].strip()
+    positional = []
+    named = {}
+    for part in parts[1:]:
+        key, sep, value = part.partition('=')
+        if sep and '{{' not in key and '[[' not in key:
+            named[key.strip().lower()] = value.strip()
+        else:
+            positional.append(part.strip())
+    return name, positional, named
+
+
+class WikitextParser:
+    """Parse raw MediaWiki wikitext into the dict shape OSRSWikiParser.parse_html returns."""
+
+    def parse(self, title: str, wikitext: str) -> Dict:
+        """Parse a page's wikitext."""
+        infobox, combat_stats, body = self._extract_infoboxes(wikitext)
+        lead, sections = self._split_sections(body)
+        return {
+            'title': title,
+            'infobox': infobox,
+            'description': self._get_description(lead),
+            'sections': sections,
+            'combat_stats': combat_stats,
+            'links': self._extract_links(wikitext),
+        }
+
+    def _extract_links(self, wikitext: str) -> List[str]:
+        """Page names of the [[wikilinks]] in a page, first occurrence order."""
+        links = {}
+        for target in re.findall(r'\[\[([^\[\]|]+)', wikitext):
+            name = page_name(target.lstrip(':'))
+            if name:
+                links[name] = None
+        return list(links)
+
+    def _extract_infoboxes(self, wikitext: str) -> Tuple[Dict, Dict, str]:
+        """Read Infobox templates into dicts and return the text with templates removed."""
+        infobox = {}
+        combat_stats = {}
+        pieces = []
+        last = 0
+        for start, end in _scan_templates(wikitext):
+            pieces.append(wikitext[last:start])
+            last = end
+            source = wikitext[start:end]
+            name, positional, named = parse_template(source)
+            lowered = name.lower()
+            if lowered == 'infobox bonuses':
+                if not combat_stats:
+                    combat_stats = self._parse_bonuses(named)
+            elif lowered.startswith('infobox'):
+                if not infobox:
+                    infobox = self._parse_infobox(named)
+            else:
+                # Keep inline templates in place so the markup converter can render them
+                pieces.append(source)
+        pieces.append(wikitext[last:])
+        return infobox, combat_stats, ''.join(pieces)
+
+    def _parse_infobox(self, params: Dict[str, str]) -> Dict:
+        """Turn infobox parameters into label -> text pairs."""
+        info = {}
+        for key, value in params.items():
+            if not value or key.startswith('image') or key in ('version1', 'smwname', 'gemwname'):
+                continue
+            # Versioned infoboxes number their parameters (name1, name2, ...); keep the first
+            base = re.sub(r'\d+$', '', key)
+            label = INFOBOX_LABELS.get(base, base.replace('_', ' ').capitalize())
+            if label in info:
+                continue
+            info[label] = self._to_text(value)
+        return info
+
+    def _parse_bonuses(self, params: Dict[str, str]) -> Dict:
+        """Turn Infobox Bonuses parameters into the rendered combat stats layout."""
+        stats = {}
+        for section, fields in BONUS_PARAMS.items():
+            stats[section] = {
+                stat: self._format_bonus(params.get(param, ''), percent=(param == 'mdmg'))
+                for stat, param in fields
+            }
+        return stats
+
+    def _format_bonus(self, value: str, percent: bool = False) -> str:
+        """Format a bonus the way the rendered infobox does (+82, -3, 0, +5%)."""
+        value = self._to_text(value).rstrip('%')
+        try:
+            number = float(value)
+        except ValueError:
+            return value
+        text = f"{number:g}"
+        if number > 0:
+            text = f"+{text}"
+        return text + ('%' if percent else '')
+
+    def _split_sections(self, body: str) -> Tuple[str, Dict]:
+        """Split wikitext on level-2 headings into the lead and a section dict."""
+        sections = {}
+        parts = re.split(r'^==(?!=)\s*(.*?)\s*==\s*$', body, flags=re.MULTILINE)
+        lead = parts[0]
+        for heading, content in zip(parts[1::2], parts[2::2]):
+            sections[self._to_text(heading)] = self._convert_to_markdown(content)
+        return lead, sections
+
+    def _get_description(self, lead: str) -> str:
+        """First non-empty paragraph of the lead."""
+        for block in re.split(r'\n\s*\n', lead):
+            block = block.strip()
+            if not block or block.startswith(('{|', '*', '#', ':', '[[File:', '[[Image:')):
+                continue
+            text = self._to_text(block)
+            if text:
+                return text
+        return ""
+
+    def _convert_to_markdown(self, content: str) -> str:
+        """Convert a section's paragraphs, lists and tables to markdown."""
+        blocks = []
+        lines = content.split('\n')
+        i = 0
+        paragraph = []
+
+        def flush_paragraph():
+            text = self._to_text(' '.join(paragraph))
+            if text:
+                blocks.append(text)
+            paragraph.clear()
+
+        while i < len(lines):
+            line = lines[i].strip()
+            if line.startswith('{|'):
+                flush_paragraph()
+                table = []
+                depth = 0
+                while i < len(lines):
+                    current = lines[i].strip()
+                    depth += current.startswith('{|') - current.startswith('|}')
+                    table.append(current)
+                    i += 1
+                    if depth == 0:
+                        break
+                blocks.append(self._convert_table(table))
+                continue
+            if line.startswith(('*', '#')):
+                flush_paragraph()
+                items = []
+                while i < len(lines) and lines[i].strip().startswith(('*', '#')):
+                    item = self._to_text(lines[i].strip().lstrip('*#:; '))
+                    items.append(f"* {item}")
+                    i += 1
+                blocks.append('\n'.join(items))
+                continue
+            if not line or line.startswith('==='):
+                flush_paragraph()
+                if line:
+                    blocks.append(self._to_text(line.strip('= ')))
+            else:
+                paragraph.append(line)
+            i += 1
+        flush_paragraph()
+        return '\n'.join(block for block in blocks if block)
+
+    def _convert_table(self, lines: List[str]) -> str:
+        """Convert a {| ... |} wikitable to a markdown table."""
+        if any(cls in lines[0] for cls in ('navbox', 'infobox-smw-data')):
+            return ""
+
+        rows = []
+        current = []
+        header_row = None
+        depth = 0
+        for line in lines[1:]:
+            if line.startswith('{|'):
+                depth += 1
+                continue
+            if line.startswith('|}'):
+                if depth == 0:
+                    break
+                depth -= 1
+                continue
+            if depth:
+                continue
+            if line.startswith('|-'):
+                if current:
+                    rows.append(current)
+                current = []
+                continue
+            if line.startswith('|+'):
+                continue
+            if line.startswith('!') or line.startswith('|'):
+                is_header = line.startswith('!')
+                separator = '!!' if is_header else '||'
+                for cell in line[1:].split(separator):
+                    colspan = 1
+                    # Drop cell attributes such as 'colspan="2" | text'
+                    attrs, sep, text = cell.partition('|')
+                    if sep and '[[' not in attrs and '{{' not in attrs:
+                        match = re.search(r'colspan\s*=\s*"?(\d+)', attrs)
+                        colspan = int(match.group(1)) if match else 1
+                        cell = text
+                    text = re.sub(r'\s+', ' ', self._to_text(cell))
+                    current.extend([text] + [''] * (colspan - 1))
+                if is_header and header_row is None and not rows:
+                    header_row = len(rows)
+        if current:
+            rows.append(current)
+        if not rows:
+            return ""
+
+        headers = rows.pop(0) if header_row is not None else []
+        max_cols = max([len(headers)] + [len(row) for row in rows])
+        data_rows = [row + [''] * (max_cols - len(row)) for row in rows if any(c.strip() for c in row)]
+        if not data_rows:
+            return ""
+        headers = headers + [f"Column {i+1}" for i in range(len(headers), max_cols)]
+
+        out = ['| ' + ' | '.join(headers) + ' |', '|' + '|'.join(['---' for _ in range(max_cols)]) + '|']
+        for cells in data_rows:
+            out.append('| ' + ' | '.join(cells) + ' |')
+        return '\n'.join(out)
+
+    def _render_templates(self, text: str) -> str:
+        """Render known inline templates and drop the rest."""
+        pieces = []
+        last = 0
+        for start, end in _scan_templates(text):
+            pieces.append(text[last:start])
+            last = end
+            name, positional, _ = parse_template(text[start:end])
+            render = INLINE_TEMPLATES.get(name.strip().lower())
+            if render:
+                pieces.append(render([self._render_templates(arg) for arg in positional]))
+        pieces.append(text[last:])
+        return ''.join(pieces)
+
+    def _to_text(self, markup: str) -> str:
+        """Reduce inline wikitext markup to the plain text a reader sees."""
+        text = self._render_templates(markup)
+        text = re.sub(r'<ref[^>/]*/>', '', text)
+        text = re.sub(r'<ref[^>]*>.*?</ref>', '', text, flags=re.DOTALL)
+        text = re.sub(r'<!--.*?-->', '', text, flags=re.DOTALL)
+        text = re.sub(r'<br\s*/?>', ' ', text)
+        text = re.sub(r'<[^>]+>', '', text)
+        text = re.sub(r'\[\[(?:File|Image|Category):[^\[\]]*(?:\[\[[^\]]*\]\][^\[\]]*)*\]\]', '', text)
+        text = re.sub(r'\[\[[^\]|]*\|([^\]]*)\]\]', r'\1', text)
+        text = re.sub(r'\[\[([^\]]*)\]\]', r'\1', text)
+        text = re.sub(r'\[https?://\S+\s+([^\]]*)\]', r'\1', text)
+        text = re.sub(r"'{2,}", '', text)
+        text = text.replace('&nbsp;', ' ')
+        return re.sub(r'[ \t]+', ' ', text).strip()
+
+
+def parse_wikitext(title: str, wikitext: str) -> str:
+    """Parse a page's wikitext and return markdown content."""
+    parsed_data = WikitextParser().parse(title, wikitext)
+    return OSRSWikiParser().to_markdown(parsed_data)